@@ -3,6 +3,25 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Читающие страницы (лендинг, расписание, «Мои дети», «Мой абонемент») под
+ASGI обслуживаются асинхронными видами core.async_views; ASYNC_VIEWS=0
+возвращает синхронные. Запуск:
+
+    pip install "uvicorn[standard]"
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8000 --workers 2
+
+или
+
+    pip install daphne
+    daphne -b 0.0.0.0 -p 8000 config.asgi:application
+
+Статику, как и под WSGI, отдаёт веб-сервер (collectstatic → STATIC_ROOT).
+Постоянные соединения с базой под ASGI выключены (DB_CONN_MAX_AGE=0):
+соединение Django привязано к потоку/контексту, и под ASGI каждое
+соединение живёт до таймаута в своём контексте вместо повторного
+использования — они накапливаются.
+Сравнение с WSGI на тех же страницах: python manage.py bench_asgi.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +31,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -0,0 +1,18 @@
+"""URL-схема для ASGI: читающие страницы заменены асинхронными видами.
+
+Пути и имена совпадают с config.urls, поэтому reverse() и шаблоны
+работают одинаково; остальные страницы берутся из config.urls.
+"""
+from django.urls import path
+
+from core import async_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('', async_views.home, name='home'),
+    path('schedule/month/', async_views.schedule_month, name='schedule_month'),
+    path('my/schedule/', async_views.my_schedule, name='my_schedule'),
+    path('my/children/', async_views.my_children, name='my_children'),
+    path('my/subscription/', async_views.my_subscription, name='my_subscription'),
+] + sync_urlpatterns
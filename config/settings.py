@@ -24,12 +24,16 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RolesMiddleware',
     'core.middleware.ForcePasswordChangeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+# Под ASGI (config.asgi выставляет ASYNC_VIEWS=1) читающие страницы
+# обслуживают асинхронные виды из core.async_views.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '0') == '1'
+ROOT_URLCONF = 'config.asgi_urls' if ASYNC_VIEWS else 'config.urls'
 
 TEMPLATES = [
     {
@@ -51,13 +55,53 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# SQLite под несколько воркеров: WAL (читатели не блокируют писателя),
+# ожидание блокировки вместо мгновенного "database is locked" и
+# BEGIN IMMEDIATE, чтобы транзакция брала блокировку на запись сразу,
+# а не повышала её посреди транзакции (там SQLite ошибается без ожидания).
+SQLITE_TIMEOUT = int(os.getenv('SQLITE_TIMEOUT', '20'))
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', '20000')),  # отрицательное — в КиБ
+    'busy_timeout': SQLITE_TIMEOUT * 1000,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # под WSGI соединение переиспользуется запросами своего потока; config.asgi
+        # выставляет 0 — под ASGI постоянные соединения копятся по контекстам
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_TIMEOUT,
+        },
     }
 }
 
+# Общий для всех воркеров кеш: роли (core.roles) и дни рождения
+# (core.birthdays) сбрасываются сигналами в том воркере, где изменились
+# данные, а читаются во всех. В памяти процесса (LocMemCache) остальные
+# воркеры видели бы старые роли до истечения таймаута. По умолчанию —
+# файлы на диске (один сервер, как и SQLite); REDIS_URL включает Redis.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / 'var' / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000'))},
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
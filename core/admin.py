@@ -1,11 +1,20 @@
+from django import forms
 from django.contrib import admin
-from .models import Child, SubscriptionType, Subscription, TrainingSession
+
+from . import search
+from .models import Child, LedgerEntry, Payment, SubscriptionType, Subscription, TrainingSession
 
 @admin.register(Child)
 class ChildAdmin(admin.ModelAdmin):
     list_display = ("first_name", "last_name", "parent", "get_gender_display")  # <-- показываем человекочитаемо
     search_fields = ("first_name", "last_name", "parent__username", "parent__email")
 
+    def get_search_results(self, request, queryset, search_term):
+        # полнотекстовый индекс вместо LIKE-сканов по search_fields
+        if search_term and search.is_available():
+            return search.filter_children(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
 @admin.register(SubscriptionType)
 class SubscriptionTypeAdmin(admin.ModelAdmin):
     list_display = ("name", "lessons_count", "price")
@@ -14,7 +23,42 @@ class SubscriptionTypeAdmin(admin.ModelAdmin):
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ("child", "sub_type", "lessons_remaining", "paid")
 
+class TrainingSessionAdminForm(forms.ModelForm):
+    class Meta:
+        model = TrainingSession
+        fields = "__all__"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        capacity = cleaned_data.get("capacity")
+        participants = cleaned_data.get("participants")
+        # иначе места проверит сигнал m2m, и SessionFull дойдёт до пользователя как 500
+        if capacity is not None and participants is not None and len(participants) > capacity:
+            self.add_error("participants", f"Участников больше, чем мест ({capacity})")
+        return cleaned_data
+
 @admin.register(TrainingSession)
 class TrainingSessionAdmin(admin.ModelAdmin):
-    list_display = ("start", "duration_minutes")
-    filter_horizontal = ("participants",)
\ No newline at end of file
+    form = TrainingSessionAdminForm
+    list_display = ("start", "duration_minutes", "participant_count", "capacity")
+    filter_horizontal = ("participants",)
+
+    def save_model(self, request, obj, form, change):
+        # при уменьшении мест сначала убираем лишних участников: иначе сработает ограничение в БД
+        if change and obj.capacity is not None and "capacity" in form.changed_data:
+            form.save_m2m()
+        super().save_model(request, obj, form, change)
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "subscription", "kind", "delta", "session")
+    list_filter = ("kind",)
+    list_select_related = ("subscription__child", "subscription__sub_type", "session")
+    raw_id_fields = ("subscription", "session")
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "subscription", "sub_type", "amount")
+    list_filter = ("sub_type",)
+    list_select_related = ("subscription__child", "sub_type")
+    raw_id_fields = ("subscription",)
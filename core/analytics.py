@@ -0,0 +1,171 @@
+"""Сводки посещаемости: заполненность слотов и занятия учеников по месяцам.
+
+SlotOccupancy хранит на каждый локальный (день, час начала) число занятий и
+записей участников, ChildMonthAttendance — число занятий ученика за месяц.
+Строки меняются на разницу при каждом изменении расписания:
+
+* создание, перенос и удаление занятия — сигналы TrainingSession;
+* изменение участников — m2m_changed (core.signals);
+* массовые операции серий (bulk_create/DELETE без сигналов) — явно из core.series.
+
+Страница аналитики читает только эти таблицы: сезон — несколько сотен строк
+вместо соединений по таблице участников, а таблица учеников листается
+keyset-курсором, так что за страницу читается не больше
+страница × месяцев строк. rebuild() пересобирает сводки с нуля.
+"""
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .calendars import add_months
+from .models import Child, ChildMonthAttendance, SlotOccupancy, TrainingSession
+from .paging import paginate_keyset
+
+CHILDREN_ORDERING = ('first_name', 'last_name', 'id')
+
+Participants = TrainingSession.participants.through
+
+
+def slot_key(start):
+    local = timezone.localtime(start)
+    return local.date(), local.time()
+
+
+def month_key(start):
+    return timezone.localdate(start).replace(day=1)
+
+
+def _bump(model, key_fields, value_fields, deltas):
+    """Прибавляет deltas {ключ: (изменения value_fields)} к строкам model.
+
+    Не больше четырёх запросов на любой объём: чтение затронутых строк,
+    bulk_update, bulk_create и удаление обнулившихся строк. Вызывается в
+    транзакции apply().
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    lookups = {f'{field}__in': {key[i] for key in deltas} for i, field in enumerate(key_fields)}
+    rows = model.objects.select_for_update().filter(**lookups).order_by()
+    existing = {tuple(getattr(row, field) for field in key_fields): row for row in rows}
+    changed, created, empty = [], [], []
+    for key, delta in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            row = model(**dict(zip(key_fields, key)))
+        for field, value in zip(value_fields, delta):
+            setattr(row, field, max(0, getattr(row, field) + value))
+        if not any(getattr(row, field) for field in value_fields):
+            if row.pk:
+                empty.append(row.pk)
+        elif row.pk:
+            changed.append(row)
+        else:
+            created.append(row)
+    if changed:
+        model.objects.bulk_update(changed, value_fields)
+    if created:
+        model.objects.bulk_create(created)
+    if empty:
+        model.objects.filter(pk__in=empty).delete()
+
+
+@transaction.atomic
+def apply(sessions=(), links=(), sign=1):
+    """Добавляет (sign=1) или вычитает (sign=-1) занятия и записи участников.
+
+    sessions — начала занятий, links — пары (начало занятия, id ученика).
+    """
+    slots = defaultdict(lambda: [0, 0])
+    months = Counter()
+    for start in sessions:
+        slots[slot_key(start)][0] += sign
+    for start, child_id in links:
+        slots[slot_key(start)][1] += sign
+        months[(child_id, month_key(start))] += sign
+    _bump(SlotOccupancy, ('day', 'start_time'), ('sessions', 'participants'),
+          {key: tuple(delta) for key, delta in slots.items()})
+    _bump(ChildMonthAttendance, ('child_id', 'month'), ('sessions',),
+          {key: (delta,) for key, delta in months.items()})
+
+
+def move_session(old_start, new_start, child_ids):
+    """Перенос занятия: переносит его и участников в новый слот и месяц."""
+    if slot_key(old_start) == slot_key(new_start):
+        return
+    child_ids = list(child_ids)
+    apply([old_start], [(old_start, c) for c in child_ids], sign=-1)
+    apply([new_start], [(new_start, c) for c in child_ids])
+
+
+@transaction.atomic
+def rebuild():
+    """Пересобирает обе сводки из занятий и таблицы участников."""
+    SlotOccupancy.objects.all().delete()
+    ChildMonthAttendance.objects.all().delete()
+    starts = TrainingSession.objects.order_by().values_list('start', flat=True).iterator(chunk_size=2000)
+    links = (Participants.objects.order_by()
+             .values_list('trainingsession__start', 'child_id').iterator(chunk_size=2000))
+    apply(starts, links)
+    return SlotOccupancy.objects.count(), ChildMonthAttendance.objects.count()
+
+
+# --- чтение для страницы аналитики ---
+
+def occupancy_heatmap(date_from, date_to):
+    """Средняя заполненность по дню недели и часу начала за [date_from, date_to].
+
+    Возвращает строки (time, [ячейка на Пн..Вс]), ячейка — dict(sessions,
+    participants, average, heat) или None; heat — доля от самого
+    заполненного слота (0..1) для подсветки.
+    """
+    cells = defaultdict(lambda: [0, 0])
+    for day, start_time, sessions, participants in (SlotOccupancy.objects
+                                                    .filter(day__gte=date_from, day__lte=date_to)
+                                                    .values_list('day', 'start_time', 'sessions', 'participants')):
+        cell = cells[(start_time, day.weekday())]
+        cell[0] += sessions
+        cell[1] += participants
+    times = sorted({start_time for start_time, _ in cells})
+    busiest = max((p / n for n, p in cells.values() if n), default=0) or 1
+    rows = []
+    for start_time in times:
+        row = []
+        for weekday in range(7):
+            value = cells.get((start_time, weekday))
+            if value is None or not value[0]:
+                row.append(None)
+            else:
+                row.append({'sessions': value[0], 'participants': value[1],
+                            'average': round(value[1] / value[0], 1),
+                            'heat': round(value[1] / value[0] / busiest, 2)})
+        rows.append((start_time, row))
+    return rows
+
+
+def children_by_month(date_from, date_to, per_page, after=None, before=None):
+    """Занятия учеников по месяцам периода, страница из per_page учеников.
+
+    Возвращает (months, rows, page): rows — (child, [число по месяцам], итого),
+    page — KeysetPage учеников с курсорами соседних страниц. Два запроса:
+    ученики страницы (у кого есть записи за период) и их строки сводки.
+    """
+    first_month = date_from.replace(day=1)
+    records = ChildMonthAttendance.objects.filter(month__gte=first_month, month__lte=date_to)
+    children = (Child.objects
+                .filter(Exists(records.filter(child_id=OuterRef('pk'))))
+                .only('id', 'first_name', 'last_name'))
+    page = paginate_keyset(children, CHILDREN_ORDERING, per_page, after=after, before=before)
+    months = []
+    month = first_month
+    while month <= date_to:
+        months.append(month)
+        month = add_months(month, 1)
+    index = {month: i for i, month in enumerate(months)}
+    counts = {child.id: [0] * len(months) for child in page}
+    if counts:
+        for child_id, month, sessions in (records.filter(child_id__in=counts)
+                                          .values_list('child_id', 'month', 'sessions')):
+            counts[child_id][index[month]] += sessions
+    return months, [(child, counts[child.id], sum(counts[child.id])) for child in page], page
@@ -0,0 +1,214 @@
+"""JSON API (только чтение) для мобильного приложения и интеграций: /api/v1/.
+
+Эндпоинты:
+
+    sessions/      занятия за локальные дни ?from=ГГГГ-ММ-ДД&to=ГГГГ-ММ-ДД
+                   (по умолчанию — текущий месяц, не больше MAX_RANGE_DAYS)
+    children/      ученики со своими абонементами: родителю — его дети,
+                   взрослому ученику — он сам, админу — все
+    subscription/  абонемент взрослого ученика
+
+Доступ — по сессии, как у страниц; без входа ответ 401, а не редирект.
+
+Строки читаются через values() и сразу уходят в JSON, модели не
+создаются. ?fields=id,start выбирает поля (по умолчанию — все); поля
+сортировки читаются всегда, потому что из них строится курсор. Списки
+листаются keyset-курсорами core.paging (?after= / ?before=, ответ
+содержит next и prev); повреждённый курсор — ошибка 400.
+
+Ответ стоит постоянного числа запросов: версия данных (core.versions) и
+одна выборка страницы. ETag строится из версии и параметров запроса,
+поэтому повторный запрос с If-None-Match получает 304 без выборки
+страницы. Ответы сжимаются gzip, если клиент его принимает.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.gzip import gzip_page
+
+from . import versions
+from .calendars import MAX_RANGE_DAYS, month_range, parse_date
+from .models import Child, Subscription, TrainingSession
+from .paging import InvalidCursor, paginate_keyset
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+# имя поля в ответе → путь в ORM
+SESSION_FIELDS = {
+    'id': 'id',
+    'start': 'start',
+    'end': 'end',
+    'duration_minutes': 'duration_minutes',
+    'capacity': 'capacity',
+    'participant_count': 'participant_count',
+    'notes': 'notes',
+}
+CHILD_FIELDS = {
+    'id': 'id',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'birth_date': 'birth_date',
+    'is_adult': 'is_adult',
+    'subscription_type': 'subscription__sub_type__name',
+    'lessons_total': 'subscription__sub_type__lessons_count',
+    'lessons_remaining': 'subscription__lessons_remaining',
+    'paid': 'subscription__paid',
+}
+SUBSCRIPTION_FIELDS = {
+    'id': 'id',
+    'subscription_type': 'sub_type__name',
+    'lessons_total': 'sub_type__lessons_count',
+    'lessons_remaining': 'lessons_remaining',
+    'paid': 'paid',
+    'updated_at': 'updated_at',
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def api_view(view):
+    """GET-эндпоинт API: 401 без входа, ApiError → JSON с ошибкой, gzip."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return _error('Метод не поддерживается', 405)
+        if not request.user.is_authenticated:
+            return _error('Требуется вход', 401)
+        try:
+            response = view(request, *args, **kwargs)
+        except ApiError as exc:
+            return _error(exc.message, exc.status)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return gzip_page(wrapper)
+
+
+def parse_fields(request, spec, ordering=()):
+    """Запрошенные поля (?fields=a,b) и поля для выборки (запрошенные + сортировка)."""
+    raw = request.GET.get('fields')
+    if not raw:
+        requested = list(spec)
+    else:
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in spec]
+        if unknown or not requested:
+            raise ApiError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(spec)}')
+    selected = list(dict.fromkeys([*requested, *ordering]))
+    return requested, selected
+
+
+def select(queryset, spec, names):
+    """queryset.values() с полями names; вложенные пути выбираются под именами из spec."""
+    plain = [name for name in names if spec[name] == name]
+    paths = {name: F(spec[name]) for name in names if spec[name] != name}
+    return queryset.values(*plain, **paths)
+
+
+def _trim(rows, requested, selected):
+    if len(requested) == len(selected):
+        return list(rows)
+    return [{name: row[name] for name in requested} for row in rows]
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def conditional_json(request, version, build):
+    """JSON-ответ build() с ETag от version; 304, если клиент уже видел эту версию."""
+    digest = hashlib.md5(f'{version}|{request.user.pk}|{request.GET.urlencode()}'.encode()).hexdigest()
+    etag = quote_etag(digest)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build(), json_dumps_params=JSON_PARAMS)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _paged(request, queryset, spec, ordering):
+    requested, selected = parse_fields(request, spec, ordering)
+    try:
+        page = paginate_keyset(select(queryset, spec, selected), ordering, _page_size(request),
+                               after=request.GET.get('after'), before=request.GET.get('before'), strict=True)
+    except InvalidCursor:
+        raise ApiError('Неверный курсор: передавайте next или prev из предыдущего ответа без изменений')
+    return {
+        'results': _trim(page, requested, selected),
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    }
+
+
+@api_view
+def sessions(request):
+    today = timezone.localdate()
+    default_from, default_to = month_range(today.year, today.month)
+    date_from = parse_date(request.GET.get('from'), default_from)
+    date_to = parse_date(request.GET.get('to'), default_to if 'from' not in request.GET else date_from)
+    if date_to < date_from:
+        date_from, date_to = date_to, date_from
+    date_to = min(date_to, date_from + timedelta(days=MAX_RANGE_DAYS - 1))
+
+    # поля проверяются до ETag: ошибочный запрос не должен получать 304
+    parse_fields(request, SESSION_FIELDS)
+    queryset = TrainingSession.objects.in_local_range(date_from, date_to)
+    version = f'{date_from}|{date_to}|{versions.sessions_version(date_from, date_to)}'
+    return conditional_json(request, version, lambda: {
+        'from': date_from,
+        'to': date_to,
+        **_paged(request, queryset, SESSION_FIELDS, ('start', 'id')),
+    })
+
+
+def _visible_children(request):
+    if request.roles.is_admin:
+        return Child.objects.all()
+    if not (request.roles.is_parent or request.roles.is_student):
+        raise ApiError('Нет доступа', 403)
+    return versions.own_children(request.user, request.roles)
+
+
+@api_view
+def children(request):
+    parse_fields(request, CHILD_FIELDS)
+    queryset = _visible_children(request)
+    subscriptions = Subscription.objects.filter(child__in=queryset.values('id'))
+    version = f'{versions.children_version(queryset)}|{versions.subscriptions_version(subscriptions)}'
+    return conditional_json(request, version, lambda: _paged(request, queryset, CHILD_FIELDS, ('id',)))
+
+
+@api_view
+def subscription(request):
+    if not request.roles.is_student:
+        raise ApiError('Нет доступа', 403)
+    requested, selected = parse_fields(request, SUBSCRIPTION_FIELDS)
+    queryset = Subscription.objects.filter(child__account_user=request.user)
+
+    def build():
+        row = select(queryset, SUBSCRIPTION_FIELDS, selected).first()
+        if row is None:
+            raise ApiError('Абонемент не оформлен', 404)
+        return row
+    return conditional_json(request, versions.subscriptions_version(queryset), build)
@@ -0,0 +1,153 @@
+"""Асинхронные версии читающих страниц: лендинг и разделы родителя и ученика.
+
+Под ASGI (config.asgi) эти виды подключаются вместо одноимённых из
+core.views через config.asgi_urls. Данные читаются через async ORM
+(`async for`, aget, aaggregate), пользователь — через request.auser();
+пока запрос ждёт базу, цикл событий обслуживает другие запросы.
+
+Шаблоны рендерятся в цикле событий, поэтому всё, что в них используется,
+загружается в виде заранее: ленивый queryset или незагруженная связь в
+контексте вызовут SynchronousOnlyOperation. request.user и request.roles
+загружает асинхронная ветка core.middleware.RolesMiddleware.
+"""
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import HttpResponseForbidden
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ical, versions
+from .calendars import COUNT, DETAIL, abuild_calendar, month_range, neighbour_months, parse_month
+from .models import Child, Subscription, TrainingSession
+from .paging import apaginate_keyset
+from .roles import aget_roles
+from .versions import aconditional_page
+from .views import MY_SCHEDULE_HISTORY_WEEKS, MY_SCHEDULE_PAGE_SIZE, my_schedule_window
+
+
+async def is_parent(user):
+    return (await aget_roles(user)).is_parent
+
+
+async def is_student(user):
+    return (await aget_roles(user)).is_student
+
+
+async def _student_profile(user, *related):
+    children = Child.objects.select_related(*related) if related else Child.objects
+    try:
+        return await children.aget(account_user=user)
+    except Child.DoesNotExist:
+        return None
+
+
+async def _month_calendar(request, template, mode, **extra):
+    today = timezone.localdate()
+    year, month = parse_month(request.GET, today)
+    cal = await abuild_calendar(*month_range(year, month), mode=mode)
+    return render(request, template, {
+        'days': cal.days,
+        'month': month,
+        'year': year,
+        **neighbour_months(year, month),
+        'slots_by_day': cal.slots_by_day,
+        'weeks': cal.weeks,
+        **extra,
+    })
+
+
+@aconditional_page(versions.alanding_version)
+async def home(request):
+    """Публичная главная страница (см. core.views.home)."""
+    if request.user.is_authenticated:
+        if request.roles.is_admin:
+            return redirect('admin_dashboard')
+        return redirect('my_schedule')
+    return await _month_calendar(request, 'landing.html', COUNT)
+
+
+@login_required
+@aconditional_page(versions.aschedule_month_version)
+async def schedule_month(request):
+    """Календарь на месяц для родителей и взрослых учеников (см. core.views.schedule_month)."""
+    if request.roles.is_admin:
+        return redirect('sessions_month')
+    return await _month_calendar(request, 'parent/schedule_month.html', DETAIL, today=timezone.localdate())
+
+
+@login_required
+@aconditional_page(versions.amy_schedule_version)
+async def my_schedule(request):
+    """Занятия своих детей или взрослого ученика (см. core.views.my_schedule)."""
+    if request.roles.is_admin:
+        return redirect('admin_dashboard')
+
+    user = request.user
+    if request.roles.is_parent:
+        children_ids = [pk async for pk in user.children.values_list('id', flat=True)]
+        show_children = True
+    else:
+        student = await _student_profile(user)
+        if not student:
+            return HttpResponseForbidden('Нет доступа.')
+        children_ids = [student.id]
+        show_children = False
+
+    attended = TrainingSession.participants.through.objects.filter(
+        trainingsession=OuterRef('pk'), child_id__in=children_ids,
+    )
+    sessions = (TrainingSession.objects
+                .filter(Exists(attended))
+                .prefetch_related(Prefetch(
+                    'participants',
+                    queryset=Child.objects.filter(id__in=children_ids).only('id', 'first_name', 'parent_id'),
+                    to_attr='own_children',
+                )))
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    window_start, window_cursor = my_schedule_window(after, before)
+    if window_start is not None:
+        sessions = sessions.filter(start__gte=window_start)
+    page = await apaginate_keyset(sessions, ('start', 'id'), MY_SCHEDULE_PAGE_SIZE, after=after, before=before)
+    if window_cursor is not None:
+        page.prev_cursor = window_cursor
+
+    return render(request, 'parent/my_schedule.html', {
+        'sessions': page,
+        'page': page,
+        'history_weeks': MY_SCHEDULE_HISTORY_WEEKS,
+        'in_window': window_start is not None,
+        'show_children': show_children,
+        'ical_url': request.build_absolute_uri(reverse('ical_feed', args=[user.pk, ical.feed_token(user)])),
+    })
+
+
+@login_required
+@user_passes_test(is_student)
+async def my_subscription(request):
+    """Абонемент взрослого ученика (см. core.views.my_subscription)."""
+    student = await _student_profile(request.user, 'subscription__sub_type')
+    if not student:
+        return HttpResponseForbidden('Нет доступа.')
+    try:
+        subscription = student.subscription
+    except Subscription.DoesNotExist:
+        subscription = None
+    return render(request, 'student/my_subscription.html', {
+        'student': student,
+        'subscription': subscription,
+    })
+
+
+@login_required
+@user_passes_test(is_parent)
+@aconditional_page(versions.amy_children_version)
+async def my_children(request):
+    """Дети родителя и их абонементы (см. core.views.my_children)."""
+    children = [child async for child in Child.objects.filter(parent=request.user)]
+    subs = {
+        s.child_id: s
+        async for s in Subscription.objects.filter(child__parent=request.user).select_related('sub_type')
+    }
+    return render(request, 'parent/my_children.html', {'children': children, 'subs': subs})
@@ -0,0 +1,97 @@
+"""Отметка посещений сразу для всей группы занятия."""
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import LedgerEntry, Subscription
+
+MARKED = 'marked'
+EXHAUSTED = 'exhausted'
+NO_LESSONS = 'no_lessons'
+NO_SUBSCRIPTION = 'no_subscription'
+ALREADY_MARKED = 'already_marked'
+
+STATUS_LABELS = {
+    MARKED: 'Посещение зачтено',
+    EXHAUSTED: 'Зачтено, занятия закончились',
+    NO_LESSONS: 'Нет оставшихся занятий',
+    NO_SUBSCRIPTION: 'Нет абонемента',
+    ALREADY_MARKED: 'Посещение уже зачтено',
+}
+
+
+class AttendanceResult:
+    __slots__ = ('child', 'status', 'lessons_remaining')
+
+    def __init__(self, child, status, lessons_remaining=None):
+        self.child = child
+        self.status = status
+        self.lessons_remaining = lessons_remaining
+
+    @property
+    def ok(self):
+        return self.status in (MARKED, EXHAUSTED)
+
+    @property
+    def label(self):
+        return STATUS_LABELS[self.status]
+
+
+@transaction.atomic
+def mark_attendance(session, child_ids):
+    """Списывает по занятию у присутствовавших участников session.
+
+    Остатки уменьшаются одним условным UPDATE (lessons_remaining > 0);
+    у кого остаток дошёл до нуля, в том же UPDATE снимается paid.
+    Посещения записываются в журнал одним bulk_create. Ученики, у которых
+    посещение этого занятия уже есть в журнале, пропускаются: повторная
+    отметка не списывает занятие второй раз.
+    Возвращает список AttendanceResult в порядке имён.
+    """
+    children = list(session.participants.filter(id__in=child_ids).only('id', 'first_name', 'last_name'))
+    ids = [c.id for c in children]
+    before = {}
+    subscription_ids = {}
+    rows = (Subscription.objects
+            .select_for_update()
+            .filter(child_id__in=ids)
+            .values_list('child_id', 'id', 'lessons_remaining'))
+    for child_id, subscription_id, remaining in rows:
+        before[child_id] = remaining
+        subscription_ids[child_id] = subscription_id
+    # под select_for_update выше: параллельная отметка ждёт и видит уже записанные посещения
+    visited = set(LedgerEntry.objects
+                  .filter(kind=LedgerEntry.VISIT, session=session, subscription_id__in=subscription_ids.values())
+                  .values_list('subscription_id', flat=True))
+    already = {child_id for child_id, subscription_id in subscription_ids.items() if subscription_id in visited}
+    eligible = [child_id for child_id, remaining in before.items() if remaining > 0 and child_id not in already]
+    if eligible:
+        # CASE видит значение до вычитания: 1 → станет 0 → абонемент не оплачен
+        Subscription.objects.filter(child_id__in=eligible, lessons_remaining__gt=0).update(
+            lessons_remaining=F('lessons_remaining') - 1,
+            paid=Case(When(lessons_remaining=1, then=Value(False)), default=F('paid')),
+            updated_at=timezone.now(),
+        )
+        after = dict(Subscription.objects
+                     .filter(child_id__in=eligible)
+                     .values_list('child_id', 'lessons_remaining'))
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(subscription_id=subscription_ids[child_id], session=session,
+                        kind=LedgerEntry.VISIT, delta=-1)
+            for child_id in eligible
+        ])
+    else:
+        after = {}
+
+    results = []
+    for child in children:
+        if child.id not in before:
+            results.append(AttendanceResult(child, NO_SUBSCRIPTION))
+        elif child.id in already:
+            results.append(AttendanceResult(child, ALREADY_MARKED, before[child.id]))
+        elif child.id not in after:
+            results.append(AttendanceResult(child, NO_LESSONS, before[child.id]))
+        else:
+            remaining = after[child.id]
+            results.append(AttendanceResult(child, EXHAUSTED if remaining == 0 else MARKED, remaining))
+    return results
@@ -0,0 +1,348 @@
+"""Вспомогательные функции для management-команд bench_* и seed_bench.
+
+Бенчмарки работают на отдельной тестовой базе (как при запуске тестов),
+чтобы не трогать рабочие данные.
+
+seed() заполняет базу объёмами, близкими к рабочим: ученики, родители,
+взрослые ученики, занятия с участниками и год оплат. Всё вставляется
+bulk_create пачками; bulk_create не вызывает save() и сигналы, поэтому
+participant_count, birthday_key, сводки аналитики и выручки и поисковый
+индекс заполняются здесь же явно.
+
+measure_views() обходит все URL из core.urls под каждой ролью и меряет
+число запросов, время SQL и полное время ответа; check_budgets() сверяет
+замеры с бюджетом из BUDGETS_PATH (команда bench_views и BenchBudgetTests).
+Бюджет числа запросов снимается с замеров (он не зависит от объёма данных),
+а бюджет времени — целевое время ответа (TARGET_MS), а не текущий замер:
+медленная страница должна проваливать проверку, а не поднимать планку.
+"""
+import json
+import logging
+import random
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, ical, revenue, search, urls
+from .birthdays import invalidate_birthdays
+from .models import (
+    Child, LedgerEntry, Payment, Subscription, SubscriptionType, TrainingSession, birthday_key,
+)
+
+
+@contextmanager
+def throwaway_database(name=None, verbosity=0):
+    """Создаёт тестовую базу с миграциями и удаляет её после выхода.
+
+    name — путь к файлу SQLite; по умолчанию база создаётся в памяти.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if name is not None:
+        test_settings['NAME'] = str(name)
+    old_name = connection.settings_dict['NAME']
+    try:
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+    finally:
+        test_settings['NAME'] = old_test_name
+
+
+def explain(queryset):
+    """План запроса SQLite (EXPLAIN QUERY PLAN) для queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def timed(func, repeat=1):
+    """Лучшее время (в миллисекундах) из repeat запусков func."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# --- данные для бенчмарков ---
+
+SEED_CHILDREN = 10_000
+SEED_PARENTS = 2_000
+SEED_SESSIONS = 100_000
+# доля взрослых учеников (со своим аккаунтом) среди учеников
+ADULT_SHARE = 0.1
+SESSIONS_PER_DAY = 40
+FUTURE_DAYS = 60
+PAYMENT_MONTHS = 12
+BATCH_SIZE = 5000
+SEED_PASSWORD = 'bench'
+
+BENCH_ADMIN = 'bench_admin'
+BENCH_PARENT = 'bench_parent{}'
+BENCH_STUDENT = 'bench_student{}'
+
+_START_TIMES = [(hour, minute) for hour in range(9, 21) for minute in (0, 30)]
+_CAPACITIES = (None, 8, 10, 12)
+_SUB_TYPES = (('Разовый', 4, 60), ('Стандарт', 8, 100), ('Безлимит', 12, 140))
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def seed(children=SEED_CHILDREN, parents=SEED_PARENTS, sessions=SEED_SESSIONS, random_seed=1, log=None):
+    """Заполняет пустую базу данными для бенчмарков; log(str) — вывод прогресса.
+
+    Занятия идут по SESSIONS_PER_DAY в день и заканчиваются через
+    FUTURE_DAYS дней от сегодняшнего, так что глубина истории растёт с их
+    числом. Аккаунты: BENCH_ADMIN, BENCH_PARENT.format(i), BENCH_STUDENT.format(i),
+    пароль SEED_PASSWORD.
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(random_seed)
+    today = timezone.localdate()
+    password = make_password(SEED_PASSWORD)
+    adults = int(children * ADULT_SHARE)
+
+    with transaction.atomic():
+        parent_group, _ = Group.objects.get_or_create(name='Parent')
+        student_group, _ = Group.objects.get_or_create(name='Student')
+        User.objects.create_user(BENCH_ADMIN, password=SEED_PASSWORD, is_staff=True)
+
+        log(f'Пользователи: {parents} родителей, {adults} взрослых учеников')
+        users = User.objects.bulk_create(
+            [User(username=BENCH_PARENT.format(i), password=password) for i in range(parents)]
+            + [User(username=BENCH_STUDENT.format(i), password=password) for i in range(adults)],
+            batch_size=BATCH_SIZE,
+        )
+        parent_ids = [user.id for user in users[:parents]]
+        Membership = User.groups.through
+        Membership.objects.bulk_create(
+            [Membership(user_id=user.id, group_id=parent_group.id) for user in users[:parents]]
+            + [Membership(user_id=user.id, group_id=student_group.id) for user in users[parents:]],
+            batch_size=BATCH_SIZE,
+        )
+
+        log(f'Ученики: {children}')
+        kids = []
+        for i in range(children):
+            is_adult = i < adults
+            birth = None if rng.random() < 0.05 else today - timedelta(
+                days=rng.randrange(18 * 365, 50 * 365) if is_adult else rng.randrange(6 * 365, 17 * 365))
+            # первые дети — по одному каждому родителю, чтобы у всех были дети
+            n = i - adults
+            parent_id = None if is_adult else parent_ids[n] if n < parents else rng.choice(parent_ids)
+            kids.append(Child(
+                first_name=f'Ученик{i}', last_name=f'Фамилия{i % 997}', birth_date=birth,
+                birthday_key=birthday_key(birth), gender=rng.choice('MFU'), is_adult=is_adult,
+                account_user_id=users[parents + i].id if is_adult else None, parent_id=parent_id,
+            ))
+        kids = Child.objects.bulk_create(kids, batch_size=BATCH_SIZE)
+        child_ids = [kid.id for kid in kids]
+
+        log('Абонементы и год оплат')
+        sub_types = [SubscriptionType.objects.create(name=name, lessons_count=count, price=price)
+                     for name, count, price in _SUB_TYPES]
+        subscriptions = []
+        for child_id in child_ids:
+            sub_type = rng.choice(sub_types)
+            subscriptions.append(Subscription(
+                child_id=child_id, sub_type=sub_type, lessons_remaining=rng.randint(0, sub_type.lessons_count),
+                price=sub_type.price, paid=rng.random() < 0.8,
+            ))
+        subscriptions = Subscription.objects.bulk_create(subscriptions, batch_size=BATCH_SIZE)
+        LedgerEntry.objects.bulk_create(
+            [LedgerEntry(subscription_id=sub.id, kind=LedgerEntry.OPENING, delta=sub.lessons_remaining)
+             for sub in subscriptions],
+            batch_size=BATCH_SIZE,
+        )
+        now = timezone.now()
+        payments = [
+            Payment(subscription_id=sub.id, sub_type_id=sub.sub_type_id, amount=sub.price,
+                    created_at=now - timedelta(days=30 * month + rng.randrange(30)))
+            for sub in subscriptions
+            for month in range(PAYMENT_MONTHS)
+            if rng.random() < 0.7
+        ]
+        for chunk in _chunks(payments):
+            Payment.objects.bulk_create(chunk)
+
+        log(f'Занятия: {sessions}')
+        first_day = today + timedelta(days=FUTURE_DAYS) - timedelta(days=sessions // SESSIONS_PER_DAY)
+        Participants = TrainingSession.participants.through
+        for offset in range(0, sessions, BATCH_SIZE):
+            batch = []
+            members = []
+            for n in range(offset, min(sessions, offset + BATCH_SIZE)):
+                day = first_day + timedelta(days=n // SESSIONS_PER_DAY)
+                hour, minute = rng.choice(_START_TIMES)
+                participants = rng.sample(child_ids, min(len(child_ids), rng.randint(2, 8)))
+                capacity = rng.choice(_CAPACITIES)
+                batch.append(TrainingSession(
+                    start=timezone.make_aware(datetime(day.year, day.month, day.day, hour, minute)),
+                    duration_minutes=rng.choice((60, 90)),
+                    capacity=None if capacity is None else max(capacity, len(participants)),
+                    participant_count=len(participants),
+                ))
+                members.append(participants)
+            batch = TrainingSession.objects.bulk_create(batch)
+            Participants.objects.bulk_create(
+                [Participants(trainingsession_id=session.id, child_id=child_id)
+                 for session, participants in zip(batch, members) for child_id in participants],
+                batch_size=BATCH_SIZE,
+            )
+            log(f'  {offset + len(batch)}')
+
+        log('Сводки и поисковый индекс')
+        analytics.rebuild()
+        revenue.rebuild()
+        search.rebuild()
+    invalidate_birthdays()
+
+
+# --- бюджеты страниц ---
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'bench_budgets.json'
+ROLES = ('anonymous', 'admin', 'parent', 'student')
+
+# целевое время ответа страницы на объёмах seed() по умолчанию
+TARGET_MS = 250
+# календари месяца и года выводят все занятия периода (~1200 в месяц)
+TARGET_MS_BY_VIEW = {
+    'sessions_month': 400,
+    'schedule_month': 400,
+    'sessions_year': 400,
+}
+
+Measurement = namedtuple('Measurement', 'role name status queries sql_ms wall_ms')
+
+
+class Fixtures:
+    """Объекты из seed(), на которые подставляются параметры URL."""
+
+    def __init__(self):
+        self.users = {
+            'admin': User.objects.get(username=BENCH_ADMIN),
+            'parent': User.objects.get(username=BENCH_PARENT.format(0)),
+            'student': User.objects.get(username=BENCH_STUDENT.format(0)),
+        }
+        self.child = Child.objects.filter(parent=self.users['parent']).order_by('id').first()
+        # ближайшее занятие ребёнка — страницы занятия видят его участников
+        self.session = (TrainingSession.objects.filter(participants=self.child).order_by('start')
+                        .filter(start__gte=timezone.now()).first()
+                        or TrainingSession.objects.order_by('-start').first())
+        self.sub_type = SubscriptionType.objects.order_by('id').first()
+
+    def url_kwargs(self, name, params):
+        values = {
+            'pk': (self.sub_type.pk if name.startswith('subscription_type')
+                   else self.session.pk if name.startswith('session') else self.child.pk),
+            'child_id': self.child.pk,
+            'user_id': self.users['parent'].pk,
+            'token': ical.feed_token(self.users['parent']),
+            'name': 'children',
+            'fmt': 'csv',
+        }
+        return {param: values[param] for param in params}
+
+
+def core_url_patterns():
+    return [pattern for pattern in urls.urlpatterns if pattern.name]
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.streaming:
+        # выгрузки и .ics читают базу, пока отдаётся тело
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure_views(fixtures, roles=ROLES, repeat=3, patterns=None):
+    """Замеры GET каждого URL под каждой ролью: список Measurement.
+
+    Первый запрос — прогрев (кэши ролей и дней рождения, накопленные
+    flash-сообщения); дальше берётся лучший из repeat по полному времени.
+    """
+    patterns = patterns if patterns is not None else core_url_patterns()
+    measurements = []
+    # 405 и 403 на GET — ожидаемые ответы, а не предупреждения в лог
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        for role in roles:
+            client = Client()
+            if role != 'anonymous':
+                client.force_login(fixtures.users[role])
+            for pattern in patterns:
+                url = reverse(pattern.name, kwargs=fixtures.url_kwargs(pattern.name, pattern.pattern.converters))
+                measurements.append(_measure(client, role, pattern.name, url, repeat))
+    finally:
+        request_logger.setLevel(level)
+    return measurements
+
+
+def _measure(client, role, name, url, repeat):
+    _get(client, url)
+    best = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = _get(client, url)
+            wall_ms = (time.perf_counter() - started) * 1000
+        sql_ms = sum(float(query['time']) for query in ctx.captured_queries) * 1000
+        sample = Measurement(role, name, response.status_code, len(ctx), sql_ms, wall_ms)
+        if best is None or sample.wall_ms < best.wall_ms:
+            best = sample
+    return best
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_budgets(measurements, budgets, latency=True):
+    """Нарушения бюджета: список строк; пустой — всё в пределах."""
+    problems = []
+    for m in measurements:
+        budget = budgets.get(m.role, {}).get(m.name)
+        if budget is None:
+            problems.append(f'{m.role} {m.name}: нет бюджета (запросов: {m.queries})')
+            continue
+        if m.status >= 500:
+            problems.append(f'{m.role} {m.name}: ответ {m.status}')
+        if m.queries > budget['queries']:
+            problems.append(f'{m.role} {m.name}: запросов {m.queries} > {budget["queries"]}')
+        if latency and m.wall_ms > budget['ms']:
+            problems.append(f'{m.role} {m.name}: {m.wall_ms:.0f} мс > {budget["ms"]} мс')
+    return problems
+
+
+def budgets_from(measurements, target_ms=TARGET_MS, targets=TARGET_MS_BY_VIEW):
+    """Бюджет: запросы — по замерам, время — целевое для страницы, а не замеренное."""
+    budgets = {}
+    for m in measurements:
+        budgets.setdefault(m.role, {})[m.name] = {
+            'queries': m.queries,
+            'ms': targets.get(m.name, target_ms),
+        }
+    return budgets
@@ -0,0 +1,59 @@
+import calendar
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Child, birthday_key
+
+UPCOMING_DAYS = 3
+CACHE_TIMEOUT = 60 * 60 * 24
+
+FEB_29 = 229
+
+
+def birthdays_cache_key(today):
+    return f'core:birthdays:{today.isoformat()}'
+
+
+def _window(today, days):
+    """Словарь {ключ MMDD: дата праздника} для дней от today до today + days.
+
+    Окно строится по датам, поэтому переход через Новый год не требует
+    особой обработки. В невисокосный год 29 февраля отмечается 28-го.
+    """
+    window = {}
+    for i in range(days + 1):
+        day = today + timedelta(days=i)
+        window[birthday_key(day)] = day
+        if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+            window[FEB_29] = day
+    return window
+
+
+def find_upcoming_birthdays(today, days=UPCOMING_DAYS):
+    window = _window(today, days)
+    children = (Child.objects
+                .filter(birthday_key__in=window.keys())
+                .only('id', 'first_name', 'last_name', 'birth_date', 'birthday_key'))
+    upcoming = []
+    for child in children:
+        bd = window[child.birthday_key]
+        upcoming.append({'child': child, 'date': bd, 'days_left': (bd - today).days})
+    upcoming.sort(key=lambda x: x['date'])
+    return upcoming
+
+
+def upcoming_birthdays(today=None):
+    """Ближайшие дни рождения; не больше одного индексного запроса в день."""
+    today = today or timezone.localdate()
+    key = birthdays_cache_key(today)
+    upcoming = cache.get(key)
+    if upcoming is None:
+        upcoming = find_upcoming_birthdays(today)
+        cache.set(key, upcoming, CACHE_TIMEOUT)
+    return upcoming
+
+
+def invalidate_birthdays():
+    cache.delete(birthdays_cache_key(timezone.localdate()))
@@ -0,0 +1,203 @@
+"""Календарный движок: произвольный диапазон дат → дни, недели, месяцы и слоты.
+
+Занятия за весь диапазон выбираются одним запросом (группировка в слоты —
+core.slots), а сетка строится за один проход по дням, поэтому годовой обзор
+стоит столько же запросов, сколько и месячный.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+
+from .models import TrainingSession
+from .slots import COUNT, DETAIL, agroup_timeslots, group_timeslots  # noqa: F401
+
+PERIODS = ('week', 'month', 'quarter', 'season', 'year')
+MAX_RANGE_DAYS = 366
+
+# сезоны — по три месяца, зима начинается в декабре
+MONTHS_IN_SEASON = 3
+
+
+def normalize_month(year, month):
+    """Приводит месяц к 1..12, перенося лишнее в год (0 → декабрь прошлого года)."""
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return year, month
+
+
+def parse_month(params, today):
+    """Год и месяц из GET-параметров year/month с нормализацией."""
+    try:
+        year = int(params.get('year', today.year))
+        month = int(params.get('month', today.month))
+    except (TypeError, ValueError):
+        year, month = today.year, today.month
+    return normalize_month(year, month)
+
+
+def parse_year(params, today):
+    try:
+        return int(params.get('year', today.year))
+    except (TypeError, ValueError):
+        return today.year
+
+
+def parse_date(value, default=None):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def add_months(day, months):
+    year, month = normalize_month(day.year, day.month + months)
+    return date(year, month, 1)
+
+
+def month_range(year, month):
+    first_day = date(year, month, 1)
+    _, days_in_month = monthrange(year, month)
+    return first_day, first_day + timedelta(days=days_in_month - 1)
+
+
+def period_range(period, anchor):
+    """Границы (включительно) периода, содержащего дату anchor."""
+    if period == 'week':
+        first_day = anchor - timedelta(days=anchor.weekday())
+        return first_day, first_day + timedelta(days=6)
+    if period == 'month':
+        return month_range(anchor.year, anchor.month)
+    if period == 'quarter':
+        first_day = date(anchor.year, (anchor.month - 1) // 3 * 3 + 1, 1)
+    elif period == 'season':
+        # сдвигаем на месяц, чтобы декабрь попал в зиму следующего года
+        shifted = add_months(anchor, 1)
+        first_day = add_months(date(shifted.year, (shifted.month - 1) // 3 * 3 + 1, 1), -1)
+    elif period == 'year':
+        return date(anchor.year, 1, 1), date(anchor.year, 12, 31)
+    else:
+        raise ValueError(f'Неизвестный период: {period}')
+    return first_day, add_months(first_day, MONTHS_IN_SEASON) - timedelta(days=1)
+
+
+def neighbour_months(year, month):
+    prev_year, prev_month = normalize_month(year, month - 1)
+    next_year, next_month = normalize_month(year, month + 1)
+    return {
+        'prev_year': prev_year, 'prev_month': prev_month,
+        'next_year': next_year, 'next_month': next_month,
+    }
+
+
+def sessions_in_range(date_from, date_to):
+    """Занятия диапазона [date_from, date_to] (локальные дни, включительно)."""
+    return TrainingSession.objects.in_local_range(date_from, date_to)
+
+
+class CalendarMonth:
+    """Месячная сетка внутри диапазона: недели по 7 ячеек, чужие дни — None."""
+
+    def __init__(self, first_day):
+        self.first_day = first_day
+        self.weeks = []
+        self._week = [None] * first_day.weekday()
+
+    @property
+    def year(self):
+        return self.first_day.year
+
+    @property
+    def month(self):
+        return self.first_day.month
+
+    def add_day(self, day):
+        self._week.append(day)
+        if len(self._week) == 7:
+            self.weeks.append(self._week)
+            self._week = []
+
+    def close(self):
+        if self._week:
+            self._week += [None] * (7 - len(self._week))
+            self.weeks.append(self._week)
+            self._week = []
+
+
+class Calendar:
+    """Календарь на диапазон [date_from, date_to].
+
+    days — все дни диапазона; weeks — сквозные недели с понедельника
+    (дни вне диапазона — None); months — сетки по месяцам; slots_by_day —
+    сгруппированные слоты занятий.
+    """
+
+    def __init__(self, date_from, date_to, slots_by_day):
+        if date_to < date_from:
+            date_from, date_to = date_to, date_from
+        self.date_from = date_from
+        self.date_to = date_to
+        self.slots_by_day = slots_by_day
+        self.days = []
+        self.weeks = []
+        self.months = []
+        self._build()
+
+    def _build(self):
+        week = [None] * self.date_from.weekday()
+        month = None
+        day = self.date_from
+        while day <= self.date_to:
+            self.days.append(day)
+            week.append(day)
+            if len(week) == 7:
+                self.weeks.append(week)
+                week = []
+            if month is None or day.month != month.month:
+                if month is not None:
+                    month.close()
+                month = CalendarMonth(day.replace(day=1))
+                # диапазон может начинаться с середины месяца
+                for _ in range(day.day - 1):
+                    month.add_day(None)
+                self.months.append(month)
+            month.add_day(day)
+            day += timedelta(days=1)
+        if week:
+            week += [None] * (7 - len(week))
+            self.weeks.append(week)
+        if month is not None:
+            month.close()
+
+
+def build_calendar(date_from, date_to, mode=DETAIL):
+    """Календарь с занятиями за диапазон.
+
+    В режиме COUNT слоты считаются одним запросом, в DETAIL — двумя
+    (занятия и участники); сетка строится за один проход по дням.
+    """
+    slots_by_day = group_timeslots(sessions_in_range(date_from, date_to), mode=mode)
+    return Calendar(date_from, date_to, slots_by_day)
+
+
+async def abuild_calendar(date_from, date_to, mode=DETAIL):
+    """build_calendar для асинхронных видов: слоты читаются через async ORM."""
+    slots_by_day = await agroup_timeslots(sessions_in_range(date_from, date_to), mode=mode)
+    return Calendar(date_from, date_to, slots_by_day)
+
+
+def week_grid(days, slots_by_day):
+    """Сводная таблица недели: строки — время начала, столбцы — дни.
+
+    Слоты раскладываются в словарь {(день, время): слот} за один проход,
+    после чего каждая ячейка берётся из него по ключу.
+    """
+    index = {}
+    times = set()
+    for day, day_slots in slots_by_day.items():
+        for slot in day_slots:
+            t = slot.start.time()
+            times.add(t)
+            index.setdefault((day, t), slot)
+    return [
+        {'time': t, 'slots': [{'day': day, 'slot': index.get((day, t))} for day in days]}
+        for t in sorted(times)
+    ]
@@ -0,0 +1,113 @@
+"""Пересечения занятий: ученик в двух занятиях одновременно и повторы слотов.
+
+Интервалы занятий сравниваются по хранимому столбцу end и индексу
+(start, end). Пакет интервалов (одно занятие, серия на месяц, копия недели)
+проверяется одним запросом на учеников и одним на повторы слотов: условия
+пересечения объединяются через OR, ученики с одинаковым набором интервалов
+идут одним child_id IN (...). Число запросов не зависит ни от числа
+учеников, ни от числа недель.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MAX_SESSION_MINUTES, TrainingSession
+
+Participants = TrainingSession.participants.through
+
+# сколько пересечений показывать в сообщении
+MAX_REPORTED = 5
+
+
+class Conflict:
+    """Занятие session_id, с которым пересекается новое; child_name=None — повтор слота."""
+    __slots__ = ('child_name', 'session_id', 'start', 'end')
+
+    def __init__(self, child_name, session_id, start, end):
+        self.child_name = child_name
+        self.session_id = session_id
+        self.start = start
+        self.end = end
+
+    def __str__(self):
+        start = timezone.localtime(self.start)
+        end = timezone.localtime(self.end)
+        if self.child_name is None:
+            return f'занятие {start:%d.%m %H:%M}–{end:%H:%M} уже есть в расписании'
+        return f'{self.child_name} уже записан(а) на {start:%d.%m %H:%M}–{end:%H:%M}'
+
+
+class ScheduleConflict(Exception):
+    """Пересечения с уже существующими занятиями; conflicts — список Conflict."""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        shown = '; '.join(str(c) for c in conflicts[:MAX_REPORTED])
+        more = len(conflicts) - MAX_REPORTED
+        if more > 0:
+            shown += f' и ещё {more}'
+        super().__init__(f'Пересечение расписания: {shown}')
+
+
+def _overlap(intervals, prefix=''):
+    condition = Q()
+    for start, end in intervals:
+        condition |= Q(**{
+            f'{prefix}start__gt': start - timedelta(minutes=MAX_SESSION_MINUTES),
+            f'{prefix}start__lt': end,
+            f'{prefix}end__gt': start,
+        })
+    return condition
+
+
+def child_conflicts(items, exclude=()):
+    """Занятия, где ученики уже заняты в пересекающееся время.
+
+    items — пары (интервал (start, end), id учеников). Один запрос.
+    """
+    intervals_by_children = defaultdict(set)
+    for interval, child_ids in items:
+        child_ids = frozenset(child_ids)
+        if child_ids:
+            intervals_by_children[child_ids].add(interval)
+    if not intervals_by_children:
+        return []
+    condition = Q()
+    for child_ids, intervals in intervals_by_children.items():
+        condition |= Q(child_id__in=child_ids) & _overlap(intervals, 'trainingsession__')
+    rows = (Participants.objects
+            .filter(condition)
+            .exclude(trainingsession_id__in=list(exclude))
+            .order_by('trainingsession__start', 'child__first_name', 'child_id')
+            .values_list('child__first_name', 'child__last_name', 'trainingsession_id',
+                         'trainingsession__start', 'trainingsession__end'))
+    return [Conflict(f'{first} {last}'.strip(), session_id, start, end)
+            for first, last, session_id, start, end in rows]
+
+
+def duplicate_slots(intervals, exclude=()):
+    """Уже существующие занятия ровно с такими же началом и концом. Один запрос."""
+    intervals = set(intervals)
+    if not intervals:
+        return []
+    condition = Q()
+    for start, end in intervals:
+        condition |= Q(start=start, end=end)
+    return list(TrainingSession.objects.filter(condition).exclude(pk__in=list(exclude))
+                .order_by('start').values_list('id', 'start', 'end'))
+
+
+def check(items, exclude=(), duplicates=False):
+    """Бросает ScheduleConflict, если ученики из items заняты в это время.
+
+    duplicates=True — повтор существующего слота тоже считается конфликтом
+    (серии и копирование расписания).
+    """
+    conflicts = child_conflicts(items, exclude)
+    if duplicates:
+        for session_id, start, end in duplicate_slots([interval for interval, _ in items], exclude):
+            conflicts.append(Conflict(None, session_id, start, end))
+    if conflicts:
+        raise ScheduleConflict(conflicts)
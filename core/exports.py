@@ -0,0 +1,267 @@
+"""Выгрузки для бухгалтерии: ученики, абонементы и посещения в CSV/XLSX.
+
+Строки читаются через values_list(...).iterator(chunk_size=...) и сразу
+пишутся в поток, поэтому память не зависит от числа строк, а первые байты
+уходят клиенту до окончания выборки.
+
+XLSX собирается стандартным zipfile в неперематываемый поток: лист пишется
+построчно с inline-строками (без таблицы sharedStrings, которую пришлось бы
+держать целиком в памяти).
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Child, LedgerEntry, Subscription, TrainingSession
+
+CHUNK_SIZE = 2000
+# сколько строк копить перед отдачей очередной порции байтов
+ROWS_PER_FLUSH = 500
+
+CSV = 'csv'
+XLSX = 'xlsx'
+FORMATS = {
+    CSV: 'text/csv; charset=utf-8',
+    XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+_GENDERS = dict(Child.GENDER_CHOICES)
+# символы, запрещённые в XML 1.0: с ними Excel считает книгу повреждённой
+_XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _yes_no(value):
+    return 'да' if value else 'нет'
+
+
+def _local(value):
+    return timezone.localtime(value).replace(tzinfo=None)
+
+
+# --- наборы данных ---
+
+class Export:
+    """Набор данных выгрузки: заголовок и генератор строк."""
+
+    def __init__(self, name, title, header, rows):
+        self.name = name
+        self.title = title
+        self.header = header
+        self._rows = rows
+
+    def rows(self, date_from=None, date_to=None):
+        return self._rows(date_from, date_to)
+
+
+def _children_rows(date_from, date_to):
+    rows = (Child.objects.order_by('id')
+            .values_list('id', 'first_name', 'last_name', 'birth_date', 'gender', 'is_adult',
+                         'parent__username', 'parent__email', 'account_user__username', 'notes'))
+    for child_id, first, last, birth, gender, adult, parent, email, account, notes in rows.iterator(CHUNK_SIZE):
+        yield [child_id, first, last, birth, _GENDERS.get(gender, gender), _yes_no(adult),
+               parent or '', email or '', account or '', notes]
+
+
+def _subscriptions_rows(date_from, date_to):
+    rows = (Subscription.objects.order_by('id')
+            .values_list('id', 'child_id', 'child__first_name', 'child__last_name',
+                         'child__parent__username', 'child__parent__email', 'sub_type__name',
+                         'sub_type__lessons_count', 'lessons_remaining', 'price', 'paid', 'updated_at'))
+    for *head, lessons_count, remaining, price, paid, updated_at in rows.iterator(CHUNK_SIZE):
+        sub_id, child_id, first, last, parent, email, type_name = head
+        yield [sub_id, child_id, f'{first} {last}'.strip(), parent or '', email or '', type_name,
+               lessons_count, remaining, max(0, lessons_count - remaining), price, _yes_no(paid),
+               _local(updated_at)]
+
+
+def _attendance_rows(date_from, date_to):
+    through = TrainingSession.participants.through
+    links = through.objects.all()
+    if date_from is not None and date_to is not None:
+        sessions = TrainingSession.objects.in_local_range(date_from, date_to).values('id')
+        links = links.filter(trainingsession__in=sessions)
+    visited = LedgerEntry.objects.filter(
+        kind=LedgerEntry.VISIT,
+        session_id=OuterRef('trainingsession_id'),
+        subscription__child_id=OuterRef('child_id'),
+    )
+    rows = (links
+            .annotate(visited=Exists(visited))
+            .order_by('trainingsession__start', 'trainingsession_id', 'child_id')
+            .values_list('trainingsession_id', 'trainingsession__start', 'trainingsession__duration_minutes',
+                         'child_id', 'child__first_name', 'child__last_name', 'child__parent__username',
+                         'visited'))
+    for session_id, start, duration, child_id, first, last, parent, visited in rows.iterator(CHUNK_SIZE):
+        local = _local(start)
+        yield [session_id, local.date(), local.time(), duration, child_id,
+               f'{first} {last}'.strip(), parent or '', _yes_no(visited)]
+
+
+EXPORTS = {
+    export.name: export for export in (
+        Export('children', 'Ученики',
+               ['ID', 'Имя', 'Фамилия', 'Дата рождения', 'Пол', 'Взрослый', 'Родитель', 'Email родителя',
+                'Аккаунт', 'Заметки'],
+               _children_rows),
+        Export('subscriptions', 'Абонементы',
+               ['ID', 'ID ученика', 'Ученик', 'Родитель', 'Email родителя', 'Тип', 'Всего занятий',
+                'Остаток', 'Использовано', 'Цена', 'Оплачен', 'Изменён'],
+               _subscriptions_rows),
+        Export('attendance', 'Посещения',
+               ['ID занятия', 'Дата', 'Время', 'Минут', 'ID ученика', 'Ученик', 'Родитель', 'Посещение зачтено'],
+               _attendance_rows),
+    )
+}
+
+
+# --- CSV ---
+
+class _Echo:
+    """Псевдофайл для csv.writer: write() просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return f'{value:%Y-%m-%d %H:%M}'
+    if isinstance(value, time):
+        return f'{value:%H:%M}'
+    return value
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(_Echo())
+    # BOM — чтобы Excel открыл UTF-8 без мастера импорта
+    yield ('\ufeff' + writer.writerow(header)).encode()
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow([_csv_cell(v) for v in row]))
+        if len(batch) >= ROWS_PER_FLUSH:
+            yield ''.join(batch).encode()
+            batch = []
+    if batch:
+        yield ''.join(batch).encode()
+
+
+# --- XLSX ---
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+class _Sink:
+    """Неперематываемый поток для zipfile: накапливает байты до drain()."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        value = _yes_no(value)
+    elif isinstance(value, (int, float, Decimal)):
+        return f'<c t="n"><v>{value}</v></c>'
+    elif isinstance(value, datetime):
+        value = f'{value:%Y-%m-%d %H:%M}'
+    elif isinstance(value, (date, time)):
+        value = value.isoformat(timespec='minutes') if isinstance(value, time) else value.isoformat()
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>'
+
+
+def iter_xlsx(header, rows, sheet_name='Лист1'):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31], {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _xlsx_row(header)).encode())
+            batch = []
+            for row in rows:
+                batch.append(_xlsx_row(row))
+                if len(batch) >= ROWS_PER_FLUSH:
+                    sheet.write(''.join(batch).encode())
+                    batch = []
+                    yield sink.drain()
+            sheet.write((''.join(batch) + _SHEET_END).encode())
+    yield sink.drain()
+
+
+def stream(export, fmt, date_from=None, date_to=None):
+    """Байты выгрузки export в формате fmt (CSV или XLSX) порциями."""
+    rows = export.rows(date_from, date_to)
+    if fmt == XLSX:
+        return iter_xlsx(export.header, rows, sheet_name=export.title)
+    return iter_csv(export.header, rows)
+
+
+def filename(export, fmt, date_from=None, date_to=None):
+    suffix = f'_{date_from:%Y%m%d}-{date_to:%Y%m%d}' if date_from and date_to else ''
+    return f'{export.name}{suffix}.{fmt}'
@@ -1,8 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.models import User, Group
+from django.utils import timezone
+from . import conflicts
 from .models import Child, SubscriptionType, Subscription, TrainingSession
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 class BootstrapPasswordChangeForm(PasswordChangeForm):
@@ -170,6 +172,24 @@ class SubscriptionForm(forms.ModelForm):
         model = Subscription
         fields = ['child', 'sub_type', 'lessons_remaining', 'price', 'paid']
 
+class SelectedChildrenMultiple(forms.SelectMultiple):
+    """Список участников, в котором есть только выбранные ученики.
+
+    Остальные добавляются поиском (children_search, см. includes/participants_field.html):
+    выводить всех учеников вариантами списка — тысячи строк на каждую форму.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        ids = [v for v in value if str(v).isdigit()]
+        self.choices = [(child.pk, str(child)) for child in
+                        Child.objects.filter(pk__in=ids).only('id', 'first_name', 'last_name')] if ids else []
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
 class TrainingSessionForm(forms.ModelForm):
     date = forms.DateField(
         label='Дата',
@@ -195,9 +215,10 @@ class TrainingSessionForm(forms.ModelForm):
 
     class Meta:
         model = TrainingSession
-        fields = ['date', 'time', 'duration_minutes', 'participants', 'notes']
+        fields = ['date', 'time', 'duration_minutes', 'capacity', 'participants', 'notes']
         labels = {
             'duration_minutes': 'Длительность (мин)',
+            'capacity': 'Мест (пусто — без ограничения)',
             'participants': 'Участники',
             'notes': 'Примечания',
         }
@@ -210,7 +231,10 @@ class TrainingSessionForm(forms.ModelForm):
                     'step': 15,
                 }
             ),
-            'participants': forms.SelectMultiple(
+            'capacity': forms.NumberInput(
+                attrs={'class': 'form-control', 'min': 1, 'max': 100, 'inputmode': 'numeric'}
+            ),
+            'participants': SelectedChildrenMultiple(
                 attrs={'class': 'form-select', 'size': 5}
             ),
             'notes': forms.Textarea(
@@ -225,22 +249,64 @@ class TrainingSessionForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.start:
-            self.fields['date'].initial = self.instance.start.date()
-            self.fields['time'].initial = self.instance.start.strftime('%H:%M')
+            local_start = timezone.localtime(self.instance.start)
+            self.fields['date'].initial = local_start.date()
+            self.fields['time'].initial = local_start.strftime('%H:%M')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        capacity = cleaned_data.get('capacity')
+        participants = cleaned_data.get('participants')
+        if capacity is not None and participants is not None and len(participants) > capacity:
+            self.add_error('participants', f'Участников больше, чем мест ({capacity})')
+        return cleaned_data
+
+    def check_conflicts(self, instance):
+        """Бросает ScheduleConflict, если участники заняты в это время.
+
+        Вызывается из save(), а не из clean(): виды сохраняют форму в
+        transaction.atomic(), и проверка идёт в одной транзакции с записью.
+        """
+        participants = self.cleaned_data.get('participants')
+        if participants:
+            start = instance.start
+            exclude = [instance.pk] if instance.pk else []
+            conflicts.check([((start, start + timedelta(minutes=instance.duration_minutes)),
+                              [c.pk for c in participants])], exclude=exclude)
 
     def save(self, commit=True):
         instance = super().save(commit=False)
         date = self.cleaned_data['date']
         time = self.cleaned_data['time']
-        instance.start = datetime.combine(date, time)
+        instance.start = timezone.make_aware(datetime.combine(date, time))
         if commit:
-            instance.save()
-            self.save_m2m()
+            self.check_conflicts(instance)
+            # места проверяет ограничение в БД: при уменьшении вместимости
+            # сначала убираем лишних участников, иначе — сначала сохраняем занятие
+            old_capacity = self.initial.get('capacity')
+            shrinking = instance.pk and instance.capacity is not None and (
+                old_capacity is None or instance.capacity < old_capacity)
+            if shrinking:
+                self.save_m2m()
+                instance.save()
+            else:
+                instance.save()
+                self.save_m2m()
         return instance
 
 class AddVisitForm(forms.Form):
     child_id = forms.IntegerField(widget=forms.HiddenInput)
 
+class AttendanceForm(forms.Form):
+    """Отмеченные участники занятия: id, которых нет среди участников, — ошибка."""
+    child_ids = forms.TypedMultipleChoiceField(coerce=int, required=False)
+
+    def __init__(self, *args, session, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['child_ids'].choices = [
+            (pk, pk) for pk in session.participants.values_list('id', flat=True)
+        ]
+
 class IssueSubscriptionForm(forms.Form):
     sub_type = forms.ModelChoiceField(
         queryset=SubscriptionType.objects.all(),
@@ -249,3 +315,7 @@ class IssueSubscriptionForm(forms.Form):
     )
     price = forms.DecimalField(label='Цена', max_digits=10, decimal_places=2, required=False)
     mark_paid = forms.BooleanField(label='Сразу отметить как оплачен', required=False)
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(label='CSV-файл', widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv'}))
+    dry_run = forms.BooleanField(label='Только проверить', required=False)
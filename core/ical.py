@@ -0,0 +1,139 @@
+"""Календарь iCalendar (.ics) с занятиями родителя или взрослого ученика.
+
+Ссылка на ленту содержит токен — HMAC от id и хэша пароля пользователя,
+поэтому календарное приложение читает ленту без входа, а смена пароля
+отзывает старую ссылку.
+
+Лента генерируется потоково: строки участников вместе с полями занятия
+читаются одним запросом через iterator() и выдаются порциями событий.
+Готовые байты кэшируются по версии расписания (core.versions), так что
+опрос каждые несколько минут отвечает 304 или байтами из кэша.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import groupby
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Child, TrainingSession
+
+HISTORY_WEEKS = 8
+CHUNK_SIZE = 500
+EVENTS_PER_CHUNK = 100
+CACHE_TIMEOUT = 60 * 60
+# большие ленты не кладём в кэш целиком
+CACHE_MAX_BYTES = 2 * 1024 * 1024
+CALENDAR_NAME = 'Малыш Джон — тренировки'
+UID_DOMAIN = 'littlejohn'
+
+_KEY_SALT = 'core.ical.feed_token'
+
+
+def feed_token(user):
+    return salted_hmac(_KEY_SALT, f'{user.pk}:{user.password}').hexdigest()[:32]
+
+
+def check_feed_token(user, token):
+    return constant_time_compare(feed_token(user), token)
+
+
+def window_start(today=None):
+    today = today or timezone.localdate()
+    return timezone.make_aware(datetime.combine(today - timedelta(weeks=HISTORY_WEEKS), time.min))
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Переносит строку длиннее 75 октетов (RFC 5545, 3.1), не разрывая символы UTF-8."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    current = ''
+    size = 0
+    limit = 75
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > limit:
+            parts.append(current)
+            current, size, limit = '', 0, 74  # продолжение начинается с пробела
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(session_id, start, duration, notes, updated_at, names):
+    summary = 'Тренировка'
+    if names:
+        summary += ': ' + ', '.join(names)
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:session-{session_id}@{UID_DOMAIN}',
+        f'DTSTAMP:{_utc(updated_at)}',
+        f'DTSTART:{_utc(start)}',
+        f'DTEND:{_utc(start + timedelta(minutes=duration))}',
+        f'SUMMARY:{_escape(summary)}',
+    ]
+    if notes:
+        lines.append(f'DESCRIPTION:{_escape(notes)}')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def iter_feed(children_ids, since):
+    """Генератор байтов .ics с занятиями учеников children_ids начиная с since."""
+    names = dict(Child.objects.filter(id__in=children_ids).values_list('id', 'first_name'))
+    header = ''.join(_fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{UID_DOMAIN}//schedule//RU',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_escape(CALENDAR_NAME)}',
+    ))
+    yield header.encode()
+
+    links = (TrainingSession.participants.through.objects
+             .filter(child_id__in=children_ids, trainingsession__start__gte=since)
+             .order_by('trainingsession__start', 'trainingsession_id', 'child_id')
+             .values_list('trainingsession_id', 'trainingsession__start', 'trainingsession__duration_minutes',
+                          'trainingsession__notes', 'trainingsession__updated_at', 'child_id')
+             .iterator(chunk_size=CHUNK_SIZE))
+    events = []
+    for key, rows in groupby(links, key=lambda row: row[:5]):
+        session_id, start, duration, notes, updated_at = key
+        events.append(_event(session_id, start, duration, notes, updated_at,
+                             [names[row[5]] for row in rows]))
+        if len(events) >= EVENTS_PER_CHUNK:
+            yield ''.join(events).encode()
+            events = []
+    events.append(_fold('END:VCALENDAR'))
+    yield ''.join(events).encode()
+
+
+def cache_key(user_id, version):
+    return f'core:ical:{user_id}:{version}'
+
+
+def cached_stream(chunks, key):
+    """Пропускает chunks дальше и по окончании кладёт собранные байты в кэш."""
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            parts.append(chunk)
+            size += len(chunk)
+            if size > CACHE_MAX_BYTES:
+                parts = None
+        yield chunk
+    if parts is not None:
+        cache.set(key, b''.join(parts), CACHE_TIMEOUT)
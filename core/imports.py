@@ -0,0 +1,321 @@
+"""Массовый импорт родителей и учеников из CSV.
+
+Одна строка — один ученик. Столбцы (первая строка — заголовок):
+
+    type             child | adult (по умолчанию child)
+    first_name       имя ученика (обязательно)
+    last_name, birth_date (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ), gender (M/F/U, М/Ж), notes
+    username, email, password
+                     для ребёнка — аккаунт родителя: существующий родитель
+                     находится по логину, новый создаётся (пароль обязателен);
+                     несколько детей одного родителя — несколько строк с тем
+                     же логином. Для взрослого — его собственный аккаунт.
+    parent_first_name, parent_last_name
+                     имя родителя для нового аккаунта
+
+Весь файл проверяется до записи: при любой ошибке ничего не создаётся;
+пароли новых аккаунтов проходят AUTH_PASSWORD_VALIDATORS, как в формах.
+Пароли хэшируются параллельно в пуле процессов (PBKDF2 — сотни мс на
+пароль); пул общий на процесс и создаётся при первом большом импорте.
+Затем пользователи, группы, ученики, абонементы и записи журнала
+вставляются bulk_create пачками в одной транзакции. bulk_create не
+вызывает save() и сигналы, поэтому birthday_key, поисковый индекс и кэши
+обновляются здесь же явно.
+"""
+import atexit
+import csv
+import functools
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from . import search
+from .birthdays import invalidate_birthdays
+from .models import Child, LedgerEntry, Subscription, SubscriptionType, birthday_key
+from .roles import invalidate_roles
+
+BATCH_SIZE = 500
+# меньше стольких паролей пул процессов не окупается
+MIN_PARALLEL_PASSWORDS = 8
+MAX_ERRORS = 50
+
+CHILD = 'child'
+ADULT = 'adult'
+TYPES = {'child': CHILD, 'ребенок': CHILD, 'ребёнок': CHILD, 'adult': ADULT, 'взрослый': ADULT}
+GENDERS = {'m': 'M', 'м': 'M', 'f': 'F', 'ж': 'F', 'u': 'U', '': 'U'}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+COLUMNS = ('type', 'first_name', 'last_name', 'birth_date', 'gender', 'notes',
+           'username', 'email', 'password', 'parent_first_name', 'parent_last_name')
+
+
+class ImportValidationError(Exception):
+    """Файл не прошёл проверку; errors — список (номер строки, сообщение)."""
+
+    def __init__(self, errors):
+        super().__init__(f'Ошибок в файле: {len(errors)}')
+        self.errors = errors
+
+
+class ImportResult:
+    def __init__(self, parents=0, adults=0, children=0, subscriptions=0):
+        self.parents = parents
+        self.adults = adults
+        self.children = children
+        self.subscriptions = subscriptions
+
+    def __str__(self):
+        return (f'Родителей: {self.parents}, взрослых учеников: {self.adults}, '
+                f'учеников: {self.children}, абонементов: {self.subscriptions}')
+
+
+def read_rows(data):
+    """Строки CSV как словари; data — bytes или str. Разделитель — «,» или «;»."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    data = data.lstrip('\ufeff')
+    first_line = data.split('\n', 1)[0]
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    reader = csv.DictReader(io.StringIO(data), delimiter=delimiter)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for row in reader:
+        yield {key: (value or '').strip() for key, value in row.items() if key}
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+class _Plan:
+    """Проверенный файл: что и в каком порядке создавать."""
+
+    def __init__(self):
+        self.new_parents = {}  # username → dict(email, password, first_name, last_name)
+        self.existing_parents = {}  # username → User.id
+        self.adults = {}  # username → dict(...)
+        self.children = []  # dict(child fields, parent_username | adult_username)
+
+
+def validate(rows):
+    """Проверяет строки целиком и возвращает план импорта или бросает ImportValidationError."""
+    rows = list(rows)
+    errors = []
+    plan = _Plan()
+    usernames = {r.get('username') for r in rows if r.get('username')}
+    existing = {u.username: u for u in User.objects.filter(username__in=usernames).prefetch_related('groups')}
+    username_field = User._meta.get_field('username')
+
+    def error(line, message):
+        if len(errors) < MAX_ERRORS:
+            errors.append((line, message))
+
+    def check_password(line, username, account):
+        try:
+            validate_password(account['password'], _new_user(username, account, ''))
+        except ValidationError as exc:
+            error(line, f'Пароль для «{username}»: {" ".join(exc.messages)}')
+
+    if rows and 'first_name' not in rows[0]:
+        raise ImportValidationError([(1, f'Нет столбца first_name. Ожидаются: {", ".join(COLUMNS)}')])
+
+    for line, row in enumerate(rows, start=2):
+        kind = TYPES.get(row.get('type', '').lower() or CHILD)
+        if kind is None:
+            error(line, f'Неизвестный тип ученика «{row["type"]}»')
+            continue
+        if not row.get('first_name'):
+            error(line, 'Не указано имя ученика')
+        if len(row.get('first_name', '')) > 100 or len(row.get('last_name', '')) > 100:
+            error(line, 'Имя или фамилия длиннее 100 символов')
+        birth_date = None
+        if row.get('birth_date'):
+            try:
+                birth_date = _parse_date(row['birth_date'])
+            except ValueError:
+                error(line, f'Неверная дата рождения «{row["birth_date"]}»')
+        gender = GENDERS.get(row.get('gender', '').lower())
+        if gender is None:
+            error(line, f'Неизвестный пол «{row["gender"]}»')
+
+        username = row.get('username', '')
+        email = row.get('email', '')
+        password = row.get('password', '')
+        if not username:
+            error(line, 'Не указан логин ' + ('родителя' if kind == CHILD else 'взрослого'))
+            continue
+        try:
+            username_field.run_validators(username)
+        except ValidationError as exc:
+            error(line, f'Логин «{username}»: {" ".join(exc.messages)}')
+        if email:
+            try:
+                validate_email(email)
+            except ValidationError:
+                error(line, f'Неверный email «{email}»')
+
+        child = {
+            'first_name': row.get('first_name', ''),
+            'last_name': row.get('last_name', ''),
+            'birth_date': birth_date,
+            'gender': gender or 'U',
+            'notes': row.get('notes', ''),
+            'is_adult': kind == ADULT,
+        }
+        account = {
+            'email': email, 'password': password,
+            'first_name': row.get('parent_first_name', '') if kind == CHILD else child['first_name'],
+            'last_name': row.get('parent_last_name', '') if kind == CHILD else child['last_name'],
+        }
+
+        if kind == ADULT:
+            if username in existing or username in plan.adults or username in plan.new_parents:
+                error(line, f'Логин «{username}» уже занят')
+            elif not password:
+                error(line, 'Не указан пароль взрослого')
+            else:
+                check_password(line, username, account)
+                plan.adults[username] = account
+            child['adult_username'] = username
+        else:
+            user = existing.get(username)
+            if user is not None:
+                if not any(g.name == 'Parent' for g in user.groups.all()):
+                    error(line, f'Пользователь «{username}» существует, но не родитель')
+                else:
+                    plan.existing_parents[username] = user.id
+            elif username in plan.adults:
+                error(line, f'Логин «{username}» уже занят взрослым учеником')
+            elif username in plan.new_parents:
+                known = plan.new_parents[username]
+                if password and password != known['password']:
+                    error(line, f'Для родителя «{username}» указаны разные пароли')
+            elif not password:
+                error(line, f'Не указан пароль нового родителя «{username}»')
+            else:
+                check_password(line, username, account)
+                plan.new_parents[username] = account
+            child['parent_username'] = username
+        plan.children.append(child)
+
+    if not rows:
+        error(1, 'Файл пуст')
+    if errors:
+        raise ImportValidationError(errors)
+    return plan
+
+
+POOL_WORKERS = os.cpu_count() or 1
+
+
+def _new_pool(workers):
+    # spawn, а не fork: веб-сервер многопоточный, копировать его процесс нельзя.
+    # Новому процессу нужен настроенный Django; initializer — сам django.setup,
+    # а не функция отсюда: её распаковка импортировала бы модели до setup()
+    return ProcessPoolExecutor(max_workers=workers, initializer=django.setup,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+@functools.cache
+def _shared_pool():
+    """Общий пул процесса: создаётся при первом большом импорте и дальше переиспользуется."""
+    pool = _new_pool(POOL_WORKERS)
+    atexit.register(pool.shutdown)
+    return pool
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password для каждого пароля; при большом числе — в пуле процессов.
+
+    workers=None — общий пул модуля; другое число (import_students --workers)
+    — отдельный пул на время вызова.
+    """
+    passwords = list(passwords)
+    if len(passwords) < MIN_PARALLEL_PASSWORDS or workers == 1:
+        return [make_password(p) for p in passwords]
+    if workers is None:
+        chunksize = max(1, len(passwords) // (POOL_WORKERS * 4))
+        return list(_shared_pool().map(make_password, passwords, chunksize=chunksize))
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with _new_pool(workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def _new_user(username, account, password_hash):
+    return User(username=username, email=account['email'], password=password_hash,
+                first_name=account['first_name'][:150], last_name=account['last_name'][:150],
+                is_staff=False)
+
+
+def import_rows(rows, workers=None, dry_run=False):
+    """Импортирует строки CSV. Возвращает ImportResult; при ошибках — ImportValidationError."""
+    plan = validate(rows)
+    result = ImportResult(parents=len(plan.new_parents), adults=len(plan.adults), children=len(plan.children))
+    if dry_run:
+        return result
+
+    accounts = list(plan.new_parents.items()) + list(plan.adults.items())
+    hashes = hash_passwords([account['password'] for _, account in accounts], workers=workers)
+
+    with transaction.atomic():
+        parent_group, _ = Group.objects.get_or_create(name='Parent')
+        student_group, _ = Group.objects.get_or_create(name='Student')
+        users = User.objects.bulk_create(
+            [_new_user(username, account, h) for (username, account), h in zip(accounts, hashes)],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = {user.username: user.id for user in users}
+        user_ids.update(plan.existing_parents)
+        Membership = User.groups.through
+        Membership.objects.bulk_create(
+            [Membership(user_id=user_ids[u], group_id=parent_group.id) for u in plan.new_parents]
+            + [Membership(user_id=user_ids[u], group_id=student_group.id) for u in plan.adults],
+            batch_size=BATCH_SIZE,
+        )
+
+        children = []
+        for data in plan.children:
+            child = Child(
+                first_name=data['first_name'], last_name=data['last_name'], birth_date=data['birth_date'],
+                gender=data['gender'], notes=data['notes'], is_adult=data['is_adult'],
+                parent_id=user_ids.get(data.get('parent_username')),
+                account_user_id=user_ids.get(data.get('adult_username')),
+            )
+            # bulk_create не вызывает Child.save()
+            child.birthday_key = birthday_key(child.birth_date)
+            children.append(child)
+        children = Child.objects.bulk_create(children, batch_size=BATCH_SIZE)
+
+        # абонемент по умолчанию — как при создании ученика через форму
+        sub_type = SubscriptionType.objects.first()
+        if sub_type is not None:
+            subscriptions = Subscription.objects.bulk_create(
+                [Subscription(child_id=child.id, sub_type=sub_type, lessons_remaining=sub_type.lessons_count,
+                              price=sub_type.price, paid=False) for child in children],
+                batch_size=BATCH_SIZE,
+            )
+            LedgerEntry.objects.bulk_create(
+                [LedgerEntry(subscription_id=s.id, kind=LedgerEntry.OPENING, delta=s.lessons_remaining)
+                 for s in subscriptions],
+                batch_size=BATCH_SIZE,
+            )
+            result.subscriptions = len(subscriptions)
+
+        search.index_children([child.id for child in children])
+    invalidate_birthdays()
+    invalidate_roles(*user_ids.values())
+    return result
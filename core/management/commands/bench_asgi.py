@@ -0,0 +1,150 @@
+import asyncio
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.bench import throwaway_database
+from core.models import Child, Subscription, SubscriptionType, TrainingSession
+
+
+def percentile(values, share):
+    values = sorted(values) or [0]
+    return values[min(len(values) - 1, max(0, int(len(values) * share + 0.5) - 1))]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает синхронные виды (WSGI) и асинхронные (ASGI, core.async_views) на читающих '
+            'страницах под параллельной нагрузкой: запросов в секунду и p99. Запросы идут '
+            'в обработчики Django внутри процесса, без HTTP-сервера')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='потоков для WSGI и одновременных корутин для ASGI')
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--families', type=int, default=30)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            # файловая база: потоки WSGI работают каждый со своим соединением
+            with throwaway_database(name=Path(tmp) / 'bench_asgi.sqlite3'):
+                users = self._seed(options['families'])
+                pages = self._pages()
+                wsgi = self._run_wsgi(users, pages, options['concurrency'], options['seconds'])
+                with override_settings(ROOT_URLCONF='config.asgi_urls'):
+                    asgi = asyncio.run(self._run_asgi(users, pages, options['concurrency'], options['seconds']))
+                connection.close()
+        self._report('WSGI (core.views)', wsgi, options['seconds'])
+        self._report('ASGI (core.async_views)', asgi, options['seconds'])
+
+    def _seed(self, families):
+        parent_group, _ = Group.objects.get_or_create(name='Parent')
+        student_group, _ = Group.objects.get_or_create(name='Student')
+        sub_type = SubscriptionType.objects.create(name='Bench', lessons_count=8, price=100)
+        users = []
+        children = []
+        for i in range(families):
+            parent = User.objects.create_user(username=f'bench_parent{i}')
+            parent.groups.add(parent_group)
+            children += [Child.objects.create(first_name=f'Kid{i}_{n}', parent=parent) for n in range(2)]
+            student = User.objects.create_user(username=f'bench_student{i}')
+            student.groups.add(student_group)
+            children.append(Child.objects.create(first_name=f'Adult{i}', is_adult=True, account_user=student))
+            users += [parent, student]
+        Subscription.objects.bulk_create(
+            Subscription(child=child, sub_type=sub_type, lessons_remaining=5) for child in children
+        )
+        # два занятия в день на полтора месяца вокруг сегодняшнего дня
+        today = timezone.make_aware(timezone.datetime.combine(timezone.localdate(), timezone.datetime.min.time()))
+        for day in range(-21, 21):
+            for hour in (17, 19):
+                session = TrainingSession.objects.create(
+                    start=today + timedelta(days=day, hours=hour), capacity=len(children))
+                session.participants.add(*children[(day + hour) % 3::3])
+        return users
+
+    def _pages(self):
+        return {
+            'parent': [reverse('schedule_month'), reverse('my_schedule'), reverse('my_children')],
+            'student': [reverse('schedule_month'), reverse('my_schedule'), reverse('my_subscription')],
+            'anonymous': [reverse('home')],
+        }
+
+    @staticmethod
+    def _urls_for(user, pages):
+        if user is None:
+            return pages['anonymous']
+        return pages['parent'] if user.username.startswith('bench_parent') else pages['student']
+
+    def _run_wsgi(self, users, pages, concurrency, seconds):
+        stats = {'requests': 0, 'errors': 0, 'latency': []}
+        lock = threading.Lock()
+        start = threading.Barrier(concurrency)
+
+        def worker(n):
+            user = users[n % len(users)] if n % 4 else None
+            client = Client()
+            try:
+                if user is not None:
+                    client.force_login(user)
+                urls = self._urls_for(user, pages)
+                start.wait()
+                deadline = time.perf_counter() + seconds
+                i = 0
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    status = client.get(urls[i % len(urls)]).status_code
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        stats['requests'] += 1
+                        stats['errors'] += status != 200
+                        stats['latency'].append(elapsed)
+                    i += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    async def _run_asgi(self, users, pages, concurrency, seconds):
+        stats = {'requests': 0, 'errors': 0, 'latency': []}
+        clients = []
+        for n in range(concurrency):
+            user = users[n % len(users)] if n % 4 else None
+            client = AsyncClient()
+            if user is not None:
+                await client.aforce_login(user)
+            clients.append((client, self._urls_for(user, pages)))
+        deadline = time.perf_counter() + seconds
+
+        async def worker(client, urls):
+            i = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                status = (await client.get(urls[i % len(urls)])).status_code
+                stats['latency'].append(time.perf_counter() - started)
+                stats['requests'] += 1
+                stats['errors'] += status != 200
+                i += 1
+
+        await asyncio.gather(*(worker(client, urls) for client, urls in clients))
+        return stats
+
+    def _report(self, title, stats, seconds):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(f'  запросов/с: {stats["requests"] / seconds:.0f}, '
+                          f'p50: {percentile(stats["latency"], 0.5) * 1000:.1f} мс, '
+                          f'p99: {percentile(stats["latency"], 0.99) * 1000:.1f} мс, '
+                          f'не 200: {stats["errors"]}')
@@ -0,0 +1,47 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.bench import explain, throwaway_database, timed
+from core.calendars import month_range
+from core.models import TrainingSession
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает выборку занятий за месяц: start__year/start__month против in_local_range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self._seed(options['sessions'])
+            year, month = 2024, 6
+            date_from, date_to = month_range(year, month)
+
+            variants = [
+                ('start__year/start__month', TrainingSession.objects.filter(start__year=year, start__month=month)),
+                ('start__date__gte/lte', TrainingSession.objects.filter(start__date__gte=date_from,
+                                                                        start__date__lte=date_to)),
+                ('in_local_range', TrainingSession.objects.in_local_range(date_from, date_to)),
+            ]
+            for title, qs in variants:
+                ms = timed(lambda: list(qs.all()), repeat=options['repeat'])
+                self.stdout.write(self.style.MIGRATE_HEADING(title))
+                for line in explain(qs):
+                    self.stdout.write(f'  plan: {line}')
+                self.stdout.write(f'  rows: {qs.count()}, лучшее время: {ms:.1f} мс')
+
+    def _seed(self, count):
+        self.stdout.write(f'Создаём {count} занятий...')
+        rng = random.Random(42)
+        base = timezone.make_aware(timezone.datetime(2020, 1, 1, 9, 0))
+        span_minutes = 6 * 365 * 24 * 60
+        TrainingSession.objects.bulk_create(
+            (TrainingSession(start=base + timedelta(minutes=rng.randrange(span_minutes)))
+             for _ in range(count)),
+            batch_size=5000,
+        )
@@ -0,0 +1,110 @@
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from core.bench import throwaway_database
+from core.models import Child, Subscription, SubscriptionType, TrainingSession
+
+# штатные настройки Django: журнал DELETE, DEFERRED-транзакции, timeout 5 с
+STOCK_OPTIONS = {}
+
+
+class Command(BaseCommand):
+    help = ('Нагружает файловую SQLite читателями и писателями в потоках: '
+            'штатные настройки против настроек из settings.DATABASES')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--sessions', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        variants = [
+            ('штатный sqlite3', STOCK_OPTIONS),
+            ('WAL + IMMEDIATE + PRAGMA', settings.DATABASES['default'].get('OPTIONS', {})),
+        ]
+        saved_options = connection.settings_dict.get('OPTIONS', {})
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                for i, (title, db_options) in enumerate(variants):
+                    connection.close()
+                    connection.settings_dict['OPTIONS'] = dict(db_options)
+                    with throwaway_database(name=Path(tmp) / f'bench_{i}.sqlite3'):
+                        self._seed(options['sessions'])
+                        stats = self._run(options['readers'], options['writers'], options['seconds'])
+                        connection.close()
+                    self._report(title, stats, options['seconds'])
+        finally:
+            connection.settings_dict['OPTIONS'] = saved_options
+
+    def _seed(self, count):
+        sub_type = SubscriptionType.objects.create(name='Bench', lessons_count=8, price=100)
+        children = Child.objects.bulk_create(Child(first_name=f'Bench{i}') for i in range(50))
+        Subscription.objects.bulk_create(
+            Subscription(child=child, sub_type=sub_type, lessons_remaining=8) for child in children
+        )
+        base = timezone.make_aware(timezone.datetime(2024, 1, 1, 9, 0))
+        TrainingSession.objects.bulk_create(
+            (TrainingSession(start=base + timedelta(hours=3 * i)) for i in range(count)),
+            batch_size=1000,
+        )
+
+    def _run(self, readers, writers, seconds):
+        stats = {'reads': 0, 'writes': 0, 'errors': 0, 'latency': []}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+        sub_ids = list(Subscription.objects.values_list('pk', flat=True))
+
+        def read():
+            TrainingSession.objects.in_local_range(date(2024, 3, 1), date(2024, 3, 31)).count()
+
+        def write(n):
+            # чтение и запись в одной транзакции — как add_visit/issue_subscription;
+            # в DEFERRED-режиме на повышении блокировки SQLite отвечает ошибкой сразу
+            pk = sub_ids[n % len(sub_ids)]
+            with transaction.atomic():
+                remaining = Subscription.objects.filter(pk=pk).values_list('lessons_remaining', flat=True)[0]
+                Subscription.objects.filter(pk=pk).update(lessons_remaining=remaining + 1)
+
+        def worker(kind, seed):
+            n = seed
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        read() if kind == 'reads' else write(n)
+                    except OperationalError:
+                        with lock:
+                            stats['errors'] += 1
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        stats[kind] += 1
+                        stats['latency'].append(elapsed)
+                    n += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=('reads', i)) for i in range(readers)]
+        threads += [threading.Thread(target=worker, args=('writes', i)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def _report(self, title, stats, seconds):
+        latency = sorted(stats['latency']) or [0]
+        p95 = latency[int(len(latency) * 0.95) - 1 if len(latency) > 1 else 0] * 1000
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(f'  чтений/с: {stats["reads"] / seconds:.0f}, '
+                          f'записей/с: {stats["writes"] / seconds:.0f}, '
+                          f'ошибок блокировки: {stats["errors"]}, p95: {p95:.1f} мс')
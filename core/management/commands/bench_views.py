@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import (
+    BUDGETS_PATH, ROLES, SEED_CHILDREN, SEED_PARENTS, SEED_SESSIONS, Fixtures, budgets_from, check_budgets,
+    load_budgets, measure_views, seed, throwaway_database,
+)
+
+
+class Command(BaseCommand):
+    help = ('Обходит все URL из core/urls.py под каждой ролью и сверяет число запросов и время '
+            'ответа с бюджетом core/bench_budgets.json; при превышении завершается с ошибкой')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='доля объёмов seed_bench для временной базы; цели времени — для 1.0')
+        parser.add_argument('--current-db', action='store_true',
+                            help='мерить на текущей базе (заполненной seed_bench), а не на временной')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--role', action='append', choices=ROLES, help='только эти роли')
+        parser.add_argument('--budgets', default=str(BUDGETS_PATH))
+        parser.add_argument('--no-latency', action='store_true', help='проверять только число запросов')
+        parser.add_argument('--write-budgets', action='store_true',
+                            help='записать в файл бюджета замеренное число запросов и целевое время '
+                                 '(core.bench.TARGET_MS) вместо проверки')
+
+    def handle(self, *args, **options):
+        if options['current_db']:
+            measurements = self._measure(options)
+        else:
+            with throwaway_database():
+                scale = options['scale']
+                self.stdout.write(f'Заполняем временную базу (scale={scale})...')
+                seed(children=int(SEED_CHILDREN * scale), parents=int(SEED_PARENTS * scale),
+                     sessions=int(SEED_SESSIONS * scale))
+                measurements = self._measure(options)
+
+        self.stdout.write(f'{"роль":<10} {"URL":<28} {"код":>4} {"запр.":>6} {"SQL, мс":>8} {"всего, мс":>10}')
+        for m in measurements:
+            self.stdout.write(f'{m.role:<10} {m.name:<28} {m.status:>4} {m.queries:>6} '
+                              f'{m.sql_ms:>8.1f} {m.wall_ms:>10.1f}')
+
+        if options['write_budgets']:
+            with open(options['budgets'], 'w', encoding='utf-8') as f:
+                json.dump(budgets_from(measurements), f, ensure_ascii=False, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Бюджет записан в {options["budgets"]}'))
+            return
+
+        problems = check_budgets(measurements, load_budgets(options['budgets']),
+                                 latency=not options['no_latency'])
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f'Превышений бюджета: {len(problems)}')
+        self.stdout.write(self.style.SUCCESS(f'Все {len(measurements)} замеров в пределах бюджета'))
+
+    def _measure(self, options):
+        return measure_views(Fixtures(), roles=options['role'] or ROLES, repeat=options['repeat'])
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exports
+from core.calendars import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Выгружает учеников, абонементы или посещения в CSV/XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default=exports.CSV)
+        parser.add_argument('--output', '-o', help='Файл; по умолчанию — stdout')
+        parser.add_argument('--from', dest='date_from', help='Начало диапазона (ГГГГ-ММ-ДД) для посещений')
+        parser.add_argument('--to', dest='date_to', help='Конец диапазона (ГГГГ-ММ-ДД) для посещений')
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options['date_from'])
+        date_to = parse_date(options['date_to'], date_from)
+        if options['date_from'] and date_from is None or options['date_to'] and date_to is None:
+            raise CommandError('Даты указываются в формате ГГГГ-ММ-ДД')
+        export = exports.EXPORTS[options['name']]
+        chunks = exports.stream(export, options['format'], date_from, date_to)
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+            self.stderr.write(f'Сохранено в {options["output"]}')
+        else:
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import COLUMNS, ImportValidationError, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = f'Импортирует родителей и учеников из CSV (столбцы: {", ".join(COLUMNS)})'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Процессов для хэширования паролей (по умолчанию — число ядер)')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл')
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as f:
+            data = f.read()
+        started = time.perf_counter()
+        try:
+            result = import_rows(read_rows(data), workers=options['workers'], dry_run=options['dry_run'])
+        except ImportValidationError as exc:
+            for line, message in exc.errors:
+                self.stderr.write(f'Строка {line}: {message}')
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+        prefix = 'Проверено' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} за {elapsed:.1f} с. {result}'))
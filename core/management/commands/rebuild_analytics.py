@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводки посещаемости (заполненность слотов и занятия учеников по месяцам)'
+
+    def handle(self, *args, **options):
+        slots, months = analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Слотов: {slots}, строк учеников по месяцам: {months}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import revenue
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает помесячную сводку выручки (RevenueRollup) из журнала оплат'
+
+    def handle(self, *args, **options):
+        count = revenue.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Строк сводки: {count}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс учеников (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write('Полнотекстовый индекс доступен только на SQLite — пропускаем')
+            return
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано учеников: {count}'))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import LedgerEntry, Subscription
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает остатки абонементов по журналу (LedgerEntry) порциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        last_pk = 0
+        checked = fixed = adjusted = 0
+        while True:
+            with transaction.atomic():
+                subs = list(Subscription.objects
+                            .select_for_update()
+                            .filter(pk__gt=last_pk)
+                            .order_by('pk')
+                            .only('pk', 'lessons_remaining')[:chunk_size])
+                if not subs:
+                    break
+                last_pk = subs[-1].pk
+                totals = dict(LedgerEntry.objects
+                              .filter(subscription_id__in=[s.pk for s in subs])
+                              .order_by()
+                              .values_list('subscription_id')
+                              .annotate(total=Sum('delta')))
+                changed = []
+                adjustments = []
+                now = timezone.now()
+                for sub in subs:
+                    total = totals.get(sub.pk, 0)
+                    if total < 0:
+                        # остаток не бывает отрицательным: недостающее дописываем в журнал
+                        # корректировкой, чтобы его сумма по-прежнему равнялась остатку
+                        self.stdout.write(f'Абонемент #{sub.pk}: сумма журнала {total}, корректировка {-total:+d}')
+                        adjustments.append(LedgerEntry(subscription_id=sub.pk, kind=LedgerEntry.ADJUSTMENT,
+                                                       delta=-total, created_at=now))
+                    balance = max(0, total)
+                    if sub.lessons_remaining != balance:
+                        self.stdout.write(f'Абонемент #{sub.pk}: {sub.lessons_remaining} → {balance}')
+                        sub.lessons_remaining = balance
+                        sub.updated_at = now
+                        changed.append(sub)
+                if not dry_run:
+                    # bulk_update не вызывает save(), поэтому журнал дописываем сами
+                    if changed:
+                        Subscription.objects.bulk_update(changed, ['lessons_remaining', 'updated_at'])
+                    if adjustments:
+                        LedgerEntry.objects.bulk_create(adjustments)
+                checked += len(subs)
+                fixed += len(changed)
+                adjusted += len(adjustments)
+        verb = 'Расхождений' if dry_run else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено абонементов: {checked}. {verb}: {fixed}. Корректировок журнала: {adjusted}.'))
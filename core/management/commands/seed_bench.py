@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import SEED_CHILDREN, SEED_PARENTS, SEED_SESSIONS, seed
+from core.models import Child, TrainingSession
+
+
+class Command(BaseCommand):
+    help = ('Заполняет текущую базу данными для бенчмарков: ученики, родители, занятия с '
+            'участниками и год оплат (по умолчанию 10k учеников, 2k родителей, 100k занятий)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--children', type=int, default=SEED_CHILDREN)
+        parser.add_argument('--parents', type=int, default=SEED_PARENTS)
+        parser.add_argument('--sessions', type=int, default=SEED_SESSIONS)
+        parser.add_argument('--scale', type=float, default=1.0, help='множитель всех объёмов')
+        parser.add_argument('--seed', type=int, default=1, help='зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        if Child.objects.exists() or TrainingSession.objects.exists():
+            raise CommandError('База не пуста: seed_bench заполняет только пустую базу')
+        scale = options['scale']
+        started = time.perf_counter()
+        seed(
+            children=max(1, int(options['children'] * scale)),
+            parents=max(1, int(options['parents'] * scale)),
+            sessions=max(1, int(options['sessions'] * scale)),
+            random_seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.0f} с'))
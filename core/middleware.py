@@ -1,22 +1,82 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 
+from .roles import aget_roles, get_roles
 
-class ForcePasswordChangeMiddleware:
-    """Перенаправляет на смену пароля, если она обязательна."""
+
+class _SyncAndAsyncMiddleware:
+    """Основа middleware, работающих и под WSGI, и под ASGI.
+
+    Под ASGI цепочка остаётся асинхронной только если асинхронны все
+    middleware; иначе каждый запрос переключался бы в поток и обратно.
+    """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process(request)
+
+    def process(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class ForcePasswordChangeMiddleware(_SyncAndAsyncMiddleware):
+    """Перенаправляет на смену пароля, если она обязательна."""
+
+    def _redirect(self, request):
+        allowed = {
+            reverse('password_change'),
+            reverse('password_change_done'),
+            reverse('logout'),
+        }
+        static_url = '/' + settings.STATIC_URL.lstrip('/')
+        if request.path not in allowed and not request.path.startswith(static_url):
+            return redirect('password_change')
+        return None
+
+    def process(self, request):
         if request.user.is_authenticated and request.session.get('force_password_change'):
-            allowed = {
-                reverse('password_change'),
-                reverse('password_change_done'),
-                reverse('logout'),
-            }
-            static_url = '/' + settings.STATIC_URL.lstrip('/')
-            if request.path not in allowed and not request.path.startswith(static_url):
-                return redirect('password_change')
+            response = self._redirect(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        if user.is_authenticated and await request.session.aget('force_password_change'):
+            response = self._redirect(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+
+class RolesMiddleware(_SyncAndAsyncMiddleware):
+    """Добавляет ленивый request.roles — роли пользователя на время запроса.
+
+    Под ASGI пользователь и роли загружаются сразу через async ORM: ленивые
+    request.user и request.roles обратились бы к базе синхронно из цикла
+    событий (в шаблонах, декораторах, версиях страниц).
+    """
+
+    def process(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request.user))
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.user = await request.auser()
+        request.roles = await aget_roles(request.user)
+        return await self.get_response(request)
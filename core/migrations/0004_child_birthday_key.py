@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+def fill_birthday_key(apps, schema_editor):
+    Child = apps.get_model('core', 'Child')
+    children = list(Child.objects.filter(birth_date__isnull=False).only('id', 'birth_date'))
+    for child in children:
+        child.birthday_key = child.birth_date.month * 100 + child.birth_date.day
+    Child.objects.bulk_update(children, ['birthday_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_child_options_child_account_user_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='child',
+            name='birthday_key',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_birthday_key, migrations.RunPython.noop),
+    ]
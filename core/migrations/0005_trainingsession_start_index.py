@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_child_birthday_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trainingsession',
+            index=models.Index(fields=['start'], name='core_session_start_idx'),
+        ),
+        # Автоматическая through-таблица участников: индекс в порядке
+        # (child_id, trainingsession_id) покрывает выборки «занятия ребёнка».
+        migrations.RunSQL(
+            'CREATE INDEX core_session_participants_child_idx '
+            'ON core_trainingsession_participants (child_id, trainingsession_id);',
+            'DROP INDEX core_session_participants_child_idx;',
+        ),
+    ]
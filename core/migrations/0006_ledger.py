@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    Subscription = apps.get_model('core', 'Subscription')
+    LedgerEntry = apps.get_model('core', 'LedgerEntry')
+    entries = (
+        LedgerEntry(subscription_id=pk, kind='opening', delta=remaining)
+        for pk, remaining in Subscription.objects.values_list('pk', 'lessons_remaining').iterator()
+    )
+    LedgerEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_trainingsession_start_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Начальный остаток'), ('visit', 'Посещение'), ('topup', 'Пополнение'), ('adjustment', 'Корректировка')], max_length=16)),
+                ('delta', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='core.trainingsession')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='core.subscription')),
+            ],
+            options={
+                'verbose_name': 'Движение по абонементу',
+                'verbose_name_plural': 'Журнал абонементов',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['subscription', 'created_at'], name='core_ledger_sub_created_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
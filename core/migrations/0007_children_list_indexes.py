@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='child',
+            index=models.Index(fields=['first_name', 'last_name', 'id'], name='core_child_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['lessons_remaining'], name='core_sub_remaining_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['paid'], name='core_sub_paid_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_child_fts USING fts5("
+    "name, notes, account, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+FILL_SQL = """
+INSERT INTO core_child_fts (rowid, name, notes, account)
+SELECT c.id,
+       replace(replace(trim(c.first_name || ' ' || c.last_name), 'ё', 'е'), 'Ё', 'Е'),
+       replace(replace(c.notes, 'ё', 'е'), 'Ё', 'Е'),
+       trim(coalesce(p.username, '') || ' ' || coalesce(p.email, '') || ' ' ||
+            coalesce(a.username, '') || ' ' || coalesce(a.email, ''))
+FROM core_child c
+LEFT JOIN auth_user p ON p.id = c.parent_id
+LEFT JOIN auth_user a ON a.id = c.account_user_id
+"""
+
+
+def create_index(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других СУБД поиск работает через icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(FILL_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS core_child_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0007_children_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_child_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='trainingsession',
+            name='core_session_start_idx',
+        ),
+        migrations.AddField(
+            model_name='child',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='trainingsession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='trainingsession',
+            index=models.Index(fields=['start', 'updated_at'], name='core_session_start_upd_idx'),
+        ),
+    ]
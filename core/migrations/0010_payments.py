@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('sub_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='core.subscriptiontype')),
+                ('subscription', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='core.subscription')),
+            ],
+            options={
+                'verbose_name': 'Оплата',
+                'verbose_name_plural': 'Оплаты',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('payments', models.PositiveIntegerField(default=0)),
+                ('sub_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue', to='core.subscriptiontype')),
+            ],
+            options={
+                'verbose_name': 'Выручка за месяц',
+                'verbose_name_plural': 'Выручка по месяцам',
+                'ordering': ['month', 'sub_type'],
+                'constraints': [models.UniqueConstraint(fields=('month', 'sub_type'), name='core_revenue_month_type_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:41
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_rollups(apps, schema_editor):
+    TrainingSession = apps.get_model('core', 'TrainingSession')
+    SlotOccupancy = apps.get_model('core', 'SlotOccupancy')
+    ChildMonthAttendance = apps.get_model('core', 'ChildMonthAttendance')
+    Participants = TrainingSession.participants.through
+
+    def slot(start):
+        local = timezone.localtime(start)
+        return local.date(), local.time()
+
+    sessions = Counter(slot(start) for start in TrainingSession.objects.values_list('start', flat=True))
+    participants = Counter()
+    months = Counter()
+    for start, child_id in Participants.objects.values_list('trainingsession__start', 'child_id'):
+        participants[slot(start)] += 1
+        months[(child_id, timezone.localdate(start).replace(day=1))] += 1
+    SlotOccupancy.objects.bulk_create(
+        [SlotOccupancy(day=day, start_time=start_time, sessions=n, participants=participants[(day, start_time)])
+         for (day, start_time), n in sessions.items()],
+        batch_size=500,
+    )
+    ChildMonthAttendance.objects.bulk_create(
+        [ChildMonthAttendance(child_id=child_id, month=month, sessions=n) for (child_id, month), n in months.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_payments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('participants', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Заполненность слота',
+                'verbose_name_plural': 'Заполненность слотов',
+                'ordering': ['day', 'start_time'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'start_time'), name='core_slot_occupancy_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChildMonthAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('child', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_attendance', to='core.child')),
+            ],
+            options={
+                'verbose_name': 'Посещаемость за месяц',
+                'verbose_name_plural': 'Посещаемость по месяцам',
+                'ordering': ['month', 'child'],
+                'indexes': [models.Index(fields=['month'], name='core_child_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('child', 'month'), name='core_child_month_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
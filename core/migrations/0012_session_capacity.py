@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_participants(apps, schema_editor):
+    TrainingSession = apps.get_model('core', 'TrainingSession')
+    links = (TrainingSession.participants.through.objects
+             .filter(trainingsession_id=OuterRef('pk'))
+             .order_by()
+             .values('trainingsession_id')
+             .annotate(n=Count('*'))
+             .values('n'))
+    TrainingSession.objects.update(participant_count=Coalesce(Subquery(links), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_attendance_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingsession',
+            name='capacity',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Мест'),
+        ),
+        migrations.AddField(
+            model_name='trainingsession',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_participants, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trainingsession',
+            constraint=models.CheckConstraint(condition=models.Q(('capacity__isnull', True), ('participant_count__lte', models.F('capacity')), _connector='OR'), name='core_session_capacity_check'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:53
+
+import django.core.validators
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def fill_end(apps, schema_editor):
+    TrainingSession = apps.get_model('core', 'TrainingSession')
+    batch = []
+    for session in TrainingSession.objects.only('id', 'start', 'duration_minutes').iterator(chunk_size=2000):
+        session.end = session.start + timedelta(minutes=session.duration_minutes)
+        batch.append(session)
+        if len(batch) >= 2000:
+            TrainingSession.objects.bulk_update(batch, ['end'])
+            batch = []
+    if batch:
+        TrainingSession.objects.bulk_update(batch, ['end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_session_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingsession',
+            name='end',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_end, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='trainingsession',
+            name='end',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='trainingsession',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=60, validators=[django.core.validators.MaxValueValidator(720)]),
+        ),
+        migrations.AddIndex(
+            model_name='trainingsession',
+            index=models.Index(fields=['start', 'end'], name='core_session_interval_idx'),
+        ),
+    ]
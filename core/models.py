@@ -1,7 +1,22 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DEFERRED
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.validators import MaxValueValidator
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+
+
+def birthday_key(birth_date):
+    """Ключ дня рождения вида MMDD (например, 0315 → 315) для индексного поиска."""
+    if birth_date is None:
+        return None
+    return birth_date.month * 100 + birth_date.day
+
+
+BIRTHDAY_FIELDS = ('birth_date', 'first_name', 'last_name')
+
 
 class Child(models.Model):
     GENDER_CHOICES = (('M', 'Мальчик'), ('F', 'Девочка'), ('U', 'Не указано'))
@@ -15,15 +30,40 @@ class Child(models.Model):
     birth_date = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, default='U')
     notes = models.TextField(blank=True)
+    # денормализованный месяц+день рождения для выборки ближайших дней рождения
+    birthday_key = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['first_name', 'last_name']
+        indexes = [models.Index(fields=['first_name', 'last_name', 'id'], name='core_child_name_idx')]
         verbose_name = 'Ученик'
         verbose_name_plural = 'Ученики'
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}".strip()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # загруженные значения: кэш дней рождения сбрасывается, только если они изменились
+        instance._birthday_loaded = instance.birthday_values()
+        return instance
+
+    def birthday_values(self):
+        """Поля, которые показывает кэш ближайших дней рождения (core.birthdays).
+
+        Отложенное поле (only/defer) не читается: вместо значения — DEFERRED.
+        """
+        return tuple(self.__dict__.get(name, DEFERRED) for name in BIRTHDAY_FIELDS)
+
+    def save(self, *args, **kwargs):
+        self.birthday_key = birthday_key(self.birth_date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'birth_date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'birthday_key'}
+        super().save(*args, **kwargs)
+
 class SubscriptionType(models.Model):
     name = models.CharField(max_length=100)
     lessons_count = models.PositiveIntegerField(default=8)
@@ -42,8 +82,13 @@ class Subscription(models.Model):
     lessons_remaining = models.PositiveIntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     paid = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['lessons_remaining'], name='core_sub_remaining_idx'),
+            models.Index(fields=['paid'], name='core_sub_paid_idx'),
+        ]
         verbose_name = 'Абонемент'
         verbose_name_plural = 'Абонементы'
 
@@ -59,36 +104,329 @@ class Subscription(models.Model):
     def used_lessons(self):
         return max(0, self.total_lessons - self.lessons_remaining)
 
+    def save(self, *args, ledger_kind=None, **kwargs):
+        """Сохраняет абонемент и записывает изменение остатка в журнал.
+
+        Прежний остаток читается под блокировкой строки в той же транзакции,
+        так что сумма записей журнала всегда равна lessons_remaining.
+        ledger_kind — вид записи для изменения остатка (по умолчанию
+        корректировка).
+        """
+        update_fields = kwargs.get('update_fields')
+        track = update_fields is None or 'lessons_remaining' in update_fields
+        with transaction.atomic():
+            previous = None
+            if track and not self._state.adding:
+                previous = (Subscription.objects.select_for_update()
+                            .filter(pk=self.pk)
+                            .values_list('lessons_remaining', flat=True)
+                            .first())
+            creating = self._state.adding or (track and previous is None)
+            super().save(*args, **kwargs)
+            if creating:
+                LedgerEntry.objects.create(subscription=self, kind=LedgerEntry.OPENING,
+                                           delta=self.lessons_remaining)
+            elif track and self.lessons_remaining != previous:
+                LedgerEntry.objects.create(subscription=self, kind=ledger_kind or LedgerEntry.ADJUSTMENT,
+                                           delta=self.lessons_remaining - previous)
+
     def mark_paid_and_reset(self):
-        self.paid = True
-        self.lessons_remaining = self.total_lessons
-        self.price = self.sub_type.price
-        self.save()
-
-    def add_visit(self):
-        """Уменьшает остаток на 1. Если стал 0 — делает paid=False (красный статус)."""
-        if self.lessons_remaining == 0:
-            return False
-        self.lessons_remaining -= 1
-        if self.lessons_remaining == 0:
-            self.paid = False
-        self.save()
-        return True
+        """Пополняет абонемент до полного и отмечает оплату."""
+        with transaction.atomic():
+            current = (Subscription.objects.select_for_update()
+                       .select_related('sub_type')
+                       .get(pk=self.pk))
+            total = current.sub_type.lessons_count
+            Subscription.objects.filter(pk=self.pk).update(
+                paid=True, lessons_remaining=total, price=current.sub_type.price,
+                updated_at=timezone.now(),
+            )
+            LedgerEntry.objects.create(subscription=self, kind=LedgerEntry.TOPUP,
+                                       delta=total - current.lessons_remaining)
+            Payment.objects.record(current, current.sub_type.price, sub_type=current.sub_type)
+        self.refresh_from_db(fields=['paid', 'lessons_remaining', 'price'])
+
+    def add_visit(self, session=None):
+        """Уменьшает остаток на 1. Если стал 0 — делает paid=False (красный статус).
+
+        Списание — условный UPDATE с F(), поэтому одновременные отметки не
+        теряются и остаток не уходит в минус.
+        """
+        with transaction.atomic():
+            updated = Subscription.objects.filter(pk=self.pk, lessons_remaining__gt=0).update(
+                lessons_remaining=F('lessons_remaining') - 1,
+                # CASE видит значение до вычитания: 1 → станет 0
+                paid=Case(When(lessons_remaining=1, then=Value(False)), default=F('paid')),
+                updated_at=timezone.now(),
+            )
+            if updated:
+                LedgerEntry.objects.create(subscription=self, session=session,
+                                           kind=LedgerEntry.VISIT, delta=-1)
+        self.refresh_from_db(fields=['paid', 'lessons_remaining'])
+        return bool(updated)
+
+# верхняя граница длительности: по ней сужается поиск пересечений
+MAX_SESSION_MINUTES = 12 * 60
+
+
+class TrainingSessionQuerySet(models.QuerySet):
+    def in_local_range(self, date_from, date_to):
+        """Занятия, начинающиеся в локальные дни с date_from по date_to включительно.
+
+        Локальные даты переводятся в aware-границы, поэтому фильтр идёт по
+        самому столбцу start и использует индекс, а не по start__date/__month,
+        которые вычисляются для каждой строки.
+        """
+        tz = timezone.get_current_timezone()
+        lower = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+        upper = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+        return self.filter(start__gte=lower, start__lt=upper)
+
+    def overlapping(self, start, end):
+        """Занятия, пересекающиеся с интервалом [start, end).
+
+        Нижняя граница start из MAX_SESSION_MINUTES сужает диапазон индекса
+        (start, end), конец проверяется по тому же индексу.
+        """
+        return self.filter(start__gt=start - timedelta(minutes=MAX_SESSION_MINUTES),
+                           start__lt=end, end__gt=start)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create не вызывает save() — конец занятия заполняем здесь
+        objs = list(objs)
+        for obj in objs:
+            obj.end = obj.compute_end()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class SessionFull(Exception):
+    """В занятии не хватает мест для новых участников."""
+
+    def __init__(self, session_ids):
+        super().__init__('Нет свободных мест в занятии')
+        self.session_ids = session_ids
+
 
 class TrainingSession(models.Model):
     start = models.DateTimeField(default=timezone.now)
-    duration_minutes = models.PositiveIntegerField(default=60)
+    duration_minutes = models.PositiveIntegerField(default=60, validators=[MaxValueValidator(MAX_SESSION_MINUTES)])
+    # start + duration_minutes; хранится для поиска пересечений по индексу (start, end)
+    end = models.DateTimeField(editable=False)
     participants = models.ManyToManyField(Child, related_name='sessions', blank=True)
     notes = models.CharField(max_length=255, blank=True)
+    capacity = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Мест')  # None — без ограничения
+    # число строк участников; ведётся условными UPDATE в core.signals и core.series
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
+    # меняется и при изменении состава участников (см. core.signals)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TrainingSessionQuerySet.as_manager()
 
     class Meta:
         ordering = ['start']
+        # updated_at в индексе: версия диапазона (core.versions) читается из индекса без таблицы
+        indexes = [
+            models.Index(fields=['start', 'updated_at'], name='core_session_start_upd_idx'),
+            models.Index(fields=['start', 'end'], name='core_session_interval_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(capacity__isnull=True) | Q(participant_count__lte=F('capacity')),
+                name='core_session_capacity_check',
+            ),
+        ]
         verbose_name = 'Занятие'
         verbose_name_plural = 'Занятия'
 
     def __str__(self):
         return f"Занятие {self.start:%d.%m.%Y %H:%M} — {self.end:%H:%M}"
 
+    def compute_end(self):
+        return self.start + timedelta(minutes=self.duration_minutes)
+
+    def save(self, *args, **kwargs):
+        self.end = self.compute_end()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start', 'duration_minutes'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'end'}
+        # participant_count меняют только UPDATE с F(): устаревший экземпляр не должен его затирать
+        if not self._state.adding and update_fields is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'participant_count'
+            ]
+        super().save(*args, **kwargs)
+
     @property
-    def end(self):
-        return self.start + timedelta(minutes=self.duration_minutes)
\ No newline at end of file
+    def free_places(self):
+        if self.capacity is None:
+            return None
+        return max(0, self.capacity - self.participant_count)
+
+    @classmethod
+    def reserve(cls, session_ids, places=1):
+        """Занимает places мест в каждом из занятий одним условным UPDATE.
+
+        Мест не хватило хотя бы в одном — SessionFull (вызывать в транзакции,
+        чтобы откатить уже занятые).
+        """
+        session_ids = list(session_ids)
+        updated = (cls.objects
+                   .filter(pk__in=session_ids)
+                   .filter(Q(capacity__isnull=True) | Q(participant_count__lte=F('capacity') - places))
+                   .update(participant_count=F('participant_count') + places))
+        if updated != len(session_ids):
+            raise SessionFull(session_ids)
+
+    @classmethod
+    def recount(cls, session_ids):
+        """Пересчитывает participant_count по таблице участников (после удалений)."""
+        links = (cls.participants.through.objects
+                 .filter(trainingsession_id=OuterRef('pk'))
+                 .order_by()
+                 .values('trainingsession_id')
+                 .annotate(n=Count('*'))
+                 .values('n'))
+        cls.objects.filter(pk__in=list(session_ids)).update(
+            participant_count=Coalesce(Subquery(links), 0),
+        )
+
+
+class LedgerEntry(models.Model):
+    """Движение по абонементу: посещение, пополнение или корректировка остатка.
+
+    Журнал только дополняется; сумма delta по абонементу равна его остатку
+    (см. команду recompute_balances).
+    """
+    OPENING = 'opening'
+    VISIT = 'visit'
+    TOPUP = 'topup'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = (
+        (OPENING, 'Начальный остаток'),
+        (VISIT, 'Посещение'),
+        (TOPUP, 'Пополнение'),
+        (ADJUSTMENT, 'Корректировка'),
+    )
+
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='ledger')
+    session = models.ForeignKey(TrainingSession, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='ledger_entries')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    delta = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [models.Index(fields=['subscription', 'created_at'], name='core_ledger_sub_created_idx')]
+        verbose_name = 'Движение по абонементу'
+        verbose_name_plural = 'Журнал абонементов'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.delta:+d} — {self.subscription.child}"
+
+
+def revenue_month(moment):
+    """Первое число локального месяца, к которому относится момент оплаты."""
+    return timezone.localdate(moment).replace(day=1)
+
+
+class PaymentManager(models.Manager):
+    def record(self, subscription, amount, sub_type=None, created_at=None):
+        """Записывает оплату и прибавляет её к помесячной сводке в той же транзакции."""
+        sub_type = sub_type or subscription.sub_type
+        created_at = created_at or timezone.now()
+        with transaction.atomic():
+            payment = self.create(subscription=subscription, sub_type=sub_type,
+                                  amount=amount, created_at=created_at)
+            RevenueRollup.add(revenue_month(created_at), sub_type.pk, amount)
+        return payment
+
+
+class Payment(models.Model):
+    """Оплата абонемента. Журнал только дополняется; из него строится RevenueRollup."""
+    # при удалении ученика оплата остаётся в истории и в выручке
+    subscription = models.ForeignKey(Subscription, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='payments')
+    sub_type = models.ForeignKey(SubscriptionType, on_delete=models.PROTECT, related_name='payments')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = PaymentManager()
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        verbose_name = 'Оплата'
+        verbose_name_plural = 'Оплаты'
+
+    def __str__(self):
+        return f"{self.created_at:%d.%m.%Y} — {self.amount} ({self.sub_type.name})"
+
+
+class RevenueRollup(models.Model):
+    """Выручка и число оплат за месяц по типу абонемента.
+
+    Обновляется вместе с каждой оплатой (Payment.objects.record), поэтому
+    отчёты читают несколько десятков строк сводки, а не весь журнал оплат.
+    Пересобирается командой rebuild_revenue_rollups.
+    """
+    month = models.DateField()  # первое число месяца
+    sub_type = models.ForeignKey(SubscriptionType, on_delete=models.CASCADE, related_name='revenue')
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['month', 'sub_type']
+        constraints = [models.UniqueConstraint(fields=['month', 'sub_type'], name='core_revenue_month_type_uniq')]
+        verbose_name = 'Выручка за месяц'
+        verbose_name_plural = 'Выручка по месяцам'
+
+    def __str__(self):
+        return f"{self.month:%m.%Y} — {self.sub_type.name}: {self.total}"
+
+    @classmethod
+    def add(cls, month, sub_type_id, amount, count=1):
+        """Прибавляет оплату к строке сводки; UPDATE с F(), без чтения строки."""
+        updated = cls.objects.filter(month=month, sub_type_id=sub_type_id).update(
+            total=F('total') + amount, payments=F('payments') + count,
+        )
+        if not updated:
+            cls.objects.create(month=month, sub_type_id=sub_type_id, total=amount, payments=count)
+
+
+class SlotOccupancy(models.Model):
+    """Заполненность слота: число занятий и записей участников в локальный день и час начала.
+
+    Ведётся инкрементально (core.analytics), пересобирается командой
+    rebuild_analytics.
+    """
+    day = models.DateField()
+    start_time = models.TimeField()
+    sessions = models.PositiveIntegerField(default=0)
+    participants = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'start_time']
+        constraints = [models.UniqueConstraint(fields=['day', 'start_time'], name='core_slot_occupancy_uniq')]
+        verbose_name = 'Заполненность слота'
+        verbose_name_plural = 'Заполненность слотов'
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y} {self.start_time:%H:%M}: {self.participants} / {self.sessions}"
+
+
+class ChildMonthAttendance(models.Model):
+    """Сколько занятий ученика пришлось на месяц (по записям в участники)."""
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name='monthly_attendance')
+    month = models.DateField()  # первое число месяца
+    sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['month', 'child']
+        constraints = [models.UniqueConstraint(fields=['child', 'month'], name='core_child_month_uniq')]
+        indexes = [models.Index(fields=['month'], name='core_child_month_idx')]
+        verbose_name = 'Посещаемость за месяц'
+        verbose_name_plural = 'Посещаемость по месяцам'
+
+    def __str__(self):
+        return f"{self.child} — {self.month:%m.%Y}: {self.sessions}"
@@ -0,0 +1,173 @@
+"""Keyset-пагинация: страница выбирается условием по ключу сортировки, а не OFFSET.
+
+Курсор — значения полей сортировки последней (или первой) строки страницы,
+закодированные в base64 JSON. Последнее поле сортировки должно быть
+уникальным (обычно id), иначе строки с одинаковым ключом потеряются.
+
+Курсор приходит из адреса, поэтому каждое значение приводится к типу
+своего поля сортировки; курсор, который не приводится, считается
+отсутствующим (или InvalidCursor при strict=True).
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или не подходит к сортировке (paginate_keyset(strict=True))."""
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Значения курсора или None, если курсор пустой или повреждён."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _split(ordering):
+    return [(f[1:], True) if f.startswith('-') else (f, False) for f in ordering]
+
+
+def _ordering_field(queryset, name):
+    """Поле модели (или выходное поле аннотации) для имени сортировки name."""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    model = queryset.model
+    *path, last = name.split('__')
+    for part in path:
+        model = model._meta.get_field(part).related_model
+    field = model._meta.get_field(last)
+    return field.target_field if field.is_relation else field
+
+
+def cursor_values(queryset, ordering, cursor):
+    """Значения курсора, приведённые к типам полей ordering, или None."""
+    values = decode_cursor(cursor, len(ordering))
+    if values is None:
+        return None
+    coerced = []
+    try:
+        for (name, _), value in zip(_split(ordering), values):
+            if value is not None:
+                field = _ordering_field(queryset, name)
+                value = field.to_python(value)
+                # границы чисел: слишком большое целое SQLite не примет
+                field.run_validators(value)
+            coerced.append(value)
+    except (FieldDoesNotExist, ValidationError, ValueError, TypeError):
+        return None
+    return coerced
+
+
+def keyset_q(ordering, values, after=True):
+    """Q для строк после (after=True) или до курсора в порядке ordering.
+
+    Для ('a', '-b', 'id') и значений (1, 2, 3) после курсора:
+    a > 1 OR (a = 1 AND b < 2) OR (a = 1 AND b = 2 AND id > 3).
+    """
+    q = Q()
+    equal = Q()
+    for (field, desc), value in zip(_split(ordering), values):
+        lookup = 'lt' if desc == after else 'gt'
+        q |= equal & Q(**{f'{field}__{lookup}': value})
+        equal &= Q(**{field: value})
+    return q
+
+
+def _row_value(row, field):
+    if isinstance(row, dict):
+        return row[field]
+    # поле связанной модели: child__first_name → row.child.first_name
+    for part in field.split('__'):
+        row = getattr(row, part)
+    return row
+
+
+def _row_values(row, ordering):
+    return [_row_value(row, field) for field, _ in _split(ordering)]
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _keyset_query(queryset, ordering, per_page, after=None, before=None, strict=False):
+    """Запрос страницы и функция, собирающая из его строк KeysetPage."""
+    ordering = list(ordering)
+    after_values = cursor_values(queryset, ordering, after)
+    before_values = None if after_values else cursor_values(queryset, ordering, before)
+    if strict and (after and after_values is None or not after and before and before_values is None):
+        raise InvalidCursor(after or before)
+
+    if before_values is not None:
+        reverse = [f[1:] if f.startswith('-') else f'-{f}' for f in ordering]
+
+        def before_page(rows):
+            has_more = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            next_cursor = encode_cursor(_row_values(rows[-1], ordering)) if rows else before
+            prev_cursor = encode_cursor(_row_values(rows[0], ordering)) if has_more and rows else None
+            return KeysetPage(rows, next_cursor, prev_cursor)
+
+        query = queryset.filter(keyset_q(ordering, before_values, after=False)).order_by(*reverse)
+        return query[:per_page + 1], before_page
+
+    def after_page(rows):
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(_row_values(rows[-1], ordering)) if has_more else None
+        prev_cursor = encode_cursor(_row_values(rows[0], ordering)) if after_values is not None and rows else None
+        return KeysetPage(rows, next_cursor, prev_cursor)
+
+    if after_values is not None:
+        queryset = queryset.filter(keyset_q(ordering, after_values))
+    return queryset.order_by(*ordering)[:per_page + 1], after_page
+
+
+def paginate_keyset(queryset, ordering, per_page, after=None, before=None, strict=False):
+    """Страница queryset в порядке ordering после курсора after или перед before.
+
+    Возвращает KeysetPage с курсорами соседних страниц; стоит один запрос.
+    Повреждённый курсор даёт первую страницу, а при strict=True — InvalidCursor.
+    """
+    query, page = _keyset_query(queryset, ordering, per_page, after, before, strict)
+    return page(list(query))
+
+
+async def apaginate_keyset(queryset, ordering, per_page, after=None, before=None):
+    """paginate_keyset для асинхронных видов."""
+    query, page = _keyset_query(queryset, ordering, per_page, after, before)
+    return page([row async for row in query])
@@ -0,0 +1,52 @@
+"""Выручка по месяцам и типам абонементов.
+
+Каждая оплата (Payment) сразу прибавляется к строке RevenueRollup за свой
+месяц и тип абонемента, поэтому годовой отчёт — это не больше 12 × число
+типов строк сводки, сколько бы оплат ни накопилось. Журнал оплат остаётся
+источником истины: rebuild() пересобирает сводку из него.
+"""
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Payment, RevenueRollup
+
+ReportRow = namedtuple('ReportRow', 'sub_type cells total payments')
+
+
+def rebuild():
+    """Пересобирает сводку из журнала оплат. Возвращает число строк сводки."""
+    # TruncMonth берёт текущий часовой пояс — тот же локальный месяц, что revenue_month()
+    totals = (Payment.objects.order_by()
+              .annotate(month=TruncMonth('created_at', output_field=DateField()))
+              .values_list('month', 'sub_type_id')
+              .annotate(total=Sum('amount'), n=Count('id')))
+    rows = [RevenueRollup(month=month, sub_type_id=sub_type_id, total=total, payments=n)
+            for month, sub_type_id, total, n in totals]
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        RevenueRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def year_report(year):
+    """Таблица выручки за год: строка на тип абонемента, столбец на месяц.
+
+    Читает только сводку. Возвращает (rows, month_totals, total).
+    """
+    rollups = (RevenueRollup.objects
+               .filter(month__gte=date(year, 1, 1), month__lt=date(year + 1, 1, 1))
+               .select_related('sub_type')
+               .order_by('sub_type__name', 'sub_type_id', 'month'))
+    by_type = {}
+    for rollup in rollups:
+        cells, counts = by_type.setdefault(rollup.sub_type, ([Decimal(0)] * 12, [0]))
+        cells[rollup.month.month - 1] += rollup.total
+        counts[0] += rollup.payments
+    rows = [ReportRow(sub_type, cells, sum(cells), counts[0]) for sub_type, (cells, counts) in by_type.items()]
+    month_totals = [sum(row.cells[i] for row in rows) for i in range(12)]
+    return rows, month_totals, sum(month_totals)
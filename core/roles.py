@@ -0,0 +1,78 @@
+from django.core.cache import cache
+
+ROLES_CACHE_TIMEOUT = 60 * 60
+
+
+def roles_cache_key(user_id):
+    return f'core:roles:{user_id}'
+
+
+class Roles:
+    """Роли пользователя, вычисленные по одному набору имён групп.
+
+    Правила совпадают с прежними проверками: админ — это is_staff или группа
+    Admin; родитель — группа Parent без прав админа; ученик — группа Student,
+    если пользователь не админ и не родитель.
+    """
+
+    def __init__(self, user, group_names=frozenset()):
+        authenticated = user.is_authenticated
+        self.groups = frozenset(group_names)
+        self.is_admin = authenticated and (user.is_staff or 'Admin' in self.groups)
+        self.is_parent = authenticated and 'Parent' in self.groups and not self.is_admin
+        self.is_student = (
+            authenticated
+            and 'Student' in self.groups
+            and not (self.is_admin or self.is_parent)
+        )
+
+    def __repr__(self):
+        return f'<Roles admin={self.is_admin} parent={self.is_parent} student={self.is_student}>'
+
+
+def _load_group_names(user):
+    key = roles_cache_key(user.pk)
+    names = cache.get(key)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, names, ROLES_CACHE_TIMEOUT)
+    return names
+
+
+def get_roles(user):
+    """Возвращает роли пользователя.
+
+    Имена групп загружаются один раз и запоминаются на объекте пользователя
+    (то есть на время запроса) и в кеше (между запросами). Кеш общий для
+    всех воркеров (CACHES в настройках) и сбрасывается сигналами из
+    core.signals при изменении групп пользователя.
+    """
+    roles = getattr(user, '_core_roles', None)
+    if roles is None:
+        names = _load_group_names(user) if user.is_authenticated else frozenset()
+        roles = Roles(user, names)
+        user._core_roles = roles
+    return roles
+
+
+async def _aload_group_names(user):
+    key = roles_cache_key(user.pk)
+    names = await cache.aget(key)
+    if names is None:
+        names = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+        await cache.aset(key, names, ROLES_CACHE_TIMEOUT)
+    return names
+
+
+async def aget_roles(user):
+    """get_roles для асинхронного кода: тот же кеш, запросы через async ORM."""
+    roles = getattr(user, '_core_roles', None)
+    if roles is None:
+        names = await _aload_group_names(user) if user.is_authenticated else frozenset()
+        roles = Roles(user, names)
+        user._core_roles = roles
+    return roles
+
+
+def invalidate_roles(*user_ids):
+    cache.delete_many([roles_cache_key(pk) for pk in user_ids])
@@ -0,0 +1,180 @@
+"""Полнотекстовый поиск учеников по индексу SQLite FTS5.
+
+Таблица core_child_fts хранит по строке на ученика (rowid = Child.id):
+имя и фамилию, заметки и логины/почты родителя или аккаунта взрослого.
+Токенизатор unicode61 понимает кириллицу, префиксные индексы на 2 и 3
+символа ускоряют поиск по началу слова. Диакритику он снимает только
+с латиницы, поэтому «ё» заменяется на «е» и в документах, и в запросах.
+
+Индекс поддерживается сигналами (core.signals); массовые операции в обход
+save() должны вызывать index_children сами. Полная пересборка — команда
+rebuild_search_index.
+
+На других СУБД индекса нет — поиск откатывается к icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Child
+
+TABLE = 'core_child_fts'
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "name, notes, account, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+# веса столбцов для bm25: имя важнее логина/почты, заметки — меньше всего
+RANK = f'bm25({TABLE}, 10.0, 1.0, 3.0)'
+REBUILD_CHUNK = 1000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_YO = str.maketrans('ёЁ', 'еЕ')
+
+
+def normalize(text):
+    return (text or '').translate(_YO)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """FTS5-запрос из пользовательской строки: все слова, каждое как префикс.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (OR, NEAR, *) во вводе
+    не интерпретируются. Пустая строка → None.
+    """
+    tokens = _TOKEN_RE.findall(normalize(query))
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+# поля аккаунта (родителя или взрослого ученика), которые попадают в индекс
+USER_FIELDS = ('username', 'email')
+
+
+def _documents(child_ids=None):
+    rows = Child.objects.order_by()
+    if child_ids is not None:
+        rows = rows.filter(id__in=child_ids)
+    rows = rows.values_list(
+        'id', 'first_name', 'last_name', 'notes',
+        'parent__username', 'parent__email',
+        'account_user__username', 'account_user__email',
+    )
+    for child_id, first_name, last_name, notes, *accounts in rows.iterator(chunk_size=REBUILD_CHUNK):
+        yield (
+            child_id,
+            normalize(f'{first_name} {last_name}'.strip()),
+            normalize(notes),
+            ' '.join(a for a in accounts if a),
+        )
+
+
+def _insert(cursor, documents):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= REBUILD_CHUNK:
+            cursor.executemany(f'INSERT INTO {TABLE} (rowid, name, notes, account) VALUES (%s, %s, %s, %s)', batch)
+            batch = []
+    if batch:
+        cursor.executemany(f'INSERT INTO {TABLE} (rowid, name, notes, account) VALUES (%s, %s, %s, %s)', batch)
+
+
+def _delete(cursor, child_ids):
+    child_ids = list(child_ids)
+    for i in range(0, len(child_ids), REBUILD_CHUNK):
+        chunk = child_ids[i:i + REBUILD_CHUNK]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+
+def index_children(child_ids):
+    """Переиндексирует учеников child_ids (удалённые просто пропадают из индекса)."""
+    child_ids = list(child_ids)
+    if not child_ids or not is_available():
+        return
+    with connection.cursor() as cursor:
+        _delete(cursor, child_ids)
+        _insert(cursor, _documents(child_ids))
+
+
+def remove_children(child_ids):
+    child_ids = list(child_ids)
+    if not child_ids or not is_available():
+        return
+    with connection.cursor() as cursor:
+        _delete(cursor, child_ids)
+
+
+def rebuild():
+    """Пересобирает индекс целиком; возвращает число проиндексированных учеников."""
+    if not is_available():
+        return 0
+    count = 0
+
+    def counted(documents):
+        nonlocal count
+        for document in documents:
+            count += 1
+            yield document
+
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.execute(f'DELETE FROM {TABLE}')
+        _insert(cursor, counted(_documents()))
+    return count
+
+
+def matching_ids(query):
+    """Выражение для filter(id__in=...): ученики, подходящие под запрос.
+
+    Подзапрос к индексу встраивается в основной запрос, так что фильтрация,
+    сортировка и пагинация по-прежнему стоят один запрос.
+    """
+    match = match_expression(query)
+    if match is None:
+        return None
+    return RawSQL(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [match])
+
+
+def filter_children(queryset, query):
+    """Ограничивает queryset учеников поисковым запросом."""
+    if not (query or '').strip():
+        return queryset
+    if not is_available():
+        return queryset.filter(
+            Q(first_name__icontains=query) | Q(last_name__icontains=query)
+            | Q(parent__username__icontains=query) | Q(parent__email__icontains=query)
+        )
+    ids = matching_ids(query)
+    if ids is None:
+        return queryset.none()
+    return queryset.filter(id__in=ids)
+
+
+def search(query, limit=20):
+    """Ранжированные совпадения: список (child_id, name, account) по убыванию релевантности."""
+    match = match_expression(query)
+    if match is None:
+        return []
+    if not is_available():
+        rows = filter_children(Child.objects.all(), query)[:limit]
+        return [(c.id, str(c), '') for c in rows]
+    # имена берём из core_child: в индексе они нормализованы
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT c.id, c.first_name, c.last_name, {TABLE}.account '
+            f'FROM {TABLE} JOIN core_child c ON c.id = {TABLE}.rowid '
+            f'WHERE {TABLE} MATCH %s ORDER BY {RANK} LIMIT %s',
+            [match, limit],
+        )
+        return [(child_id, f'{first} {last}'.strip(), account)
+                for child_id, first, last, account in cursor.fetchall()]
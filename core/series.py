@@ -0,0 +1,157 @@
+"""Операции над сериями занятий: заполнение месяца, копирование недели/месяца,
+массовое удаление ребёнка из занятий.
+
+Всё выполняется в одной транзакции через bulk_create/delete по
+through-таблице участников, поэтому число запросов не зависит от количества
+занятий и участников.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import analytics, conflicts
+from .calendars import add_months, month_range, sessions_in_range
+from .models import TrainingSession
+
+Participants = TrainingSession.participants.through
+
+
+def _participant_links(sessions, participants_by_session):
+    return [
+        Participants(trainingsession_id=session.id, child_id=child_id)
+        for session in sessions
+        for child_id in participants_by_session.get(session._source_id, ())
+    ]
+
+
+def _add_to_rollups(sessions, links):
+    # bulk_create не шлёт сигналов — сводки посещаемости обновляем сами
+    starts = {session.id: session.start for session in sessions}
+    analytics.apply(starts.values(), [(starts[link.trainingsession_id], link.child_id) for link in links])
+
+
+@transaction.atomic
+def create_occurrences(session, starts, participant_ids):
+    """Создаёт копии session с началом в каждой из дат starts и теми же участниками.
+
+    Пересечения с расписанием учеников и повторы слотов — ScheduleConflict.
+    """
+    participant_ids = list(participant_ids)
+    duration = timedelta(minutes=session.duration_minutes)
+    conflicts.check([((start, start + duration), participant_ids) for start in starts],
+                    exclude=[session.id], duplicates=True)
+    sessions = []
+    for start in starts:
+        # bulk_create не шлёт m2m_changed — число участников записываем сразу
+        occurrence = TrainingSession(
+            start=start,
+            duration_minutes=session.duration_minutes,
+            notes=session.notes,
+            capacity=session.capacity,
+            participant_count=len(participant_ids),
+        )
+        occurrence._source_id = session.id
+        sessions.append(occurrence)
+    sessions = TrainingSession.objects.bulk_create(sessions)
+    links = Participants.objects.bulk_create(_participant_links(sessions, {session.id: participant_ids}))
+    _add_to_rollups(sessions, links)
+    return sessions
+
+
+def weekly_starts_until_month_end(start):
+    """Начала еженедельных повторов после start до конца его (локального) месяца.
+
+    Шаг считается по местному времени, чтобы занятие оставалось в тот же час
+    при переходе на летнее/зимнее время.
+    """
+    local = timezone.localtime(start) if timezone.is_aware(start) else start
+    naive = local.replace(tzinfo=None)
+    starts = []
+    next_start = naive + timedelta(days=7)
+    while next_start.month == naive.month:
+        starts.append(timezone.make_aware(next_start))
+        next_start += timedelta(days=7)
+    return starts
+
+
+def fill_month(session):
+    """Повторяет занятие еженедельно до конца месяца."""
+    participant_ids = session.participants.values_list('id', flat=True)
+    return create_occurrences(session, weekly_starts_until_month_end(session.start), participant_ids)
+
+
+@transaction.atomic
+def copy_sessions(sources, target_start):
+    """Копирует занятия sources; target_start(local_start) → новое локальное начало или None.
+
+    Если копии пересекаются с расписанием учеников или повторяют слоты — ScheduleConflict.
+    """
+    sources = list(sources.order_by('start').values_list('id', 'start', 'duration_minutes', 'notes', 'capacity'))
+    if not sources:
+        return []
+    participants_by_session = {}
+    links = Participants.objects.filter(trainingsession_id__in=[s[0] for s in sources])
+    for session_id, child_id in links.values_list('trainingsession_id', 'child_id'):
+        participants_by_session.setdefault(session_id, []).append(child_id)
+
+    sessions = []
+    for source_id, start, duration, notes, capacity in sources:
+        local = timezone.localtime(start).replace(tzinfo=None)
+        new_start = target_start(local)
+        if new_start is None:
+            continue
+        copy = TrainingSession(start=timezone.make_aware(new_start), duration_minutes=duration, notes=notes,
+                               capacity=capacity,
+                               participant_count=len(participants_by_session.get(source_id, ())))
+        copy._source_id = source_id
+        sessions.append(copy)
+    conflicts.check([((copy.start, copy.compute_end()), participants_by_session.get(copy._source_id, ()))
+                     for copy in sessions], duplicates=True)
+    sessions = TrainingSession.objects.bulk_create(sessions)
+    links = Participants.objects.bulk_create(_participant_links(sessions, participants_by_session))
+    _add_to_rollups(sessions, links)
+    return sessions
+
+
+def copy_week(week_start, target_week_start):
+    """Копирует расписание недели [week_start, week_start + 6] на неделю target_week_start."""
+    shift = target_week_start - week_start
+    sources = sessions_in_range(week_start, week_start + timedelta(days=6))
+    return copy_sessions(sources, lambda local: local + shift)
+
+
+def copy_month(year, month):
+    """Копирует расписание месяца на следующий с сохранением дня недели.
+
+    N-е занятие по вторникам переносится на N-й вторник следующего месяца;
+    если такого дня нет (пятый вторник), занятие не копируется.
+    """
+    first_day, last_day = month_range(year, month)
+    target_first = add_months(first_day, 1)
+
+    def target_start(local):
+        nth = (local.day - 1) // 7
+        offset = (local.weekday() - target_first.weekday()) % 7
+        day = target_first + timedelta(days=offset + 7 * nth)
+        if day.month != target_first.month:
+            return None
+        return local.replace(year=day.year, month=day.month, day=day.day)
+
+    return copy_sessions(sessions_in_range(first_day, last_day), target_start)
+
+
+@transaction.atomic
+def remove_child_from_sessions(child, session_ids):
+    """Удаляет ребёнка из занятий одним DELETE; возвращает число удалённых записей."""
+    links = Participants.objects.filter(child=child, trainingsession_id__in=session_ids)
+    removed = dict(links.values_list('trainingsession_id', 'trainingsession__start'))
+    deleted, _ = links.delete()
+    if deleted:
+        # DELETE по through-таблице не шлёт m2m_changed — версию, места и сводки обновляем сами
+        TrainingSession.objects.filter(id__in=list(removed)).update(
+            updated_at=timezone.now(), participant_count=F('participant_count') - 1,
+        )
+        analytics.apply(links=[(start, child.pk) for start in removed.values()], sign=-1)
+    return deleted
@@ -0,0 +1,238 @@
+from django.contrib.auth.models import Group, User
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, search
+from .birthdays import invalidate_birthdays
+from .models import BIRTHDAY_FIELDS, Child, Subscription, SubscriptionType, TrainingSession
+from .roles import invalidate_roles
+
+
+# --- роли ---
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # сбрасываем после изменения: иначе параллельный запрос успеет закэшировать старые роли
+    if reverse and action == 'pre_clear':
+        instance._roles_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_roles(instance.pk)
+    elif action == 'post_clear':
+        invalidate_roles(*getattr(instance, '_roles_user_ids', ()))
+    elif pk_set:
+        invalidate_roles(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # переименование или удаление группы меняет роли всех её участников
+    invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        invalidate_roles(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_roles(instance.pk)
+
+
+# --- дни рождения ---
+
+@receiver(post_save, sender=Child)
+def child_changed(sender, instance, created, update_fields, **kwargs):
+    # заметки, пол и отметки updated_at в кэш дней рождения не попадают
+    if update_fields is not None and set(BIRTHDAY_FIELDS).isdisjoint(update_fields):
+        return
+    values = instance.birthday_values()
+    loaded = getattr(instance, '_birthday_loaded', None)
+    instance._birthday_loaded = values
+    if created:
+        changed = instance.birth_date is not None
+    else:
+        changed = loaded != values
+    if changed:
+        invalidate_birthdays()
+
+
+@receiver(post_delete, sender=Child)
+def child_deleted(sender, instance, **kwargs):
+    invalidate_birthdays()
+
+
+# --- поисковый индекс ---
+
+def _account_children(user):
+    return Child.objects.filter(Q(parent=user) | Q(account_user=user)).values_list('pk', flat=True)
+
+
+@receiver(post_save, sender=Child)
+def child_indexed(sender, instance, **kwargs):
+    search.index_children([instance.pk])
+
+
+@receiver(post_delete, sender=Child)
+def child_unindexed(sender, instance, **kwargs):
+    search.remove_children([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def user_indexed(sender, instance, created, update_fields, **kwargs):
+    # у нового пользователя ещё нет учеников; вход сохраняет только last_login
+    if created or (update_fields is not None and set(search.USER_FIELDS).isdisjoint(update_fields)):
+        return
+    search.index_children(_account_children(instance))
+
+
+@receiver(pre_delete, sender=User)
+def user_pre_delete(sender, instance, **kwargs):
+    # после удаления аккаунт взрослого обнуляется через UPDATE без сигналов,
+    # поэтому учеников запоминаем заранее
+    instance._search_child_ids = list(_account_children(instance))
+
+
+@receiver(post_delete, sender=User)
+def user_unindexed(sender, instance, **kwargs):
+    search.index_children(getattr(instance, '_search_child_ids', ()))
+
+
+# --- версии для условных GET (core.versions) ---
+
+def _touch_sessions(session_ids):
+    if session_ids:
+        TrainingSession.objects.filter(id__in=session_ids).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=TrainingSession.participants.through)
+def session_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _touch_sessions([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_session_ids = list(instance.sessions.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        _touch_sessions(getattr(instance, '_cleared_session_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        _touch_sessions(pk_set)
+
+
+@receiver(pre_delete, sender=Child)
+def child_sessions_touched(sender, instance, **kwargs):
+    # строки участников удаляются каскадом без m2m_changed
+    _touch_sessions(list(instance.sessions.values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=SubscriptionType)
+def subscription_type_changed(sender, instance, created, raw, **kwargs):
+    # название и число занятий типа видны в абонементах; их версия — Subscription.updated_at
+    if not created and not raw:
+        Subscription.objects.filter(sub_type=instance).update(updated_at=timezone.now())
+
+
+# --- сводки посещаемости (core.analytics) ---
+
+Participants = TrainingSession.participants.through
+
+
+@receiver(pre_save, sender=TrainingSession)
+def session_pre_save(sender, instance, raw, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._analytics_start = (TrainingSession.objects.filter(pk=instance.pk)
+                                     .values_list('start', flat=True).first())
+
+
+@receiver(post_save, sender=TrainingSession)
+def session_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        # участники добавятся позже через m2m_changed
+        analytics.apply([instance.start])
+        return
+    old_start = getattr(instance, '_analytics_start', None)
+    if old_start is not None and old_start != instance.start:
+        child_ids = Participants.objects.filter(trainingsession_id=instance.pk).values_list('child_id', flat=True)
+        analytics.move_session(old_start, instance.start, child_ids)
+
+
+@receiver(pre_delete, sender=TrainingSession)
+def session_pre_delete(sender, instance, **kwargs):
+    # строки участников удаляются каскадом без m2m_changed
+    instance._analytics_children = list(instance.participants.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=TrainingSession)
+def session_deleted(sender, instance, **kwargs):
+    children = getattr(instance, '_analytics_children', ())
+    analytics.apply([instance.start], [(instance.start, c) for c in children], sign=-1)
+
+
+def _existing_links(instance, reverse, pk_set):
+    """Пары (начало занятия, id ученика), которые реально есть в таблице участников."""
+    links = Participants.objects.all()
+    if reverse:
+        links = links.filter(child_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(trainingsession_id__in=pk_set)
+    else:
+        links = links.filter(trainingsession_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(child_id__in=pk_set)
+    return list(links.values_list('trainingsession__start', 'child_id'))
+
+
+@receiver(m2m_changed, sender=Participants)
+def session_participants_counted(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        # pk_set в post_add — только действительно добавленные
+        analytics.apply(links=_existing_links(instance, reverse, pk_set))
+    elif action in ('pre_remove', 'pre_clear'):
+        # в remove pk_set — все переданные, в том числе отсутствующие
+        instance._analytics_removed = _existing_links(instance, reverse, pk_set if action == 'pre_remove' else None)
+    elif action in ('post_remove', 'post_clear'):
+        analytics.apply(links=getattr(instance, '_analytics_removed', ()), sign=-1)
+
+
+@receiver(pre_delete, sender=Child)
+def child_occupancy_released(sender, instance, **kwargs):
+    # свои строки ChildMonthAttendance удалятся каскадом, слоты освобождаем здесь
+    analytics.apply(links=_existing_links(instance, True, None), sign=-1)
+
+
+# --- места в занятиях (TrainingSession.participant_count) ---
+
+@receiver(m2m_changed, sender=Participants)
+def session_places(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_add' and pk_set:
+        # pk_set в pre_add — только недостающие; места занимаются условным UPDATE
+        if reverse:
+            TrainingSession.reserve(pk_set)
+        else:
+            TrainingSession.reserve([instance.pk], len(pk_set))
+    elif action == 'pre_clear' and reverse:
+        instance._places_session_ids = list(instance.sessions.values_list('pk', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        if not reverse:
+            TrainingSession.recount([instance.pk])
+        elif action == 'post_remove':
+            TrainingSession.recount(pk_set)
+        else:
+            TrainingSession.recount(getattr(instance, '_places_session_ids', ()))
+
+
+@receiver(pre_delete, sender=Child)
+def child_places_pre_delete(sender, instance, **kwargs):
+    instance._places_session_ids = list(instance.sessions.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Child)
+def child_places_released(sender, instance, **kwargs):
+    TrainingSession.recount(getattr(instance, '_places_session_ids', ()))
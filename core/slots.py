@@ -0,0 +1,176 @@
+"""Группировка занятий в слоты календаря.
+
+Слот — занятия одного дня с одинаковыми началом и концом. Два режима:
+
+* COUNT — только числа; группировка выполняется в SQL одним запросом по
+  таблице занятий, различные участники — подзапросом к through-таблице
+  (лендинг, годовой обзор);
+* DETAIL — имена участников; два запроса (занятия и участники через
+  through-таблицу), из Child читаются только нужные шаблонам столбцы.
+
+participants_count — число различных участников слота: ученик, записанный
+в два занятия одного слота, считается один раз. places_taken — занятые
+места, сумма TrainingSession.participant_count; с ней сравнивается
+вместимость слота — сумма capacity его занятий (None, если хотя бы одно
+занятие без ограничения).
+
+Запросы и группировка разделены: асинхронные варианты (acount_slots,
+adetail_slots) читают те же строки через async ORM и группируют их тем же
+кодом.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import TrainingSession
+
+COUNT = 'count'
+DETAIL = 'detail'
+
+
+class SlotParticipant:
+    __slots__ = ('id', 'first_name', 'last_name')
+
+    def __init__(self, id, first_name, last_name):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}".strip()
+
+
+class Slot:
+    __slots__ = ('start', 'end', 'session_ids', 'participants', 'participants_count', 'places_taken', 'capacity')
+
+    def __init__(self, start, end, session_ids=None, participants=None, participants_count=0,
+                 places_taken=0, capacity=None):
+        self.start = start
+        self.end = end
+        self.session_ids = session_ids if session_ids is not None else []
+        self.participants = participants
+        self.participants_count = participants_count
+        self.places_taken = places_taken
+        self.capacity = capacity
+
+    @property
+    def is_full(self):
+        return self.capacity is not None and self.places_taken >= self.capacity
+
+
+def _local_bounds(start, duration_minutes):
+    start = timezone.localtime(start)
+    return start, start + timedelta(minutes=duration_minutes)
+
+
+def _count_rows(sessions_qs):
+    # различные участники слота: занятия того же начала и длительности из sessions_qs
+    participants = (TrainingSession.participants.through.objects
+                    .filter(trainingsession__in=sessions_qs.order_by().values('id'),
+                            trainingsession__start=OuterRef('start'),
+                            trainingsession__duration_minutes=OuterRef('duration_minutes'))
+                    .order_by()
+                    .values('trainingsession__start')
+                    .annotate(n=Count('child_id', distinct=True))
+                    .values('n'))
+    return (sessions_qs
+            .order_by()
+            .values('start', 'duration_minutes')
+            .annotate(n=Coalesce(Subquery(participants), 0), taken=Sum('participant_count'),
+                      places=Sum('capacity'), sessions=Count('id'), limited=Count('capacity'))
+            .order_by('start', 'duration_minutes'))
+
+
+def _group_counts(rows):
+    out = defaultdict(list)
+    for row in rows:
+        start, end = _local_bounds(row['start'], row['duration_minutes'])
+        capacity = row['places'] if row['limited'] == row['sessions'] else None
+        out[start.date()].append(Slot(start, end, participants_count=row['n'], places_taken=row['taken'],
+                                      capacity=capacity))
+    return dict(out)
+
+
+def count_slots(sessions_qs):
+    """{date: [Slot]} с числом участников, занятыми местами и вместимостью, посчитанными в SQL."""
+    return _group_counts(_count_rows(sessions_qs))
+
+
+async def acount_slots(sessions_qs):
+    return _group_counts([row async for row in _count_rows(sessions_qs)])
+
+
+def _detail_sessions(sessions_qs):
+    return (sessions_qs.order_by('start', 'id')
+            .values_list('id', 'start', 'duration_minutes', 'participant_count', 'capacity'))
+
+
+def _detail_links(sessions_qs):
+    through = TrainingSession.participants.through
+    return (through.objects
+            .filter(trainingsession__in=sessions_qs.order_by().values('id'))
+            .order_by('child__first_name', 'child__last_name', 'child_id')
+            .values_list('trainingsession_id', 'child_id', 'child__first_name', 'child__last_name'))
+
+
+def _group_details(sessions, links):
+    slot_by_session = {}
+    slots_by_key = {}
+    unlimited = set()
+    out = defaultdict(list)
+    for session_id, start, duration, count, capacity in sessions:
+        start, end = _local_bounds(start, duration)
+        slot = slots_by_key.get((start, end))
+        if slot is None:
+            slot = slots_by_key[(start, end)] = Slot(start, end, participants={}, capacity=0)
+            out[start.date()].append(slot)
+        slot.session_ids.append(session_id)
+        slot.places_taken += count
+        if capacity is None:
+            unlimited.add((start, end))
+        else:
+            slot.capacity += capacity
+        slot_by_session[session_id] = slot
+
+    for session_id, child_id, first_name, last_name in links:
+        slot = slot_by_session.get(session_id)
+        if slot is not None and child_id not in slot.participants:
+            slot.participants[child_id] = SlotParticipant(child_id, first_name, last_name)
+
+    for key, slot in slots_by_key.items():
+        slot.participants = list(slot.participants.values())
+        slot.participants_count = len(slot.participants)
+        if key in unlimited:
+            slot.capacity = None
+    return dict(out)
+
+
+def detail_slots(sessions_qs):
+    """{date: [Slot]} с участниками (SlotParticipant) без построения моделей Child."""
+    sessions = list(_detail_sessions(sessions_qs))
+    # без занятий запрос участников не нужен
+    links = _detail_links(sessions_qs) if sessions else ()
+    return _group_details(sessions, links)
+
+
+async def adetail_slots(sessions_qs):
+    sessions = [row async for row in _detail_sessions(sessions_qs)]
+    links = [row async for row in _detail_links(sessions_qs)] if sessions else ()
+    return _group_details(sessions, links)
+
+
+def group_timeslots(sessions_qs, mode=DETAIL):
+    """Слоты по дням для queryset занятий в выбранном режиме."""
+    if mode == COUNT:
+        return count_slots(sessions_qs)
+    return detail_slots(sessions_qs)
+
+
+async def agroup_timeslots(sessions_qs, mode=DETAIL):
+    """Асинхронный group_timeslots: те же запросы через async ORM."""
+    if mode == COUNT:
+        return await acount_slots(sessions_qs)
+    return await adetail_slots(sessions_qs)
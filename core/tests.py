@@ -1,12 +1,55 @@
+import re
+import shutil
+import tempfile
 from datetime import date, timedelta
-from django.test import TestCase
+from io import BytesIO, StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.core.management import call_command
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from datetime import date, timedelta
 from django.utils import timezone
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import User, Group
+from django.core.files.uploadedfile import SimpleUploadedFile
 from decimal import Decimal
-from .models import SubscriptionType, Subscription, Child, TrainingSession
+from .bench import explain
+from .birthdays import find_upcoming_birthdays, upcoming_birthdays
+from . import api, bench, conflicts, ical, imports, search, series
+from .attendance import ALREADY_MARKED, EXHAUSTED, MARKED, NO_LESSONS, NO_SUBSCRIPTION, mark_attendance
+from .calendars import Calendar, build_calendar, period_range
+from .paging import encode_cursor
+from .roles import get_roles
+from .slots import COUNT, DETAIL
+from .models import (
+    ChildMonthAttendance, LedgerEntry, Payment, RevenueRollup, SessionFull, SlotOccupancy, SubscriptionType, Subscription, Child,
+    TrainingSession,
+)
+
+
+# тесты работают с тем же файловым кэшем, что и сервер, но в своём каталоге:
+# ключи предыдущих прогонов и рабочего сервера им не видны
+_test_cache = None
+
+
+def setUpModule():
+    global _test_cache
+    location = tempfile.mkdtemp(prefix='littlejohn-cache-')
+    _test_cache = override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location,
+    }})
+    _test_cache.enable()
+
+
+def tearDownModule():
+    _test_cache.disable()
+    shutil.rmtree(_test_cache.options['CACHES']['default']['LOCATION'], ignore_errors=True)
 
 
 class CalendarAlignmentTests(TestCase):
@@ -127,6 +170,7 @@ class ChildSessionDeleteTests(TestCase):
 
 class UpcomingBirthdaysBannerTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
         self.child = Child.objects.create(
             first_name="Test", last_name="Kid", birth_date=timezone.localdate() + timedelta(days=1)
@@ -137,3 +181,1469 @@ class UpcomingBirthdaysBannerTests(TestCase):
         resp = self.client.get(reverse("children_list"))
         self.assertContains(resp, "Скоро дни рождения")
         self.assertContains(resp, "Test Kid")
+
+
+class UpcomingBirthdaysLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_leap_day_birthday_in_non_leap_year(self):
+        child = Child.objects.create(first_name='Leap', birth_date=date(2016, 2, 29))
+        upcoming = find_upcoming_birthdays(date(2025, 2, 27))
+        self.assertEqual([(b['child'], b['date']) for b in upcoming], [(child, date(2025, 2, 28))])
+
+    def test_window_wraps_over_new_year(self):
+        Child.objects.create(first_name='Jan', birth_date=date(2015, 1, 1))
+        Child.objects.create(first_name='Dec', birth_date=date(2015, 12, 31))
+        Child.objects.create(first_name='Later', birth_date=date(2015, 1, 5))
+        upcoming = find_upcoming_birthdays(date(2025, 12, 30))
+        self.assertEqual([b['child'].first_name for b in upcoming], ['Dec', 'Jan'])
+        self.assertEqual([b['days_left'] for b in upcoming], [1, 2])
+
+    def test_result_cached_until_birth_date_changes(self):
+        today = timezone.localdate()
+        child = Child.objects.create(first_name='Kid', birth_date=today + timedelta(days=10))
+        self.assertEqual(upcoming_birthdays(today), [])
+        with self.assertNumQueries(0):
+            upcoming_birthdays(today)
+        child.birth_date = today
+        child.save()
+        self.assertEqual([b['child'] for b in upcoming_birthdays(today)], [child])
+
+    def test_unrelated_edits_keep_cache(self):
+        today = timezone.localdate()
+        Child.objects.create(first_name='Kid', birth_date=today)
+        upcoming_birthdays(today)
+        child = Child.objects.get()
+        child.notes = 'левша'
+        child.save()
+        child.save(update_fields=['updated_at'])
+        with self.assertNumQueries(0):
+            upcoming_birthdays(today)
+        child.first_name = 'Anya'
+        child.save()
+        self.assertEqual(upcoming_birthdays(today)[0]['child'].first_name, 'Anya')
+        child.delete()
+        self.assertEqual(upcoming_birthdays(today), [])
+
+
+class RoleResolutionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.parent = User.objects.create_user(username='parent', password='pass')
+        self.parent_group = Group.objects.create(name='Parent')
+        self.parent.groups.add(self.parent_group)
+
+    def _group_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q for q in ctx.captured_queries if 'auth_group' in q['sql']]
+
+    def test_groups_loaded_once_per_request(self):
+        self.client.force_login(self.parent)
+        self.assertEqual(len(self._group_queries(reverse('my_children'))), 1)
+
+    def test_groups_cached_between_requests(self):
+        self.client.force_login(self.admin)
+        self._group_queries(reverse('subscriptions_list'))
+        self.assertEqual(self._group_queries(reverse('subscriptions_list')), [])
+
+    def test_query_count_per_page(self):
+        self.client.force_login(self.parent)
+        self.client.get(reverse('my_children'))
+        # сессия, пользователь, две версии для ETag, абонементы, дети
+        with self.assertNumQueries(6):
+            self.client.get(reverse('my_children'))
+
+    def test_cache_invalidated_on_group_change(self):
+        self.client.force_login(self.parent)
+        self.assertEqual(self.client.get(reverse('my_children')).status_code, 200)
+        self.parent.groups.remove(self.parent_group)
+        self.assertEqual(self.client.get(reverse('my_children')).status_code, 302)
+        self.parent_group.user_set.add(self.parent)
+        self.assertEqual(self.client.get(reverse('my_children')).status_code, 200)
+        self.parent_group.user_set.clear()
+        self.assertEqual(self.client.get(reverse('my_children')).status_code, 302)
+        self.parent.groups.add(self.parent_group)
+        self.assertEqual(self.client.get(reverse('my_children')).status_code, 200)
+        self.parent.groups.clear()
+        self.assertEqual(self.client.get(reverse('my_children')).status_code, 302)
+
+
+class CalendarEngineTests(TestCase):
+    def test_period_ranges(self):
+        anchor = date(2025, 12, 15)
+        self.assertEqual(period_range('week', anchor), (date(2025, 12, 15), date(2025, 12, 21)))
+        self.assertEqual(period_range('month', anchor), (date(2025, 12, 1), date(2025, 12, 31)))
+        self.assertEqual(period_range('quarter', anchor), (date(2025, 10, 1), date(2025, 12, 31)))
+        self.assertEqual(period_range('season', anchor), (date(2025, 12, 1), date(2026, 2, 28)))
+        self.assertEqual(period_range('season', date(2026, 1, 10)), (date(2025, 12, 1), date(2026, 2, 28)))
+        self.assertEqual(period_range('year', anchor), (date(2025, 1, 1), date(2025, 12, 31)))
+
+    def test_months_and_weeks_built_in_one_pass(self):
+        cal = Calendar(date(2024, 8, 20), date(2024, 9, 3), {})
+        self.assertEqual(len(cal.days), 15)
+        self.assertEqual([m.month for m in cal.months], [8, 9])
+        self.assertEqual(cal.weeks[0][1], date(2024, 8, 20))
+        self.assertIsNone(cal.weeks[0][0])
+        # август: 20-е во вторник четвёртой недели, дни до начала диапазона пустые
+        self.assertEqual(cal.months[0].weeks[3][1], date(2024, 8, 20))
+        self.assertIsNone(cal.months[0].weeks[0][3])
+
+    def test_year_overview_is_one_query(self):
+        start = timezone.make_aware(timezone.datetime(2025, 3, 3, 10, 0))
+        for i in range(12):
+            TrainingSession.objects.create(start=start + timedelta(days=25 * i))
+        with self.assertNumQueries(1):
+            cal = build_calendar(date(2025, 1, 1), date(2025, 12, 31), mode=COUNT)
+        self.assertEqual(len(cal.months), 12)
+        self.assertEqual(sum(len(slots) for slots in cal.slots_by_day.values()), 12)
+
+    def test_year_and_range_views(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        resp = self.client.get(reverse('sessions_year'), {'year': 2025})
+        self.assertEqual(len(resp.context['calendar'].months), 12)
+        resp = self.client.get(reverse('sessions_range'), {'period': 'quarter', 'date': '2025-05-05'})
+        self.assertEqual(resp.context['calendar'].date_from, date(2025, 4, 1))
+        resp = self.client.get(reverse('sessions_range'), {'from': '2025-01-01', 'to': '2027-01-01'})
+        self.assertEqual(len(resp.context['calendar'].days), 366)
+
+
+class SessionLocalRangeTests(TestCase):
+    def test_range_bounds_are_local_days(self):
+        tz = timezone.get_current_timezone()
+        inside = TrainingSession.objects.create(
+            start=timezone.make_aware(timezone.datetime(2025, 6, 30, 23, 30), tz))
+        TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(2025, 7, 1, 0, 10), tz))
+        TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(2025, 5, 31, 23, 50), tz))
+        first = TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(2025, 6, 1, 0, 0), tz))
+        qs = TrainingSession.objects.in_local_range(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual(list(qs), [first, inside])
+
+    def test_range_query_uses_start_index(self):
+        qs = TrainingSession.objects.in_local_range(date(2025, 6, 1), date(2025, 6, 30))
+        # оба индекса занятий начинаются со start — годится любой
+        self.assertRegex(' '.join(explain(qs)), r'USING INDEX core_session_(start_upd|interval)_idx \(start>\? AND start<\?\)')
+
+
+class SlotModesTests(TestCase):
+    def setUp(self):
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(timezone.datetime(2025, 6, 10, 18, 0), tz)
+        self.a = Child.objects.create(first_name='Anna', last_name='A')
+        self.b = Child.objects.create(first_name='Boris', last_name='B')
+        # два занятия в одном слоте с общим участником и одно отдельное
+        s1 = TrainingSession.objects.create(start=start)
+        s2 = TrainingSession.objects.create(start=start)
+        s3 = TrainingSession.objects.create(start=start + timedelta(days=1))
+        s1.participants.add(self.a, self.b)
+        s2.participants.add(self.a)
+        s3.participants.add(self.b)
+        self.sessions = [s1, s2, s3]
+
+    def test_count_mode_is_one_query(self):
+        with self.assertNumQueries(1):
+            cal = build_calendar(date(2025, 6, 1), date(2025, 6, 30), mode=COUNT)
+        slot = cal.slots_by_day[date(2025, 6, 10)][0]
+        # Anna записана в оба занятия слота: участник один, мест занято два
+        self.assertEqual((slot.participants_count, slot.places_taken), (2, 3))
+        self.assertIsNone(slot.participants)
+
+    def test_detail_mode_loads_participant_names(self):
+        with self.assertNumQueries(2):
+            cal = build_calendar(date(2025, 6, 1), date(2025, 6, 30), mode=DETAIL)
+        slot = cal.slots_by_day[date(2025, 6, 10)][0]
+        self.assertEqual(slot.session_ids, [self.sessions[0].id, self.sessions[1].id])
+        self.assertEqual([str(p) for p in slot.participants], ['Anna A', 'Boris B'])
+        self.assertEqual((slot.participants_count, slot.places_taken), (2, 3))
+        self.assertEqual([p.first_name for p in cal.slots_by_day[date(2025, 6, 11)][0].participants], ['Boris'])
+
+    def test_landing_shows_participant_count(self):
+        resp = self.client.get(reverse('home'), {'year': 2025, 'month': 6})
+        self.assertContains(resp, 'Занимающихся: 2', count=1)
+        self.assertContains(resp, 'Занимающихся: 1', count=1)
+
+
+class WeekGridTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        tz = timezone.get_current_timezone()
+        self.session = TrainingSession.objects.create(
+            start=timezone.make_aware(timezone.datetime(2025, 6, 11, 18, 0), tz))
+        self.session.participants.add(Child.objects.create(first_name='Anna'))
+
+    def test_grid_rows_indexed_by_day_and_time(self):
+        resp = self.client.get(reverse('sessions_week'), {'start': '2025-06-09'})
+        rows = resp.context['table_rows']
+        self.assertEqual(len(rows), 1)
+        cells = rows[0]['slots']
+        self.assertEqual([c['slot'] is not None for c in cells], [False, False, True, False, False, False, False])
+        self.assertEqual(cells[2]['slot'].session_ids, [self.session.id])
+
+    def test_json_grid_and_conditional_get(self):
+        url = reverse('sessions_week_grid')
+        resp = self.client.get(url, {'start': '2025-06-09'})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data['next_start'], '2025-06-16')
+        self.assertIn('Anna', data['html'])
+        self.assertNotIn('fill_month', data['html'])
+        resp = self.client.get(url, {'start': '2025-06-09'}, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        self.session.participants.add(Child.objects.create(first_name='Boris'))
+        resp = self.client.get(url, {'start': '2025-06-09'}, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+
+
+class SeriesOperationsTests(TestCase):
+    def setUp(self):
+        self.tz = timezone.get_current_timezone()
+        self.children = [Child.objects.create(first_name=f'Kid{i}') for i in range(6)]
+
+    def _session(self, *args, participants=()):
+        session = TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(*args), self.tz))
+        session.participants.add(*participants)
+        return session
+
+    def test_fill_month_query_count_is_constant(self):
+        small = self._session(2025, 6, 2, 18, 0, participants=self.children[:1])
+        with CaptureQueriesContext(connection) as few:
+            series.fill_month(small)
+        big = self._session(2025, 6, 3, 18, 0, participants=self.children)
+        with CaptureQueriesContext(connection) as many:
+            created = series.fill_month(big)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual([timezone.localtime(s.start).day for s in created], [10, 17, 24])
+        self.assertEqual(created[-1].participants.count(), 6)
+
+    def test_session_create_fill_month(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.client.post(reverse('session_create'), {
+            'date': '2025-06-02', 'time': '18:00', 'duration_minutes': 60,
+            'participants': [c.pk for c in self.children[:2]], 'fill_month': 'on',
+        })
+        sessions = TrainingSession.objects.in_local_range(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual(sessions.count(), 5)
+        self.assertEqual(TrainingSession.participants.through.objects.count(), 10)
+
+    def test_copy_week_and_month(self):
+        self._session(2025, 6, 3, 18, 0, participants=self.children[:2])   # 1-й вторник
+        self._session(2025, 6, 24, 18, 0, participants=self.children[:1])  # 4-й вторник
+        copied = series.copy_week(date(2025, 6, 2), date(2025, 6, 9))
+        self.assertEqual([timezone.localtime(s.start).date() for s in copied], [date(2025, 6, 10)])
+        self.assertEqual(copied[0].participants.count(), 2)
+        copied = series.copy_month(2025, 6)
+        self.assertEqual(sorted(timezone.localtime(s.start).date() for s in copied),
+                         [date(2025, 7, 1), date(2025, 7, 8), date(2025, 7, 22)])
+        self.assertEqual({timezone.localtime(s.start).hour for s in copied}, {18})
+
+    def test_remove_child_from_many_sessions_in_one_delete(self):
+        child = self.children[0]
+        sessions = [self._session(2025, 6, d, 18, 0, participants=[child]) for d in (2, 3, 4)]
+        # чтение начал занятий, DELETE участников, UPDATE версии занятий,
+        # чтение и UPDATE двух сводок посещаемости и точки сохранения
+        with self.assertNumQueries(11):
+            removed = series.remove_child_from_sessions(child, [s.id for s in sessions[:2]])
+        self.assertEqual(removed, 2)
+        self.assertEqual(child.sessions.count(), 1)
+
+
+class BatchAttendanceTests(TestCase):
+    def setUp(self):
+        self.sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+        self.session = TrainingSession.objects.create(start=timezone.now())
+        self.kids = {}
+        for name, remaining in (('Anna', 2), ('Boris', 1), ('Vera', 0), ('Gleb', None)):
+            child = Child.objects.create(first_name=name)
+            if remaining is not None:
+                Subscription.objects.create(child=child, sub_type=self.sub_type,
+                                            lessons_remaining=remaining, paid=True)
+            self.kids[name] = child
+        self.session.participants.add(*self.kids.values())
+
+    def test_marks_whole_group_in_fixed_queries(self):
+        with self.assertNumQueries(8):  # участники, остатки до, журнал занятия, UPDATE, остатки после, журнал + savepoint
+            results = mark_attendance(self.session, [c.id for c in self.kids.values()])
+        summary = {str(r.child): (r.status, r.lessons_remaining) for r in results}
+        self.assertEqual(summary, {
+            'Anna': (MARKED, 1),
+            'Boris': (EXHAUSTED, 0),
+            'Vera': (NO_LESSONS, 0),
+            'Gleb': (NO_SUBSCRIPTION, None),
+        })
+        paid = dict(Subscription.objects.values_list('child__first_name', 'paid'))
+        self.assertEqual(paid, {'Anna': True, 'Boris': False, 'Vera': True})
+
+    def test_only_session_participants_are_marked(self):
+        outsider = Child.objects.create(first_name='Outsider')
+        Subscription.objects.create(child=outsider, sub_type=self.sub_type, lessons_remaining=3)
+        mark_attendance(self.session, [outsider.id])
+        outsider.subscription.refresh_from_db()
+        self.assertEqual(outsider.subscription.lessons_remaining, 3)
+
+    def test_attendance_view(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        url = reverse('session_attendance', args=[self.session.pk])
+        self.assertContains(self.client.get(url), 'Отметить присутствующих')
+        resp = self.client.post(url, {'child_ids': [self.kids['Anna'].id]}, follow=True)
+        self.assertEqual(resp.redirect_chain, [(url, 302)])
+        self.assertContains(resp, 'Зачтено посещений: 1 из 1')
+        self.assertContains(resp, 'Посещение зачтено')
+
+    def test_attendance_view_rejects_bad_ids(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        url = reverse('session_attendance', args=[self.session.pk])
+        outsider = Child.objects.create(first_name='Outsider')
+        for ids in (['abc'], [str(2 ** 70)], [outsider.id]):
+            resp = self.client.post(url, {'child_ids': ids})
+            self.assertEqual(resp.status_code, 400)
+        self.assertFalse(LedgerEntry.objects.filter(kind=LedgerEntry.VISIT).exists())
+
+    def test_marking_twice_deducts_once(self):
+        ids = [self.kids['Anna'].id]
+        mark_attendance(self.session, ids)
+        results = mark_attendance(self.session, ids)
+        self.assertEqual([r.status for r in results], [ALREADY_MARKED])
+        self.assertEqual(Subscription.objects.get(child=self.kids['Anna']).lessons_remaining, 1)
+        self.assertEqual(LedgerEntry.objects.filter(kind=LedgerEntry.VISIT, session=self.session).count(), 1)
+
+
+class SubscriptionLedgerTests(TestCase):
+    def setUp(self):
+        self.sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+        self.child = Child.objects.create(first_name='Kid')
+        self.sub = Subscription.objects.create(child=self.child, sub_type=self.sub_type, lessons_remaining=2, paid=True)
+
+    def _ledger_balance(self):
+        return sum(self.sub.ledger.values_list('delta', flat=True))
+
+    def test_visits_and_topups_are_recorded(self):
+        session = TrainingSession.objects.create(start=timezone.now())
+        self.assertTrue(self.sub.add_visit(session=session))
+        self.assertTrue(self.sub.add_visit())
+        self.assertFalse(self.sub.add_visit())
+        self.assertEqual(self.sub.lessons_remaining, 0)
+        self.assertFalse(self.sub.paid)
+        self.sub.mark_paid_and_reset()
+        self.assertEqual(self.sub.lessons_remaining, 8)
+        kinds = list(self.sub.ledger.order_by('id').values_list('kind', 'delta'))
+        self.assertEqual(kinds, [('opening', 2), ('visit', -1), ('visit', -1), ('topup', 8)])
+        self.assertEqual(self.sub.ledger.filter(session=session).count(), 1)
+        self.assertEqual(self._ledger_balance(), 8)
+
+    def test_stale_instance_does_not_lose_visit(self):
+        stale = Subscription.objects.get(pk=self.sub.pk)
+        self.sub.add_visit()
+        stale.add_visit()
+        self.sub.refresh_from_db()
+        self.assertEqual(self.sub.lessons_remaining, 0)
+
+    def test_admin_edit_writes_adjustment(self):
+        self.sub.lessons_remaining = 5
+        self.sub.save()
+        self.assertEqual(self.sub.ledger.first().kind, LedgerEntry.ADJUSTMENT)
+        self.assertEqual(self._ledger_balance(), 5)
+
+    def test_recompute_balances_from_ledger(self):
+        self.sub.add_visit()
+        Subscription.objects.filter(pk=self.sub.pk).update(lessons_remaining=7)
+        call_command('recompute_balances', chunk_size=1, stdout=StringIO())
+        self.sub.refresh_from_db()
+        self.assertEqual(self.sub.lessons_remaining, 1)
+
+    def test_recompute_balances_adjusts_negative_ledger(self):
+        LedgerEntry.objects.create(subscription=self.sub, kind=LedgerEntry.VISIT, delta=-5)
+        Subscription.objects.filter(pk=self.sub.pk).update(lessons_remaining=2)
+        out = StringIO()
+        call_command('recompute_balances', stdout=out)
+        self.sub.refresh_from_db()
+        self.assertEqual(self.sub.lessons_remaining, 0)
+        self.assertEqual(self._ledger_balance(), 0)
+        self.assertEqual(self.sub.ledger.first().kind, LedgerEntry.ADJUSTMENT)
+        self.assertIn('Корректировок журнала: 1', out.getvalue())
+        call_command('recompute_balances', stdout=out)
+        self.assertEqual(self.sub.ledger.filter(kind=LedgerEntry.ADJUSTMENT).count(), 1)
+
+    def test_issue_subscription_records_topup(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.client.post(reverse('issue_subscription', args=[self.child.pk]),
+                         {'sub_type': self.sub_type.pk, 'mark_paid': 'on'})
+        self.assertEqual(self.sub.ledger.first().kind, LedgerEntry.TOPUP)
+        self.assertEqual(self._ledger_balance(), 8)
+
+
+class RevenueRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.basic = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+        self.big = SubscriptionType.objects.create(name='Big', lessons_count=16, price=180)
+        self.child = Child.objects.create(first_name='Kid')
+        self.sub = Subscription.objects.create(child=self.child, sub_type=self.basic, lessons_remaining=0)
+
+    def _rollups(self):
+        return list(RevenueRollup.objects.values_list('sub_type__name', 'total', 'payments'))
+
+    def test_payments_update_rollups(self):
+        self.client.post(reverse('mark_payment'), {'child_id': self.child.pk})
+        self.client.post(reverse('subscription_edit', args=[self.child.pk]),
+                         {'sub_type': self.big.pk, 'price': '150', 'mark_paid': 'on'})
+        # без отметки об оплате деньги не записываются
+        self.client.post(reverse('issue_subscription', args=[self.child.pk]), {'sub_type': self.basic.pk})
+        self.client.post(reverse('issue_subscription', args=[self.child.pk]),
+                         {'sub_type': self.basic.pk, 'mark_paid': 'on'})
+        self.assertEqual(Payment.objects.count(), 3)
+        self.assertEqual(self._rollups(), [('Basic', Decimal('200.00'), 2), ('Big', Decimal('150.00'), 1)])
+        self.assertEqual(RevenueRollup.objects.get(sub_type=self.basic).month,
+                         timezone.localdate().replace(day=1))
+
+    def test_rebuild_matches_incremental(self):
+        last_year = timezone.now() - timedelta(days=400)
+        Payment.objects.record(self.sub, Decimal('90'), created_at=last_year)
+        Payment.objects.record(self.sub, Decimal('100'))
+        Payment.objects.record(self.sub, Decimal('180'), sub_type=self.big)
+        expected = list(RevenueRollup.objects.values_list('month', 'sub_type', 'total', 'payments'))
+        RevenueRollup.objects.update(total=0)
+        call_command('rebuild_revenue_rollups', stdout=StringIO())
+        self.assertEqual(list(RevenueRollup.objects.values_list('month', 'sub_type', 'total', 'payments')), expected)
+        # удаление ученика не стирает выручку
+        self.child.delete()
+        self.assertEqual(Payment.objects.filter(subscription__isnull=True).count(), 3)
+
+    def test_dashboard_reads_rollups_only(self):
+        year = timezone.localdate().year
+        Payment.objects.record(self.sub, Decimal('100'))
+        url = reverse('finance_dashboard')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            resp = self.client.get(url, {'year': year})
+        self.assertEqual(resp.context['total'], Decimal('100'))
+        for _ in range(30):
+            Payment.objects.record(self.sub, Decimal('100'), sub_type=self.big)
+        with CaptureQueriesContext(connection) as many:
+            resp = self.client.get(url, {'year': year})
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(resp.context['month_totals'][timezone.localdate().month - 1], Decimal('3100'))
+        self.assertFalse(any('SUM(' in q['sql'].upper() for q in many.captured_queries))
+
+
+class AttendanceRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tz = timezone.get_current_timezone()
+        self.children = [Child.objects.create(first_name=f'Kid{i}') for i in range(4)]
+
+    def _session(self, *args, participants=()):
+        session = TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(*args), self.tz))
+        session.participants.add(*participants)
+        return session
+
+    def _snapshot(self):
+        return (list(SlotOccupancy.objects.values_list('day', 'start_time', 'sessions', 'participants')),
+                list(ChildMonthAttendance.objects.order_by('child_id', 'month')
+                     .values_list('child_id', 'month', 'sessions')))
+
+    def assertMatchesRebuild(self):
+        incremental = self._snapshot()
+        call_command('rebuild_analytics', stdout=StringIO())
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_signals_keep_rollups_in_sync(self):
+        a, b, c, d = self.children
+        first = self._session(2025, 6, 2, 18, 0, participants=[a, b])
+        second = self._session(2025, 6, 9, 18, 0, participants=[a])
+        slot = SlotOccupancy.objects.get(day=date(2025, 6, 2))
+        self.assertEqual((slot.sessions, slot.participants), (1, 2))
+        self.assertEqual(ChildMonthAttendance.objects.get(child=a).sessions, 2)
+        self.assertMatchesRebuild()
+
+        first.participants.remove(c)  # его там не было
+        first.participants.remove(b)
+        d.sessions.add(first, second)
+        second.start = timezone.make_aware(timezone.datetime(2025, 7, 1, 10, 0), self.tz)
+        second.save()
+        self.assertFalse(SlotOccupancy.objects.filter(day=date(2025, 6, 9)).exists())
+        self.assertEqual(ChildMonthAttendance.objects.get(child=d, month=date(2025, 7, 1)).sessions, 1)
+        self.assertMatchesRebuild()
+
+        a.sessions.clear()
+        first.participants.clear()
+        second.delete()
+        d.delete()
+        self.assertEqual(self._snapshot()[0], [(date(2025, 6, 2), timezone.datetime(2025, 6, 2, 18, 0).time(), 1, 0)])
+        self.assertMatchesRebuild()
+
+    def test_series_operations_update_rollups(self):
+        a, b = self.children[:2]
+        session = self._session(2025, 6, 2, 18, 0, participants=[a, b])
+        series.fill_month(session)
+        series.copy_week(date(2025, 6, 2), date(2025, 7, 7))
+        self.assertEqual(ChildMonthAttendance.objects.get(child=a, month=date(2025, 6, 1)).sessions, 5)
+        june = TrainingSession.objects.in_local_range(date(2025, 6, 1), date(2025, 6, 30)).values_list('id', flat=True)
+        series.remove_child_from_sessions(b, list(june))
+        self.assertFalse(ChildMonthAttendance.objects.filter(child=b, month=date(2025, 6, 1)).exists())
+        self.assertMatchesRebuild()
+
+    def test_analytics_page_reads_rollups_only(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        url = reverse('analytics_dashboard')
+        params = {'period': 'season', 'date': '2025-07-01'}
+        self._session(2025, 6, 2, 18, 0, participants=self.children[:3])
+        self.client.get(url, params)
+        with CaptureQueriesContext(connection) as few:
+            resp = self.client.get(url, params)
+        start_time, cells = resp.context['heatmap'][0]
+        self.assertEqual(cells[0]['average'], 3)
+        for day in range(3, 30):
+            self._session(2025, 6, day, 18, 0, participants=self.children)
+        with CaptureQueriesContext(connection) as many:
+            resp = self.client.get(url, params)
+        self.assertEqual(len(few), len(many))
+        self.assertNotIn('core_trainingsession', ' '.join(q['sql'] for q in many.captured_queries))
+        self.assertEqual(len(resp.context['children']), 4)
+
+    def test_analytics_children_are_paged(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        url = reverse('analytics_dashboard')
+        params = {'period': 'season', 'date': '2025-07-01'}
+        self._session(2025, 6, 2, 18, 0, participants=self.children)
+        self._session(2025, 7, 2, 18, 0, participants=self.children[:1])
+        with mock.patch('core.views.ANALYTICS_CHILDREN_PAGE_SIZE', 3):
+            first = self.client.get(url, params)
+            rows = first.context['children']
+            self.assertEqual([str(child) for child, _, _ in rows], ['Kid0', 'Kid1', 'Kid2'])
+            self.assertEqual(rows[0][2], 2)
+            second = self.client.get(url, {**params, 'after': first.context['page'].next_cursor})
+        self.assertEqual([str(child) for child, _, _ in second.context['children']], ['Kid3'])
+        self.assertFalse(second.context['page'].has_next)
+
+
+class SessionCapacityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.tz = timezone.get_current_timezone()
+        self.children = [Child.objects.create(first_name=f'Kid{i}') for i in range(4)]
+        self.session = TrainingSession.objects.create(
+            start=timezone.make_aware(timezone.datetime(2025, 6, 2, 18, 0), self.tz), capacity=2)
+
+    def _count(self):
+        self.session.refresh_from_db()
+        return self.session.participant_count
+
+    def test_count_follows_participants(self):
+        a, b, c, d = self.children
+        self.session.participants.add(a, b)
+        self.session.participants.add(a)
+        self.assertEqual(self._count(), 2)
+        self.session.participants.remove(a, c)
+        self.assertEqual(self._count(), 1)
+        b.sessions.clear()
+        self.assertEqual(self._count(), 0)
+        c.sessions.add(self.session)
+        c.delete()
+        self.assertEqual(self._count(), 0)
+
+    def test_over_capacity_add_is_refused(self):
+        a, b, c, d = self.children
+        self.session.participants.add(a)
+        with self.assertRaises(SessionFull), transaction.atomic():
+            self.session.participants.add(b, c)
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(self.session.participants.count(), 1)
+        # устаревший экземпляр не затирает счётчик при сохранении
+        stale = TrainingSession.objects.get(pk=self.session.pk)
+        self.session.participants.add(b)
+        stale.notes = 'x'
+        stale.save()
+        self.assertEqual(self._count(), 2)
+        with self.assertRaises(SessionFull), transaction.atomic():
+            d.sessions.add(self.session)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TrainingSession.objects.filter(pk=self.session.pk).update(capacity=1)
+
+    def test_views_refuse_and_series_copy_counts(self):
+        a, b, c, d = self.children
+        self.session.participants.add(a, b)
+        resp = self.client.post(reverse('session_add_child', args=[self.session.pk, c.pk]), follow=True)
+        self.assertContains(resp, 'Нет свободных мест')
+        self.assertEqual(self._count(), 2)
+        resp = self.client.post(reverse('session_edit', args=[self.session.pk]), {
+            'date': '2025-06-02', 'time': '18:00', 'duration_minutes': 60, 'capacity': 2,
+            'participants': [a.pk, b.pk, c.pk],
+        })
+        self.assertContains(resp, 'Участников больше, чем мест')
+        # уменьшение вместимости вместе с удалением участника
+        self.client.post(reverse('session_edit', args=[self.session.pk]), {
+            'date': '2025-06-02', 'time': '18:00', 'duration_minutes': 60, 'capacity': 1,
+            'participants': [a.pk],
+        })
+        self.assertEqual((self._count(), self.session.capacity), (1, 1))
+        copies = series.fill_month(self.session)
+        self.assertEqual({(s.capacity, s.participant_count) for s in TrainingSession.objects.filter(
+            pk__in=[s.pk for s in copies])}, {(1, 1)})
+        series.remove_child_from_sessions(a, [s.pk for s in copies])
+        self.assertEqual(set(TrainingSession.objects.filter(pk__in=[s.pk for s in copies])
+                             .values_list('participant_count', flat=True)), {0})
+
+    def test_django_admin_checks_capacity(self):
+        a, b, c, d = self.children
+        User.objects.create_superuser(username='root', password='pass')
+        self.client.login(username='root', password='pass')
+        url = reverse('admin:core_trainingsession_change', args=[self.session.pk])
+        data = {'start_0': '2025-06-02', 'start_1': '18:00:00', 'duration_minutes': 60, 'notes': '', 'capacity': 2}
+        resp = self.client.post(url, {**data, 'participants': [a.pk, b.pk, c.pk]})
+        self.assertContains(resp, 'Участников больше, чем мест (2)')
+        self.assertEqual(self._count(), 0)
+        self.client.post(url, {**data, 'participants': [a.pk, b.pk]})
+        self.assertEqual(self._count(), 2)
+        # уменьшение мест вместе с удалением участника
+        resp = self.client.post(url, {**data, 'capacity': 1, 'participants': [c.pk]})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual((self._count(), self.session.capacity), (1, 1))
+        self.assertEqual(list(self.session.participants.all()), [c])
+
+    def test_session_form_lists_only_selected_children(self):
+        a, b, c, d = self.children
+        self.session.participants.add(a)
+        resp = self.client.get(reverse('session_edit', args=[self.session.pk]))
+        self.assertContains(resp, f'<option value="{a.pk}" selected>Kid0</option>', html=True)
+        self.assertNotContains(resp, 'Kid1')
+        resp = self.client.get(reverse('sessions_week'), {'start': '2025-06-02'})
+        self.assertNotContains(resp, f'<option value="{b.pk}">', html=True)
+        # варианты не выводятся, но проверяются: добавить можно любого ученика
+        self.client.post(reverse('session_edit', args=[self.session.pk]), {
+            'date': '2025-06-02', 'time': '18:00', 'duration_minutes': 60, 'capacity': 2,
+            'participants': [a.pk, d.pk],
+        })
+        self.assertEqual(set(self.session.participants.all()), {a, d})
+
+    def test_calendar_shows_places_from_column(self):
+        self.session.participants.add(*self.children[:2])
+        cal = build_calendar(date(2025, 6, 1), date(2025, 6, 30), mode=COUNT)
+        slot = cal.slots_by_day[date(2025, 6, 2)][0]
+        self.assertEqual((slot.places_taken, slot.capacity, slot.is_full), (2, 2, True))
+        resp = self.client.get(reverse('sessions_week'), {'start': '2025-06-02'})
+        self.assertContains(resp, '2 / 2')
+
+
+class ScheduleConflictTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.tz = timezone.get_current_timezone()
+        self.children = [Child.objects.create(first_name=f'Kid{i}') for i in range(20)]
+        self.busy = self._session(2025, 6, 2, 18, 0, participants=self.children[:1])
+
+    def _at(self, *args):
+        return timezone.make_aware(timezone.datetime(*args), self.tz)
+
+    def _session(self, *args, participants=(), duration=60):
+        session = TrainingSession.objects.create(start=self._at(*args), duration_minutes=duration)
+        session.participants.add(*participants)
+        return session
+
+    def test_end_is_stored(self):
+        self.assertEqual(self.busy.end, self._at(2025, 6, 2, 19, 0))
+        self.busy.duration_minutes = 90
+        self.busy.save(update_fields=['duration_minutes'])
+        self.assertEqual(TrainingSession.objects.get(pk=self.busy.pk).end, self._at(2025, 6, 2, 19, 30))
+        created = TrainingSession.objects.bulk_create([TrainingSession(start=self._at(2025, 6, 3, 10, 0))])
+        self.assertEqual(TrainingSession.objects.get(pk=created[0].pk).end, self._at(2025, 6, 3, 11, 0))
+
+    def test_add_child_checks_conflicts_inside_transaction(self):
+        session = self._session(2025, 6, 3, 18, 0)
+        outer = len(connection.atomic_blocks)
+        depths = []
+        check = conflicts.check
+        with mock.patch('core.views.conflicts.check',
+                        side_effect=lambda *a, **kw: depths.append(len(connection.atomic_blocks)) or check(*a, **kw)):
+            self.client.post(reverse('session_add_child', args=[session.pk, self.children[1].pk]))
+        # проверка идёт в той же транзакции, что и добавление, а не до неё
+        self.assertEqual(depths, [outer + 1])
+        self.assertTrue(session.participants.filter(pk=self.children[1].pk).exists())
+
+    def test_session_form_checks_conflicts_inside_transaction(self):
+        kid = self.children[0]
+        other = self._session(2025, 6, 3, 18, 0)
+        outer = len(connection.atomic_blocks)
+        depths = []
+        check = conflicts.check
+        with mock.patch('core.forms.conflicts.check',
+                        side_effect=lambda *a, **kw: depths.append(len(connection.atomic_blocks)) or check(*a, **kw)):
+            self.client.post(reverse('session_create'), {
+                'date': '2025-06-04', 'time': '18:00', 'duration_minutes': 60, 'participants': [kid.pk],
+            })
+            resp = self.client.post(reverse('session_edit', args=[other.pk]), {
+                'date': '2025-06-02', 'time': '18:30', 'duration_minutes': 60, 'participants': [kid.pk],
+            })
+        self.assertEqual(depths, [outer + 1, outer + 1])
+        self.assertContains(resp, 'уже записан(а)')
+        # отказ откатывает и само занятие
+        other.refresh_from_db()
+        self.assertEqual(other.start, self._at(2025, 6, 3, 18, 0))
+        self.assertFalse(other.participants.exists())
+
+    def test_add_child_and_form_refuse_overlaps(self):
+        kid = self.children[0]
+        overlapping = self._session(2025, 6, 2, 18, 30)
+        adjacent = self._session(2025, 6, 2, 19, 0)
+        resp = self.client.post(reverse('session_add_child', args=[overlapping.pk, kid.pk]), follow=True)
+        self.assertContains(resp, 'уже записан(а) на 02.06 18:00–19:00')
+        self.assertFalse(overlapping.participants.exists())
+        self.client.post(reverse('session_add_child', args=[adjacent.pk, kid.pk]))
+        self.assertTrue(adjacent.participants.filter(pk=kid.pk).exists())
+
+        resp = self.client.post(reverse('session_create'), {
+            'date': '2025-06-02', 'time': '17:30', 'duration_minutes': 60, 'participants': [kid.pk],
+        })
+        self.assertContains(resp, 'уже записан(а)')
+        # правка занятия не конфликтует сама с собой
+        resp = self.client.post(reverse('session_edit', args=[self.busy.pk]), {
+            'date': '2025-06-02', 'time': '18:00', 'duration_minutes': 45, 'participants': [kid.pk],
+        })
+        self.assertEqual(resp.status_code, 302)
+
+    def test_series_conflicts_cost_constant_queries(self):
+        starts = [self._at(2025, 6, 2 + 7 * week, 18, 0) for week in range(1, 5)]
+        with CaptureQueriesContext(connection) as one:
+            conflicts.check([((starts[0], starts[0] + timedelta(hours=1)), [self.children[1].pk])],
+                            duplicates=True)
+        self._session(2025, 6, 23, 18, 30, participants=self.children[19:])
+        with CaptureQueriesContext(connection) as many:
+            with self.assertRaises(conflicts.ScheduleConflict) as caught:
+                conflicts.check([((start, start + timedelta(hours=1)), [c.pk for c in self.children])
+                                 for start in starts], duplicates=True)
+        self.assertEqual(len(one), len(many))
+        self.assertEqual([c.child_name for c in caught.exception.conflicts], ['Kid19'])
+
+    def test_fill_month_and_copy_refuse_duplicates(self):
+        self._session(2025, 6, 16, 18, 0)
+        with self.assertRaises(conflicts.ScheduleConflict):
+            series.fill_month(self.busy)
+        self.assertEqual(TrainingSession.objects.count(), 2)
+        resp = self.client.post(reverse('session_create'), {
+            'date': '2025-06-09', 'time': '18:00', 'duration_minutes': 60, 'fill_month': 'on',
+        })
+        self.assertContains(resp, 'уже есть в расписании')
+        self.assertEqual(TrainingSession.objects.count(), 2)
+        series.copy_week(date(2025, 6, 2), date(2025, 6, 9))
+        with self.assertRaises(conflicts.ScheduleConflict):
+            series.copy_week(date(2025, 6, 2), date(2025, 6, 9))
+
+
+class ChildrenListPagingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+        for i in range(7):
+            child = Child.objects.create(first_name=f'Kid{i}', is_adult=i % 2 == 0)
+            Subscription.objects.create(child=child, sub_type=self.sub_type, lessons_remaining=i, paid=i > 2)
+
+    def _names(self, response):
+        return [c.first_name for c in response.context['children']]
+
+    def test_pages_follow_cursors(self):
+        url = reverse('children_list')
+        with mock.patch('core.views.CHILDREN_PAGE_SIZE', 3):
+            first = self.client.get(url)
+            page = first.context['page']
+            self.assertEqual(self._names(first), ['Kid0', 'Kid1', 'Kid2'])
+            self.assertFalse(page.has_prev)
+            second = self.client.get(url, {'after': page.next_cursor})
+            self.assertEqual(self._names(second), ['Kid3', 'Kid4', 'Kid5'])
+            back = self.client.get(url, {'before': second.context['page'].prev_cursor})
+            self.assertEqual(self._names(back), ['Kid0', 'Kid1', 'Kid2'])
+            last = self.client.get(url, {'after': second.context['page'].next_cursor})
+            self.assertEqual(self._names(last), ['Kid6'])
+            self.assertFalse(last.context['page'].has_next)
+
+    def test_sort_and_filters(self):
+        url = reverse('children_list')
+        resp = self.client.get(url, {'sort': 'balance', 'dir': 'desc'})
+        self.assertEqual(self._names(resp)[:2], ['Kid6', 'Kid5'])
+        resp = self.client.get(url, {'status': 'unpaid'})
+        self.assertEqual(self._names(resp), ['Kid0', 'Kid1', 'Kid2'])
+        resp = self.client.get(url, {'status': 'zero', 'type': 'adult'})
+        self.assertEqual(self._names(resp), ['Kid0'])
+        resp = self.client.get(url, {'q': 'kid4'})
+        self.assertEqual(self._names(resp), ['Kid4'])
+
+    def test_tampered_cursor_is_ignored(self):
+        url = reverse('children_list')
+        for sort, values in (('name', ['x', 'y', 'z']), ('balance', ['x', 'y']), ('paid', [{}, 10 ** 30])):
+            resp = self.client.get(url, {'sort': sort, 'after': encode_cursor(values)})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(self._names(resp)), 7)
+
+    def test_subscriptions_list_is_paged(self):
+        url = reverse('subscriptions_list')
+        with mock.patch('core.views.SUBSCRIPTIONS_PAGE_SIZE', 4):
+            first = self.client.get(url)
+            self.assertEqual([s.child.first_name for s in first.context['subs']], ['Kid0', 'Kid1', 'Kid2', 'Kid3'])
+            second = self.client.get(url, {'after': first.context['page'].next_cursor})
+        self.assertEqual([s.child.first_name for s in second.context['subs']], ['Kid4', 'Kid5', 'Kid6'])
+        self.assertFalse(second.context['page'].has_next)
+
+    def test_query_count_does_not_depend_on_size(self):
+        url = reverse('children_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(20):
+            child = Child.objects.create(first_name=f'More{i}')
+            Subscription.objects.create(child=child, sub_type=self.sub_type, lessons_remaining=1)
+        # новые ученики сбрасывают кэш дней рождения — прогреваем заново
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(len(small), len(large))
+
+
+class ParentsDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.group = Group.objects.create(name='Parent')
+        for i in range(5):
+            parent = User.objects.create_user(username=f'parent{i}', email=f'p{i}@example.com', password='x')
+            parent.groups.add(self.group)
+            for name in ('Vera', 'Anna')[:i % 3]:
+                Child.objects.create(first_name=name, parent=parent)
+
+    def test_counts_and_ordered_children(self):
+        resp = self.client.get(reverse('parents_list'))
+        parents = {p.username: p for p in resp.context['parents']}
+        self.assertEqual(list(parents), [f'parent{i}' for i in range(5)])
+        self.assertEqual(parents['parent2'].children_count, 2)
+        self.assertEqual([c.first_name for c in parents['parent2'].children_list], ['Anna', 'Vera'])
+        self.assertEqual(parents['parent0'].children_count, 0)
+        self.assertNotIn('admin', parents)
+
+    def test_search_and_paging(self):
+        url = reverse('parents_list')
+        resp = self.client.get(url, {'q': 'P3@EXAMPLE'})
+        self.assertEqual([p.username for p in resp.context['parents']], ['parent3'])
+        with mock.patch('core.views.PARENTS_PAGE_SIZE', 2):
+            first = self.client.get(url)
+            second = self.client.get(url, {'after': first.context['page'].next_cursor})
+            self.assertEqual([p.username for p in second.context['parents']], ['parent2', 'parent3'])
+        # страница создания показывает ту же первую страницу справочника
+        resp = self.client.get(reverse('parent_create'))
+        self.assertEqual(list(resp.context['parents'])[2].children_count, 2)
+
+    def test_query_count_does_not_depend_on_size(self):
+        url = reverse('parents_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(10):
+            parent = User.objects.create_user(username=f'more{i}', password='x')
+            parent.groups.add(self.group)
+            Child.objects.create(first_name='Kid', parent=parent)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(len(small), len(large))
+
+
+class ChildSearchIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.parent = User.objects.create_user(username='petrova', email='mama@example.com', password='pass')
+        self.alyona = Child.objects.create(first_name='Алёна', last_name='Петрова', parent=self.parent)
+        self.boris = Child.objects.create(first_name='Борис', last_name='Иванов', notes='левша, лук 18 фунтов')
+
+    def _ids(self, query):
+        return [row[0] for row in search.search(query)]
+
+    def test_cyrillic_prefix_and_diacritics(self):
+        self.assertEqual(self._ids('але'), [self.alyona.id])
+        self.assertEqual(self._ids('Алёна Пет'), [self.alyona.id])
+        self.assertEqual(self._ids('левш'), [self.boris.id])
+        self.assertEqual(self._ids('mama@example'), [self.alyona.id])
+        self.assertEqual(self._ids('OR *'), [])
+
+    def test_login_does_not_reindex(self):
+        with mock.patch('core.signals.search.index_children') as index:
+            self.assertTrue(self.client.login(username='petrova', password='pass'))
+        index.assert_not_called()
+
+    def test_index_follows_models(self):
+        self.parent.email = 'papa@example.com'
+        self.parent.save()
+        self.assertEqual(self._ids('papa'), [self.alyona.id])
+        self.assertEqual(self._ids('mama'), [])
+        self.boris.first_name = 'Глеб'
+        self.boris.save()
+        self.assertEqual(self._ids('глеб'), [self.boris.id])
+        self.boris.delete()
+        self.assertEqual(self._ids('глеб'), [])
+        adult = Child.objects.create(first_name='Олег', is_adult=True,
+                                     account_user=User.objects.create_user(username='oleg_l'))
+        self.assertEqual(self._ids('oleg_l'), [adult.id])
+        adult.account_user.delete()
+        self.assertEqual(self._ids('oleg_l'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        self.assertEqual(self._ids('борис'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('2', out.getvalue())
+        self.assertEqual(self._ids('борис'), [self.boris.id])
+
+    def test_search_endpoint_and_children_list(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        data = self.client.get(reverse('children_search'), {'q': 'пет'}).json()
+        self.assertEqual([(r['id'], r['name']) for r in data['results']], [(self.alyona.id, 'Алёна Петрова')])
+        resp = self.client.get(reverse('children_list'), {'q': 'mama'})
+        self.assertEqual([c.id for c in resp.context['children']], [self.alyona.id])
+
+
+class SQLiteTuningTests(TestCase):
+    def _pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_pragmas(self):
+        self.assertEqual(self._pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self._pragma('temp_store'), 2)  # MEMORY
+        self.assertEqual(self._pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tz = timezone.get_current_timezone()
+        self.session = TrainingSession.objects.create(
+            start=timezone.make_aware(timezone.datetime(2025, 6, 11, 18, 0), tz))
+        self.parent = User.objects.create_user(username='parent', password='pass')
+        self.parent.groups.add(Group.objects.create(name='Parent'))
+        self.child = Child.objects.create(first_name='Anna', parent=self.parent)
+        self.session.participants.add(self.child)
+        self.sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+
+    def _revalidate(self, url, params=None):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        second = self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        return first['ETag'], second
+
+    def test_landing_not_modified_until_sessions_change(self):
+        params = {'year': 2025, 'month': 6}
+        etag, resp = self._revalidate(reverse('home'), params)
+        self.assertEqual(resp.status_code, 304)
+        self.session.participants.add(Child.objects.create(first_name='Boris'))
+        resp = self.client.get(reverse('home'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_month_calendar_sees_deletes_and_renames(self):
+        self.client.force_login(self.parent)
+        params = {'year': 2025, 'month': 6}
+        etag, resp = self._revalidate(reverse('schedule_month'), params)
+        self.assertEqual(resp.status_code, 304)
+        self.child.first_name = 'Anya'
+        self.child.save()
+        resp = self.client.get(reverse('schedule_month'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+        self.session.delete()
+        resp = self.client.get(reverse('schedule_month'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_my_children_sees_visits(self):
+        sub = Subscription.objects.create(child=self.child, sub_type=self.sub_type, lessons_remaining=3)
+        self.client.force_login(self.parent)
+        etag, resp = self._revalidate(reverse('my_children'))
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(len(resp.content), 0)
+        sub.add_visit()
+        resp = self.client.get(reverse('my_children'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_my_children_sees_subscription_type_changes(self):
+        Subscription.objects.create(child=self.child, sub_type=self.sub_type, lessons_remaining=3)
+        self.client.force_login(self.parent)
+        etag, resp = self._revalidate(reverse('my_children'))
+        self.assertEqual(resp.status_code, 304)
+        self.sub_type.name = 'Premium'
+        self.sub_type.lessons_count = 12
+        self.sub_type.save()
+        resp = self.client.get(reverse('my_children'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, 'Premium')
+
+    def test_not_modified_skips_calendar_work(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        params = {'year': 2025, 'month': 6}
+        etag = self.client.get(reverse('sessions_month'), params)['ETag']
+        with mock.patch('core.views.build_calendar') as build:
+            resp = self.client.get(reverse('sessions_month'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        build.assert_not_called()
+
+
+class MyScheduleWindowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.parent = User.objects.create_user(username='parent', password='pass')
+        self.parent.groups.add(Group.objects.create(name='Parent'))
+        self.kid = Child.objects.create(first_name='Anna', parent=self.parent)
+        self.other = Child.objects.create(first_name='Stranger')
+        now = timezone.now()
+        self.sessions = []
+        for weeks in (-30, -20, -10, -2, 1, 2):
+            session = TrainingSession.objects.create(start=now + timedelta(weeks=weeks))
+            session.participants.add(self.kid, self.other)
+            self.sessions.append(session)
+        # занятие без своих детей не показывается
+        TrainingSession.objects.create(start=now).participants.add(self.other)
+        self.client.force_login(self.parent)
+
+    def test_default_window_and_history(self):
+        resp = self.client.get(reverse('my_schedule'))
+        self.assertEqual(list(resp.context['sessions']), self.sessions[3:])
+        self.assertNotContains(resp, 'Stranger')
+        self.assertContains(resp, 'Anna')
+        with mock.patch('core.views.MY_SCHEDULE_PAGE_SIZE', 2):
+            history = self.client.get(reverse('my_schedule'), {'before': resp.context['page'].prev_cursor})
+            self.assertEqual(list(history.context['sessions']), self.sessions[1:3])
+            older = self.client.get(reverse('my_schedule'), {'before': history.context['page'].prev_cursor})
+            self.assertEqual(list(older.context['sessions']), self.sessions[:1])
+            self.assertFalse(older.context['page'].has_prev)
+
+    def test_tampered_cursor_shows_default_window(self):
+        resp = self.client.get(reverse('my_schedule'), {'after': encode_cursor(['x', 'y'])})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.context['sessions']), self.sessions[3:])
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.client.get(reverse('my_schedule'))
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse('my_schedule'))
+        now = timezone.now()
+        for days in range(1, 15):
+            TrainingSession.objects.create(start=now + timedelta(days=days)).participants.add(self.kid)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(reverse('my_schedule'))
+        self.assertEqual(len(before), len(after))
+
+
+CSRF_VALUE_RE = re.compile(r'(csrfmiddlewaretoken" value=")[^"]+')
+
+
+@override_settings(ROOT_URLCONF='config.asgi_urls')
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tz = timezone.get_current_timezone()
+        self.parent = User.objects.create_user(username='parent', password='pass')
+        self.parent.groups.add(Group.objects.create(name='Parent'))
+        self.kid = Child.objects.create(first_name='Anna', parent=self.parent)
+        self.student = User.objects.create_user(username='student', password='pass')
+        self.student.groups.add(Group.objects.create(name='Student'))
+        adult = Child.objects.create(first_name='Adult', is_adult=True, account_user=self.student)
+        sub_type = SubscriptionType.objects.create(name='Adult Pass', lessons_count=8, price=100)
+        Subscription.objects.create(child=adult, sub_type=sub_type, lessons_remaining=5, paid=True)
+        Subscription.objects.create(child=self.kid, sub_type=sub_type, lessons_remaining=3)
+        now = timezone.now()
+        for days in (-3, 2, 9):
+            TrainingSession.objects.create(start=now + timedelta(days=days), capacity=4).participants.add(self.kid)
+        june = TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(2025, 6, 11, 18, 0), tz))
+        june.participants.add(self.kid, adult)
+
+    def _normalized(self, response):
+        return CSRF_VALUE_RE.sub(r'\1', response.content.decode())
+
+    async def test_pages_match_sync_views(self):
+        pages = [
+            (None, reverse('home'), {'year': 2025, 'month': 6}),
+            (self.parent, reverse('schedule_month'), {'year': 2025, 'month': 6}),
+            (self.parent, reverse('my_schedule'), {}),
+            (self.parent, reverse('my_children'), {}),
+            (self.student, reverse('my_schedule'), {}),
+            (self.student, reverse('my_subscription'), {}),
+        ]
+        for user, url, params in pages:
+            with self.subTest(user=user, url=url):
+                with self.settings(ROOT_URLCONF='config.urls'):
+                    sync_client = Client()
+                    if user is not None:
+                        await sync_to_async(sync_client.force_login)(user)
+                    expected = await sync_to_async(sync_client.get)(url, params)
+                async_client = AsyncClient()
+                if user is not None:
+                    await async_client.aforce_login(user)
+                resp = await async_client.get(url, params)
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(self._normalized(resp), self._normalized(expected))
+
+    async def test_conditional_get_and_access(self):
+        await self.async_client.aforce_login(self.parent)
+        first = await self.async_client.get(reverse('my_children'))
+        self.assertContains(first, 'Adult Pass (8)')
+        self.assertIn('no-cache', first['Cache-Control'])
+        second = await self.async_client.get(reverse('my_children'), headers={'if-none-match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+        resp = await self.async_client.get(reverse('my_subscription'))
+        self.assertEqual(resp.status_code, 302)
+        resp = await self.async_client.get(reverse('home'))
+        self.assertRedirects(resp, reverse('my_schedule'), fetch_redirect_response=False)
+
+        await self.async_client.alogout()
+        resp = await self.async_client.get(reverse('schedule_month'))
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, resp['Location'])
+
+    async def test_forced_password_change_redirects(self):
+        await self.async_client.aforce_login(self.student)
+        session = await self.async_client.asession()
+        await session.aset('force_password_change', True)
+        await session.asave()
+        resp = await self.async_client.get(reverse('my_subscription'))
+        self.assertRedirects(resp, reverse('password_change'), fetch_redirect_response=False)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tz = timezone.get_current_timezone()
+        self.parent = User.objects.create_user(username='parent', password='pass')
+        self.parent.groups.add(Group.objects.create(name='Parent'))
+        self.kids = [Child.objects.create(first_name=name, parent=self.parent) for name in ('Anna', 'Boris')]
+        self.stranger = Child.objects.create(first_name='Stranger')
+        self.sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+        Subscription.objects.create(child=self.kids[0], sub_type=self.sub_type, lessons_remaining=3)
+        self.sessions = [
+            TrainingSession.objects.create(
+                start=timezone.make_aware(timezone.datetime(2025, 6, day, 18, 0), tz), capacity=6)
+            for day in (2, 4, 6)
+        ]
+        self.sessions[0].participants.add(self.kids[0])
+        self.range = {'from': '2025-06-01', 'to': '2025-06-30'}
+        self.client.force_login(self.parent)
+
+    def test_sessions_fields_and_paging(self):
+        resp = self.client.get(reverse('api_sessions'), {**self.range, 'fields': 'id,participant_count', 'limit': 2})
+        data = resp.json()
+        self.assertEqual(data['results'], [
+            {'id': self.sessions[0].id, 'participant_count': 1},
+            {'id': self.sessions[1].id, 'participant_count': 0},
+        ])
+        self.assertIsNone(data['prev'])
+        resp = self.client.get(reverse('api_sessions'), {**self.range, 'after': data['next'], 'limit': 2})
+        data = resp.json()
+        self.assertEqual([row['id'] for row in data['results']], [self.sessions[2].id])
+        self.assertEqual(set(data['results'][0]), set(api.SESSION_FIELDS))
+        self.assertIsNone(data['next'])
+
+        resp = self.client.get(reverse('api_sessions'), {'fields': 'id,password'})
+        self.assertEqual(resp.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_sessions')).status_code, 401)
+
+    def test_tampered_cursor_is_bad_request(self):
+        for url, cursor in ((reverse('api_sessions'), ['x', 'y']), (reverse('api_children'), ['x']),
+                            (reverse('api_children'), 'not base64 json')):
+            cursor = encode_cursor(cursor) if isinstance(cursor, list) else cursor
+            resp = self.client.get(url, {'before': cursor})
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('курсор', resp.json()['error'])
+
+    def test_etag_and_gzip(self):
+        url = reverse('api_sessions')
+        first = self.client.get(url, self.range, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        second = self.client.get(url, self.range, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.sessions[1].participants.add(self.kids[1])
+        third = self.client.get(url, self.range, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+
+    def test_children_balances_with_fixed_query_count(self):
+        url = reverse('api_children')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            data = self.client.get(url).json()
+        self.assertEqual([row['first_name'] for row in data['results']], ['Anna', 'Boris'])
+        self.assertEqual(data['results'][0]['lessons_remaining'], 3)
+        self.assertEqual(data['results'][0]['subscription_type'], 'Basic')
+        self.assertIsNone(data['results'][1]['lessons_remaining'])
+        for n in range(5):
+            kid = Child.objects.create(first_name=f'Kid{n}', parent=self.parent)
+            Subscription.objects.create(child=kid, sub_type=self.sub_type, lessons_remaining=n)
+        with CaptureQueriesContext(connection) as after:
+            self.assertEqual(len(self.client.get(url).json()['results']), 7)
+        self.assertEqual(len(before), len(after))
+
+    def test_student_subscription(self):
+        self.assertEqual(self.client.get(reverse('api_subscription')).status_code, 403)
+        student = User.objects.create_user(username='student', password='pass')
+        student.groups.add(Group.objects.create(name='Student'))
+        adult = Child.objects.create(first_name='Adult', is_adult=True, account_user=student)
+        self.client.force_login(student)
+        self.assertEqual(self.client.get(reverse('api_subscription')).status_code, 404)
+        Subscription.objects.create(child=adult, sub_type=self.sub_type, lessons_remaining=5, paid=True)
+        data = self.client.get(reverse('api_subscription'), {'fields': 'lessons_total,lessons_remaining,paid'}).json()
+        self.assertEqual(data, {'lessons_total': 8, 'lessons_remaining': 5, 'paid': True})
+        data = self.client.get(reverse('api_children'), {'fields': 'first_name'}).json()
+        self.assertEqual(data['results'], [{'first_name': 'Adult'}])
+
+
+class BenchBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 70 дней занятий: текущие неделя и месяц не пустые
+        bench.seed(children=40, parents=8, sessions=70 * bench.SESSIONS_PER_DAY)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_view_within_query_budget(self):
+        measurements = bench.measure_views(bench.Fixtures(), repeat=1)
+        self.assertEqual(len(measurements), len(bench.ROLES) * len(bench.core_url_patterns()))
+        self.assertEqual(bench.check_budgets(measurements, bench.load_budgets(), latency=False), [])
+
+    def test_budget_violations_reported(self):
+        budgets = {'parent': {'my_schedule': {'queries': 7, 'ms': 100}}}
+        ok = bench.Measurement('parent', 'my_schedule', 200, 7, 1.0, 20.0)
+        n_plus_one = ok._replace(queries=37)
+        self.assertEqual(bench.check_budgets([ok], budgets), [])
+        self.assertEqual(len(bench.check_budgets([n_plus_one, ok._replace(wall_ms=250.0)], budgets)), 2)
+        self.assertEqual(bench.check_budgets([ok._replace(wall_ms=250.0)], budgets, latency=False), [])
+        self.assertEqual(len(bench.check_budgets([ok._replace(name='new_view')], budgets)), 1)
+        # бюджет времени — цель, а не замер: медленная страница его не поднимает
+        slow = ok._replace(wall_ms=4000.0)
+        self.assertEqual(bench.budgets_from([slow]), {'parent': {'my_schedule': {'queries': 7, 'ms': bench.TARGET_MS}}})
+        self.assertEqual(len(bench.check_budgets([slow], bench.budgets_from([slow]))), 1)
+
+
+class ICalFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.parent = User.objects.create_user(username='parent', password='pass')
+        self.parent.groups.add(Group.objects.create(name='Parent'))
+        self.kid = Child.objects.create(first_name='Анна', parent=self.parent)
+        self.other = Child.objects.create(first_name='Stranger')
+        self.session = TrainingSession.objects.create(start=timezone.now() + timedelta(days=1), notes='Зал 2, лук')
+        self.session.participants.add(self.kid, self.other)
+        TrainingSession.objects.create(start=timezone.now()).participants.add(self.other)
+        TrainingSession.objects.create(start=timezone.now() - timedelta(weeks=20)).participants.add(self.kid)
+
+    def _url(self, token=None):
+        return reverse('ical_feed', args=[self.parent.pk, token or ical.feed_token(self.parent)])
+
+    def test_feed_contains_own_sessions(self):
+        resp = self.client.get(self._url())
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        body = b''.join(resp.streaming_content).decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:session-{self.session.pk}@', body)
+        self.assertIn('SUMMARY:Тренировка: Анна', body)
+        self.assertIn('DESCRIPTION:Зал 2\\, лук', body)
+        self.assertNotIn('Stranger', body)
+
+    def test_bad_or_revoked_token(self):
+        self.assertEqual(self.client.get(self._url('0' * 32)).status_code, 404)
+        url = self._url()
+        self.parent.set_password('new-pass')
+        self.parent.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_not_modified_and_cached_bytes(self):
+        first = self.client.get(self._url())
+        body = b''.join(first.streaming_content)
+        resp = self.client.get(self._url(), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        cached = self.client.get(self._url())
+        self.assertFalse(cached.streaming)
+        self.assertEqual(cached.content, body)
+        self.session.participants.remove(self.kid)
+        resp = self.client.get(self._url(), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+
+    def test_long_lines_are_folded(self):
+        line = ical._fold('SUMMARY:' + 'Ж' * 60)
+        self.assertTrue(all(len(part.encode()) <= 75 for part in line.rstrip('\r\n').split('\r\n')))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        parent = User.objects.create_user(username='mama', email='mama@example.com')
+        self.kid = Child.objects.create(first_name='Анна', last_name='Петрова', parent=parent)
+        sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+        self.sub = Subscription.objects.create(child=self.kid, sub_type=sub_type, lessons_remaining=3, paid=True)
+        tz = timezone.get_current_timezone()
+        self.session = TrainingSession.objects.create(start=timezone.make_aware(timezone.datetime(2025, 6, 11, 18, 0), tz))
+        self.session.participants.add(self.kid)
+        mark_attendance(self.session, [self.kid.id])
+
+    def _get(self, name, fmt, params=None):
+        resp = self.client.get(reverse('export_data', args=[name, fmt]), params)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content)
+
+    def test_subscriptions_csv(self):
+        body = self._get('subscriptions', 'csv').decode('utf-8-sig')
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['ID', 'ID ученика', 'Ученик'])
+        self.assertIn('Анна Петрова,mama,mama@example.com,Basic,8,2,6,0.00,да,', lines[1])
+
+    def test_attendance_xlsx_is_a_valid_workbook(self):
+        body = self._get('attendance', 'xlsx', {'from': '2025-06-01', 'to': '2025-06-30'})
+        import zipfile
+        from xml.etree import ElementTree
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            self.assertIn('[Content_Types].xml', archive.namelist())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [[''.join(c.itertext()) for c in row] for row in sheet.iterfind('.//s:row', ns)]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1:3], ['2025-06-11', '18:00'])
+        self.assertEqual(rows[1][-1], 'да')
+        empty = self._get('attendance', 'xlsx', {'from': '2025-07-01', 'to': '2025-07-31'})
+        with zipfile.ZipFile(BytesIO(empty)) as archive:
+            self.assertEqual(archive.read('xl/worksheets/sheet1.xml').count(b'<row>'), 1)
+
+    def test_xlsx_drops_xml_illegal_characters(self):
+        self.kid.notes = 'левша\x00\x07, лук\x1f 18 фунтов\tсиний'
+        self.kid.save()
+        body = self._get('children', 'xlsx')
+        import zipfile
+        from xml.etree import ElementTree
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [[''.join(c.itertext()) for c in row] for row in sheet.iterfind('.//s:row', ns)]
+        self.assertEqual(rows[1][-1], 'левша, лук 18 фунтов\tсиний')
+
+    def test_unknown_export(self):
+        resp = self.client.get(reverse('export_data', args=['users', 'csv']))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_command_writes_file(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'children.csv')
+            call_command('export_data', 'children', output=path, stderr=StringIO())
+            with open(path, encoding='utf-8-sig') as f:
+                self.assertIn('Анна,Петрова', f.read())
+
+
+class StudentImportTests(TestCase):
+    CSV = (
+        'type;first_name;last_name;birth_date;gender;notes;username;email;password;parent_first_name\n'
+        'child;Анна;Петрова;05.03.2016;Ж;;petrova;mama@example.com;secret-1;Ольга\n'
+        'child;Борис;Петров;2018-07-01;м;левша;petrova;;;\n'
+        'adult;Олег;Лучников;;;;oleg;oleg@example.com;secret-2;\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.sub_type = SubscriptionType.objects.create(name='Basic', lessons_count=8, price=100)
+
+    def test_import_creates_accounts_children_and_subscriptions(self):
+        result = imports.import_rows(imports.read_rows(self.CSV.encode('utf-8-sig')), workers=1)
+        self.assertEqual((result.parents, result.adults, result.children, result.subscriptions), (1, 1, 3, 3))
+        parent = User.objects.get(username='petrova')
+        self.assertTrue(parent.check_password('secret-1'))
+        self.assertEqual(parent.first_name, 'Ольга')
+        self.assertTrue(get_roles(parent).is_parent)
+        self.assertEqual(sorted(parent.children.values_list('first_name', flat=True)), ['Анна', 'Борис'])
+        anna = Child.objects.get(first_name='Анна')
+        self.assertEqual((anna.gender, anna.birthday_key), ('F', 305))
+        oleg = Child.objects.get(first_name='Олег')
+        self.assertTrue(oleg.is_adult)
+        self.assertTrue(get_roles(oleg.account_user).is_student)
+        self.assertEqual(anna.subscription.lessons_remaining, 8)
+        self.assertEqual(LedgerEntry.objects.filter(kind=LedgerEntry.OPENING).count(), 3)
+        self.assertEqual([row[0] for row in search.search('левша')], [Child.objects.get(first_name='Борис').id])
+
+    def test_invalid_file_imports_nothing(self):
+        User.objects.create_user(username='admin', is_staff=True)
+        data = (
+            'first_name,username,password,birth_date\n'
+            'Анна,petrova,secret-1,2016-03-05\n'
+            ',admin,,31.02.2016\n'
+        )
+        with self.assertRaises(imports.ImportValidationError) as ctx:
+            imports.import_rows(imports.read_rows(data))
+        lines = {line for line, _ in ctx.exception.errors}
+        self.assertEqual(lines, {3})
+        self.assertEqual(len(ctx.exception.errors), 3)  # имя, дата, чужой аккаунт
+        self.assertFalse(User.objects.filter(username='petrova').exists())
+        self.assertFalse(Child.objects.exists())
+
+    def test_existing_parent_is_reused(self):
+        parent = User.objects.create_user(username='petrova', password='old')
+        parent.groups.add(Group.objects.create(name='Parent'))
+        imports.import_rows(imports.read_rows('first_name,username\nВера,petrova\n'))
+        self.assertEqual(list(parent.children.values_list('first_name', flat=True)), ['Вера'])
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_passwords_hashed_in_process_pool(self):
+        hashes = imports.hash_passwords([f'pass-{i}' for i in range(8)], workers=2)
+        self.assertEqual(len(hashes), 8)
+        self.assertTrue(check_password('pass-3', hashes[3]))
+
+    def test_shared_pool_is_created_lazily_once(self):
+        imports._shared_pool.cache_clear()
+        self.addCleanup(imports._shared_pool.cache_clear)
+        with mock.patch.object(imports, 'ProcessPoolExecutor', wraps=imports.ProcessPoolExecutor) as executor:
+            imports.hash_passwords(['pass-0'] * 3)
+            executor.assert_not_called()
+            imports.hash_passwords([f'pass-{i}' for i in range(8)])
+            hashes = imports.hash_passwords([f'pass-{i}' for i in range(8)])
+        self.assertEqual(executor.call_count, 1)
+        self.addCleanup(imports._shared_pool().shutdown)
+        self.assertTrue(check_password('pass-5', hashes[5]))
+
+    def test_weak_passwords_are_rejected(self):
+        data = (
+            'type,first_name,username,password\n'
+            'child,Анна,petrova,12345678\n'
+            'adult,Олег,oleg,oleg\n'
+        )
+        with self.assertRaises(imports.ImportValidationError) as ctx:
+            imports.import_rows(imports.read_rows(data))
+        self.assertEqual([line for line, _ in ctx.exception.errors], [2, 3])
+        self.assertTrue(all(message.startswith('Пароль для') for _, message in ctx.exception.errors))
+        self.assertFalse(User.objects.exists())
+
+    def test_admin_upload(self):
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        upload = SimpleUploadedFile('students.csv', self.CSV.encode())
+        resp = self.client.post(reverse('students_import'), {'file': upload})
+        self.assertRedirects(resp, reverse('children_list'))
+        self.assertEqual(Child.objects.count(), 3)
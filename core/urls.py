@@ -1,19 +1,27 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
     # Админ
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('sessions/week/', views.sessions_week, name='sessions_week'),
+    path('sessions/week/grid/', views.sessions_week_grid, name='sessions_week_grid'),
     path('sessions/month/', views.sessions_month, name='sessions_month'),
+    path('sessions/year/', views.sessions_year, name='sessions_year'),
+    path('sessions/range/', views.sessions_range, name='sessions_range'),
     path('sessions/create/', views.session_create, name='session_create'),
+    path('sessions/copy-week/', views.sessions_copy_week, name='sessions_copy_week'),
+    path('sessions/copy-month/', views.sessions_copy_month, name='sessions_copy_month'),
     path('sessions/<int:pk>/add-child/<int:child_id>/', views.session_add_child, name='session_add_child'),
     path('sessions/<int:pk>/edit/', views.session_edit, name='session_edit'),
+    path('sessions/<int:pk>/attendance/', views.session_attendance, name='session_attendance'),
     path('sessions/<int:pk>/delete/', views.session_delete, name='session_delete'),
 
     path('children/', views.children_list, name='children_list'),
+    path('children/search/', views.children_search, name='children_search'),
     path('children/create/', views.child_create, name='child_create'),
+    path('children/import/', views.students_import, name='students_import'),
     path('children/<int:pk>/', views.child_detail, name='child_detail'),
     path('children/<int:pk>/sessions/delete/', views.child_sessions_delete, name='child_sessions_delete'),
     path('children/<int:pk>/edit/', views.child_edit, name='child_edit'),
@@ -22,9 +30,13 @@ urlpatterns = [
 
 
     path('subscriptions/', views.subscriptions_list, name='subscriptions_list'),
+    path('exports/<slug:name>.<slug:fmt>', views.export_data, name='export_data'),
     path('subscription-types/', views.subscription_types, name='subscription_types'),
     path('subscription-types/<int:pk>/edit/', views.subscription_type_edit, name='subscription_type_edit'),
 
+    path('parents/', views.parents_list, name='parents_list'),
+    path('finance/', views.finance_dashboard, name='finance_dashboard'),
+    path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
     path('parents/create/', views.parent_create, name='parent_create'),
 
     path('visit/add/', views.add_visit, name='add_visit'),
@@ -35,8 +47,14 @@ urlpatterns = [
     path('my/schedule/', views.my_schedule, name='my_schedule'),
     path('my/children/', views.my_children, name='my_children'),
     path('my/subscription/', views.my_subscription, name='my_subscription'),
+    path('calendar/<int:user_id>/<str:token>.ics', views.ical_feed, name='ical_feed'),
 
     path('children/<int:pk>/delete/', views.child_delete, name='child_delete'),
     path('parents/<int:user_id>/delete/', views.parent_delete, name='parent_delete'),
 
+    # API
+    path('api/v1/sessions/', api.sessions, name='api_sessions'),
+    path('api/v1/children/', api.children, name='api_children'),
+    path('api/v1/subscription/', api.subscription, name='api_subscription'),
+
 ]
@@ -0,0 +1,226 @@
+"""Версии данных страниц для условных GET (ETag → 304 Not Modified).
+
+Версия — MAX(updated_at) и число строк: максимум ловит изменения и
+добавления, число — удаления. Для диапазона занятий оба значения читаются
+из индекса (start, updated_at) одним запросом. updated_at обновляется при
+save(), при изменении участников и типа абонемента (core.signals) и в
+массовых UPDATE.
+
+ETag страницы складывается из версий данных, пользователя, CSRF-секрета
+(токены в формах) и текущей даты; пока ни одно не изменилось, страница
+отдаётся как 304 без группировки слотов и рендера шаблона. Страницы с
+непрочитанными flash-сообщениями всегда рендерятся заново.
+
+Last-Modified не выставляется: по одной дате нельзя заметить удаление
+занятия, а ETag учитывает и число строк.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from .calendars import month_range, parse_date, parse_month
+from .models import Child, Subscription, TrainingSession
+
+
+def _format_version(row):
+    last = row['last'].timestamp() if row['last'] else 0
+    return f"{row['n']}@{last}"
+
+
+def _version(queryset):
+    return _format_version(queryset.order_by().aggregate(last=Max('updated_at'), n=Count('id')))
+
+
+async def _aversion(queryset):
+    return _format_version(await queryset.order_by().aaggregate(last=Max('updated_at'), n=Count('id')))
+
+
+def sessions_version(date_from, date_to):
+    """Версия занятий за локальные дни [date_from, date_to] (включая участников)."""
+    return _version(TrainingSession.objects.in_local_range(date_from, date_to))
+
+
+def children_version(queryset=None):
+    """Версия учеников: имена видны в календарях и формах."""
+    return _version(Child.objects.all() if queryset is None else queryset)
+
+
+def subscriptions_version(queryset):
+    return _version(queryset)
+
+
+def _may_be_conditional(request):
+    return request.method == 'GET' and not len(messages.get_messages(request))
+
+
+def _page_etag(request, version):
+    # get_token выдаёт куку сразу, чтобы ETag первого ответа совпал со следующими
+    get_token(request)
+    parts = (
+        version,
+        request.user.pk,
+        request.META.get('CSRF_COOKIE', ''),
+        timezone.localdate().isoformat(),
+    )
+    return hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _private(response):
+    if response.has_header('ETag'):
+        # браузер хранит страницу, но каждый раз сверяет ETag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(version_func):
+    """Декоратор вида: 304, если версия страницы не изменилась.
+
+    version_func(request, *args, **kwargs) → строка версии или None, если
+    страницу нельзя отдавать условно (например, вид сделает редирект).
+    """
+    def etag_func(request, *args, **kwargs):
+        if not _may_be_conditional(request):
+            return None
+        version = version_func(request, *args, **kwargs)
+        if version is None:
+            return None
+        return _page_etag(request, version)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return _private(conditional_view(request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def aconditional_page(version_func):
+    """conditional_page для асинхронных видов; version_func — корутина.
+
+    django.views.decorators.http.condition вызывает etag_func синхронно даже
+    для асинхронного вида, поэтому проверка ETag повторена здесь.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag = None
+            if _may_be_conditional(request):
+                version = await version_func(request, *args, **kwargs)
+                if version is not None:
+                    etag = quote_etag(_page_etag(request, version))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag is not None:
+                response.headers.setdefault('ETag', etag)
+            return _private(response)
+        return wrapper
+    return decorator
+
+
+# --- версии конкретных страниц ---
+
+def month_version(request):
+    year, month = parse_month(request.GET, timezone.localdate())
+    return f'{sessions_version(*month_range(year, month))}|{children_version()}'
+
+
+def week_version(request):
+    today = timezone.localdate()
+    start = parse_date(request.GET.get('start'), today - timedelta(days=today.weekday()))
+    return f'{start}|{sessions_version(start, start + timedelta(days=6))}|{children_version()}'
+
+
+def landing_version(request):
+    if request.user.is_authenticated:
+        return None
+    year, month = parse_month(request.GET, timezone.localdate())
+    return sessions_version(*month_range(year, month))
+
+
+def schedule_month_version(request):
+    if request.roles.is_admin:
+        return None
+    return month_version(request)
+
+
+def own_children(user, roles):
+    """Ученики, чьё расписание видит пользователь: дети родителя или профиль взрослого."""
+    if roles.is_parent:
+        return Child.objects.filter(parent=user)
+    return Child.objects.filter(account_user=user)
+
+
+def schedule_version(children):
+    """Версия расписания учеников children (queryset): сами ученики и их занятия."""
+    sessions = TrainingSession.objects.filter(participants__in=children.values('id'))
+    return f'{children_version(children)}|{_version(sessions)}'
+
+
+def my_schedule_version(request):
+    roles = request.roles
+    if roles.is_admin:
+        return None
+    return f'{schedule_version(own_children(request.user, roles))}|{request.GET.urlencode()}'
+
+
+def my_children_version(request):
+    children = Child.objects.filter(parent=request.user)
+    subscriptions = Subscription.objects.filter(child__parent=request.user)
+    return f'{children_version(children)}|{subscriptions_version(subscriptions)}'
+
+
+# --- асинхронные версии (core.async_views) ---
+
+async def asessions_version(date_from, date_to):
+    return await _aversion(TrainingSession.objects.in_local_range(date_from, date_to))
+
+
+async def achildren_version(queryset=None):
+    return await _aversion(Child.objects.all() if queryset is None else queryset)
+
+
+async def amonth_version(request):
+    year, month = parse_month(request.GET, timezone.localdate())
+    return f'{await asessions_version(*month_range(year, month))}|{await achildren_version()}'
+
+
+async def alanding_version(request):
+    if request.user.is_authenticated:
+        return None
+    year, month = parse_month(request.GET, timezone.localdate())
+    return await asessions_version(*month_range(year, month))
+
+
+async def aschedule_month_version(request):
+    if request.roles.is_admin:
+        return None
+    return await amonth_version(request)
+
+
+async def aschedule_version(children):
+    sessions = TrainingSession.objects.filter(participants__in=children.values('id'))
+    return f'{await achildren_version(children)}|{await _aversion(sessions)}'
+
+
+async def amy_schedule_version(request):
+    roles = request.roles
+    if roles.is_admin:
+        return None
+    return f'{await aschedule_version(own_children(request.user, roles))}|{request.GET.urlencode()}'
+
+
+async def amy_children_version(request):
+    children = Child.objects.filter(parent=request.user)
+    subscriptions = Subscription.objects.filter(child__parent=request.user)
+    return f'{await achildren_version(children)}|{await _aversion(subscriptions)}'
@@ -1,26 +1,64 @@
-from datetime import timedelta, date
-from calendar import monthrange
+import hashlib
+from datetime import date, datetime, time, timedelta
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import User
 from django.contrib.auth import views as auth_views
-from django.db.models import Prefetch, Count
-from django.http import HttpResponseForbidden, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q, Value
+from django.db.models.functions import Coalesce
+from django.core.cache import cache
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect,
+    JsonResponse, StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag, urlencode
 
 from django.views.decorators.http import require_POST
 from django.urls import reverse, reverse_lazy
 
+from . import analytics, conflicts, exports, ical, imports, revenue, search, series, versions
+from .attendance import mark_attendance
 from .forms import (
-    AddVisitForm, StudentForm, ParentCreateForm,
+    AddVisitForm, AttendanceForm, StudentForm, StudentImportForm, ParentCreateForm,
     SubscriptionForm, SubscriptionTypeForm, TrainingSessionForm, IssueSubscriptionForm,
     BootstrapPasswordChangeForm,
 )
 
-from .models import Child, Subscription, SubscriptionType, TrainingSession
-from collections import defaultdict, OrderedDict
+from .calendars import (
+    COUNT, MAX_RANGE_DAYS, PERIODS, build_calendar, month_range,
+    neighbour_months, parse_date, parse_month, parse_year, period_range, week_grid,
+)
+from .conflicts import ScheduleConflict
+from .models import Child, LedgerEntry, Payment, SessionFull, Subscription, SubscriptionType, TrainingSession
+from .paging import cursor_values, encode_cursor, paginate_keyset
+from .roles import get_roles
+from .versions import conditional_page
+
+LEDGER_HISTORY_SIZE = 20
+
+MY_SCHEDULE_PAGE_SIZE = 30
+MY_SCHEDULE_HISTORY_WEEKS = 4
+ICAL_CONTENT_TYPE = 'text/calendar; charset=utf-8'
+ICAL_MAX_AGE = 5 * 60
+
+CHILDREN_PAGE_SIZE = 50
+PARENTS_PAGE_SIZE = 50
+ANALYTICS_CHILDREN_PAGE_SIZE = 50
+SUBSCRIPTIONS_PAGE_SIZE = 50
+FINANCE_RECENT_PAYMENTS = 20
+CHILDREN_SEARCH_LIMIT = 20
+# ключи сортировки списка учеников; последнее поле уникально для keyset-пагинации
+CHILDREN_SORTS = {
+    'name': ('first_name', 'last_name', 'id'),
+    'balance': ('balance', 'id'),
+    'paid': ('is_paid', 'id'),
+}
 
 # --- аутентификация ---
 
@@ -32,7 +70,7 @@ class CustomLoginView(auth_views.LoginView):
         user = form.get_user()
         first_login = user.last_login is None
         response = super().form_valid(form)
-        if first_login and user.groups.filter(name__in=['Parent', 'Student']).exists():
+        if first_login and {'Parent', 'Student'} & get_roles(user).groups:
             self.request.session['force_password_change'] = True
             return redirect('password_change')
         return response
@@ -50,20 +88,17 @@ class CustomPasswordChangeView(auth_views.PasswordChangeView):
 # --- роли ---
 
 def is_admin(user):
-    return user.is_authenticated and (user.is_staff or user.groups.filter(name='Admin').exists())
+    return get_roles(user).is_admin
 
 def is_parent(user):
-    return user.is_authenticated and user.groups.filter(name='Parent').exists() and not is_admin(user)
+    return get_roles(user).is_parent
 
 def is_student(user):
-    return (
-        user.is_authenticated
-        and user.groups.filter(name='Student').exists()
-        and not (is_admin(user) or is_parent(user))
-    )
+    return get_roles(user).is_student
 
 # --- корневая ---
 
+@conditional_page(versions.landing_version)
 def home(request):
     """Публичная главная страница.
 
@@ -71,68 +106,21 @@ def home(request):
     авторизованные перенаправляются в свой раздел.
     """
     if request.user.is_authenticated:
-        if is_admin(request.user):
+        if request.roles.is_admin:
             return redirect('admin_dashboard')
         return redirect('my_schedule')
 
     today = timezone.localdate()
-    try:
-        year = int(request.GET.get('year', today.year))
-        month = int(request.GET.get('month', today.month))
-    except (TypeError, ValueError):
-        year, month = today.year, today.month
-
-    # Нормализуем месяц
-    while month < 1:
-        year -= 1
-        month += 12
-    while month > 12:
-        year += 1
-        month -= 12
-
-    first_day = date(year, month, 1)
-    _, days_in_month = monthrange(year, month)
-    days = [first_day + timedelta(days=i) for i in range(days_in_month)]
-
-    sessions = (
-        TrainingSession.objects
-        .filter(start__year=year, start__month=month)
-        .prefetch_related('participants')
-    )
-    slots_by_day = _group_timeslots(sessions)
-
-    if month == 1:
-        prev_year, prev_month = year - 1, 12
-    else:
-        prev_year, prev_month = year, month - 1
-
-    if month == 12:
-        next_year, next_month = year + 1, 1
-    else:
-        next_year, next_month = year, month + 1
-
-    # Разбиение на недели с учетом дня недели первого числа
-    weeks = []
-    week = [None] * first_day.weekday()
-    for day in days:
-        week.append(day)
-        if len(week) == 7:
-            weeks.append(week)
-            week = []
-    if week:
-        week += [None] * (7 - len(week))
-        weeks.append(week)
+    year, month = parse_month(request.GET, today)
+    cal = build_calendar(*month_range(year, month), mode=COUNT)
 
     context = {
-        'days': days,
+        'days': cal.days,
         'month': month,
         'year': year,
-        'prev_year': prev_year,
-        'prev_month': prev_month,
-        'next_year': next_year,
-        'next_month': next_month,
-        'slots_by_day': slots_by_day,
-        'weeks': weeks,
+        **neighbour_months(year, month),
+        'slots_by_day': cal.slots_by_day,
+        'weeks': cal.weeks,
     }
     return render(request, 'landing.html', context)
 
@@ -141,132 +129,108 @@ def home(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_dashboard(request):
-    today = timezone.localdate()
-    upcoming = []
-    for child in Child.objects.filter(birth_date__isnull=False):
-        bd = child.birth_date.replace(year=today.year)
-        if bd < today:
-            bd = bd.replace(year=today.year + 1)
-        days_left = (bd - today).days
-        if 0 <= days_left <= 3:
-            upcoming.append({'child': child, 'date': bd, 'days_left': days_left})
-    upcoming.sort(key=lambda x: x['date'])
-    context = {'upcoming_birthdays': upcoming}
-    return render(request, 'admin/dashboard.html', context)
+    # ближайшие дни рождения приходят из context processor upcoming_birthdays
+    return render(request, 'admin/dashboard.html')
 
 @login_required
 @user_passes_test(is_admin)
+@conditional_page(versions.week_version)
 def sessions_week(request):
     today = timezone.localdate()
-    start_str = request.GET.get('start')
-    if start_str:
-        try:
-            start = date.fromisoformat(start_str)
-        except (ValueError, TypeError):
-            start = today - timedelta(days=today.weekday())
-    else:
-        start = today - timedelta(days=today.weekday())
+    context = _week_context(request, today)
+    context['form'] = TrainingSessionForm()
+    return render(request, 'admin/sessions_week.html', context)
 
-    days = [start + timedelta(days=i) for i in range(7)]
-    end = days[-1] + timedelta(days=1)
+@login_required
+@user_passes_test(is_admin)
+@conditional_page(versions.week_version)
+def sessions_week_grid(request):
+    """Сетка недели в JSON — для переключения недель без перерисовки страницы."""
+    today = timezone.localdate()
+    context = _week_context(request, today)
+    payload = {
+        'start': context['start'].isoformat(),
+        'prev_start': context['prev_start'].isoformat(),
+        'next_start': context['next_start'].isoformat(),
+        'title': f"{context['week_start']:%d.%m.%Y}–{context['week_end']:%d.%m.%Y}",
+        'html': render_to_string('includes/week_grid.html', context, request=request),
+    }
+    return JsonResponse(payload, json_dumps_params={'ensure_ascii': False})
 
-    sessions = (TrainingSession.objects
-                .filter(start__date__gte=days[0], start__date__lt=end)
-                .prefetch_related('participants'))
-    
-    slots_by_day = _group_timeslots(sessions)
-
-    # Собираем все уникальные времена начала занятий в течение недели
-    times = sorted({slot['start'].time()
-                    for day_slots in slots_by_day.values()
-                    for slot in day_slots})
-
-    # Формируем строковые данные для таблицы: для каждого времени - слоты по дням
-    table_rows = []
-    for t in times:
-        row = []
-        for day in days:
-            day_slots = slots_by_day.get(day, [])
-            slot = next((s for s in day_slots if s['start'].time() == t), None)
-            row.append({'day': day, 'slot': slot})
-        table_rows.append({'time': t, 'slots': row})
-
-    form = TrainingSessionForm()
-    context = {
-        'days': days,
-        'sessions': sessions,
-        'form': form,
+def _week_context(request, today):
+    start = parse_date(request.GET.get('start'), today - timedelta(days=today.weekday()))
+    cal = build_calendar(start, start + timedelta(days=6))
+    return {
+        'days': cal.days,
         'start': start,
+        'week_start': cal.date_from,
+        'week_end': cal.date_to,
         'prev_start': start - timedelta(days=7),
         'next_start': start + timedelta(days=7),
-        'slots_by_day': slots_by_day,
-        'table_rows': table_rows,
+        'slots_by_day': cal.slots_by_day,
+        'table_rows': week_grid(cal.days, cal.slots_by_day),
         'today': today,
     }
-    return render(request, 'admin/sessions_week.html', context)
 
 @login_required
 @user_passes_test(is_admin)
+@conditional_page(versions.month_version)
 def sessions_month(request):
     today = timezone.localdate()
-    try:
-        year = int(request.GET.get('year', today.year))
-        month = int(request.GET.get('month', today.month))
-    except (TypeError, ValueError):
-        year, month = today.year, today.month
-
-    # Нормализуем значения месяца на случай 0/13
-    while month < 1:
-        year -= 1
-        month += 12
-    while month > 12:
-        year += 1
-        month -= 12
-
-    first_day = date(year, month, 1)
-    _, days_in_month = monthrange(year, month)
-    days = [first_day + timedelta(days=i) for i in range(days_in_month)]
-
-    sessions = (TrainingSession.objects
-                .filter(start__year=year, start__month=month)
-                .prefetch_related('participants'))
-    slots_by_day = _group_timeslots(sessions)
-
-    # Соседние месяцы
-    if month == 1:
-        prev_year, prev_month = year - 1, 12
-    else:
-        prev_year, prev_month = year, month - 1
-
-    if month == 12:
-        next_year, next_month = year + 1, 1
-    else:
-        next_year, next_month = year, month + 1
-
-    # Разбиение на недели для календаря с учетом дня недели первого числа
-    weeks = []
-    week = [None] * first_day.weekday()
-    for day in days:
-        week.append(day)
-        if len(week) == 7:
-            weeks.append(week)
-            week = []
-
-    # Добавить последнюю неполную неделю
-    if week:
-        week += [None] * (7 - len(week))
-        weeks.append(week)
+    year, month = parse_month(request.GET, today)
+    cal = build_calendar(*month_range(year, month))
 
     return render(request, 'admin/sessions_month.html', {
-        'days': days,
+        'days': cal.days,
         'month': month,
         'year': year,
-        'month_date': first_day,
-        'sessions': sessions,
-        'prev_year': prev_year, 'prev_month': prev_month,
-        'next_year': next_year, 'next_month': next_month,
-        'slots_by_day': slots_by_day,
-        'weeks': weeks,  # Передаем недели для календаря
+        'month_date': cal.date_from,
+        **neighbour_months(year, month),
+        'slots_by_day': cal.slots_by_day,
+        'weeks': cal.weeks,  # Передаем недели для календаря
+        'today': today,
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def sessions_year(request):
+    """Обзор года: 12 месячных сеток с количеством слотов, один запрос за занятия."""
+    today = timezone.localdate()
+    year = parse_year(request.GET, today)
+    cal = build_calendar(*period_range('year', date(year, 1, 1)), mode=COUNT)
+    return render(request, 'admin/sessions_year.html', {
+        'year': year,
+        'prev_year': year - 1,
+        'next_year': year + 1,
+        'calendar': cal,
+        'slots_by_day': cal.slots_by_day,
+        'today': today,
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def sessions_range(request):
+    """Занятия за произвольный диапазон: ?from=&to= или ?period=week|month|quarter|season|year&date=."""
+    today = timezone.localdate()
+    period = request.GET.get('period')
+    anchor = parse_date(request.GET.get('date'), today)
+    if period in PERIODS:
+        date_from, date_to = period_range(period, anchor)
+    else:
+        period = None
+        date_from = parse_date(request.GET.get('from'), today)
+        date_to = parse_date(request.GET.get('to'), date_from)
+        if date_to < date_from:
+            date_from, date_to = date_to, date_from
+        date_to = min(date_to, date_from + timedelta(days=MAX_RANGE_DAYS - 1))
+
+    cal = build_calendar(date_from, date_to)
+    return render(request, 'admin/sessions_range.html', {
+        'period': period,
+        'periods': PERIODS,
+        'anchor': anchor,
+        'calendar': cal,
+        'slots_by_day': cal.slots_by_day,
         'today': today,
     })
 
@@ -276,23 +240,19 @@ def session_create(request):
     if request.method == 'POST':
         form = TrainingSessionForm(request.POST)
         if form.is_valid():
-            session = form.save()
-            if form.cleaned_data.get('fill_month'):
-                start = session.start
-                duration = session.duration_minutes
-                notes = session.notes
-                participants = session.participants.all()
-                next_start = start + timedelta(days=7)
-                while next_start.month == start.month:
-                    new_session = TrainingSession.objects.create(
-                        start=next_start,
-                        duration_minutes=duration,
-                        notes=notes,
-                    )
-                    new_session.participants.set(participants)
-                    next_start += timedelta(days=7)
-            messages.success(request, 'Занятие создано')
-            return redirect('sessions_week')
+            try:
+                with transaction.atomic():
+                    session = form.save()
+                    if form.cleaned_data.get('fill_month'):
+                        series.fill_month(session)
+            except (SessionFull, IntegrityError):
+                form.add_error('participants', 'Нет свободных мест в занятии')
+            except ScheduleConflict as exc:
+                # занятие или серия на месяц пересеклись с расписанием — не создаём ничего
+                form.add_error(None, str(exc))
+            else:
+                messages.success(request, 'Занятие создано')
+                return redirect('sessions_week')
     else:
         form = TrainingSessionForm()
     return render(request, 'admin/sessions_week.html', {'form': form})
@@ -302,8 +262,19 @@ def session_create(request):
 def session_add_child(request, pk, child_id):
     session = get_object_or_404(TrainingSession, pk=pk)
     child = get_object_or_404(Child, pk=child_id)
-    session.participants.add(child)
-    messages.success(request, f'Добавлен {child} в занятие.')
+    try:
+        # проверка и добавление в одной транзакции: BEGIN IMMEDIATE берёт блокировку
+        # на запись сразу, и параллельный запрос не запишет ребёнка между ними;
+        # при отказе m2m add откатывается вместе с транзакцией
+        with transaction.atomic():
+            conflicts.check([((session.start, session.end), [child.pk])], exclude=[session.pk])
+            session.participants.add(child)
+    except ScheduleConflict as exc:
+        messages.error(request, str(exc))
+    except SessionFull:
+        messages.error(request, f'Нет свободных мест: {child} не добавлен.')
+    else:
+        messages.success(request, f'Добавлен {child} в занятие.')
     return redirect('sessions_week')
 
 
@@ -311,15 +282,23 @@ def session_add_child(request, pk, child_id):
 @user_passes_test(is_admin)
 def session_edit(request, pk):
     session = get_object_or_404(TrainingSession, pk=pk)
-    week_start = session.start.date() - timedelta(days=session.start.weekday())
+    local_start = timezone.localdate(session.start)
+    week_start = local_start - timedelta(days=local_start.weekday())
 
     if request.method == 'POST':
         form = TrainingSessionForm(request.POST, instance=session)
         form.fields.pop('fill_month', None)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Занятие обновлено')
-            return redirect(f"{reverse('sessions_week')}?start={week_start:%Y-%m-%d}")
+            try:
+                with transaction.atomic():
+                    form.save()
+            except (SessionFull, IntegrityError):
+                form.add_error('participants', 'Нет свободных мест в занятии')
+            except ScheduleConflict as exc:
+                form.add_error('participants', str(exc))
+            else:
+                messages.success(request, 'Занятие обновлено')
+                return redirect(f"{reverse('sessions_week')}?start={week_start:%Y-%m-%d}")
     else:
         form = TrainingSessionForm(instance=session)
         form.fields.pop('fill_month', None)
@@ -336,7 +315,7 @@ def session_edit(request, pk):
 @require_POST
 def session_delete(request, pk):
     session = get_object_or_404(TrainingSession, pk=pk)
-    start_date = session.start.date()
+    start_date = timezone.localdate(session.start)
     session.delete()
     week_start = start_date - timedelta(days=start_date.weekday())
     messages.success(request, 'Занятие удалено')
@@ -344,17 +323,126 @@ def session_delete(request, pk):
 
 @login_required
 @user_passes_test(is_admin)
-def children_list(request):
-    children = Child.objects.select_related('parent', 'account_user').order_by('first_name', 'last_name')
-    subs_qs = Subscription.objects.filter(child__in=children).select_related('sub_type', 'child')
-    subs = {s.child_id: s for s in subs_qs}
+@require_POST
+def sessions_copy_week(request):
+    """Копирует расписание недели на следующую."""
+    week_start = parse_date(request.POST.get('start'))
+    if week_start is None:
+        messages.error(request, 'Не указана неделя')
+        return redirect('sessions_week')
+    target = week_start + timedelta(days=7)
+    try:
+        created = series.copy_week(week_start, target)
+    except ScheduleConflict as exc:
+        messages.error(request, f'Неделя не скопирована. {exc}')
+        return redirect(f"{reverse('sessions_week')}?start={week_start:%Y-%m-%d}")
+    messages.success(request, f'Скопировано занятий: {len(created)}')
+    return redirect(f"{reverse('sessions_week')}?start={target:%Y-%m-%d}")
 
+@login_required
+@user_passes_test(is_admin)
+@require_POST
+def sessions_copy_month(request):
+    """Копирует расписание месяца на следующий с сохранением дней недели."""
+    year, month = parse_month(request.POST, timezone.localdate())
+    try:
+        created = series.copy_month(year, month)
+    except ScheduleConflict as exc:
+        messages.error(request, f'Месяц не скопирован. {exc}')
+        return redirect(f"{reverse('sessions_month')}?year={year}&month={month}")
+    target = neighbour_months(year, month)
+    messages.success(request, f'Скопировано занятий: {len(created)}')
+    return redirect(f"{reverse('sessions_month')}?year={target['next_year']}&month={target['next_month']}")
+
+@login_required
+@user_passes_test(is_admin)
+def session_attendance(request, pk):
+    """Отметка посещений всей группы занятия за один запрос."""
+    session = get_object_or_404(TrainingSession, pk=pk)
+    local_start = timezone.localdate(session.start)
+    week_start = local_start - timedelta(days=local_start.weekday())
+    if request.method == 'POST':
+        form = AttendanceForm(request.POST, session=session)
+        if not form.is_valid():
+            return HttpResponseBadRequest('Неверный список учеников.')
+        results = mark_attendance(session, form.cleaned_data['child_ids'])
+        marked = sum(1 for r in results if r.ok)
+        messages.success(request, f'Зачтено посещений: {marked} из {len(results)}')
+        for r in results:
+            if not r.ok:
+                messages.warning(request, f'{r.child}: {r.label}')
+        # после POST — redirect: обновление страницы не отправит форму ещё раз
+        return redirect('session_attendance', pk=session.pk)
+    visits = LedgerEntry.objects.filter(kind=LedgerEntry.VISIT, session=session,
+                                        subscription__child_id=OuterRef('pk'))
+    participants = (session.participants
+                    .select_related('subscription')
+                    .only('id', 'first_name', 'last_name', 'subscription__lessons_remaining',
+                          'subscription__paid', 'subscription__child_id')
+                    .annotate(visited=Exists(visits)))
+    return render(request, 'admin/session_attendance.html', {
+        'session': session,
+        'participants': participants,
+        'week_start': week_start,
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def children_list(request):
+    """Ученики с сортировкой, фильтрами и keyset-пагинацией на стороне сервера."""
+    sort = request.GET.get('sort', 'name')
+    if sort not in CHILDREN_SORTS:
+        sort = 'name'
+    descending = request.GET.get('dir') == 'desc'
+    ordering = [f'-{f}' if descending else f for f in CHILDREN_SORTS[sort]]
+
+    children = (Child.objects
+                .select_related('parent', 'account_user', 'subscription__sub_type')
+                .annotate(balance=Coalesce('subscription__lessons_remaining', Value(-1)),
+                          is_paid=Coalesce('subscription__paid', Value(False))))
+    filters = {
+        'status': request.GET.get('status', ''),
+        'type': request.GET.get('type', ''),
+        'q': request.GET.get('q', '').strip(),
+    }
+    if filters['status'] == 'unpaid':
+        children = children.filter(subscription__paid=False)
+    elif filters['status'] == 'zero':
+        children = children.filter(subscription__lessons_remaining=0)
+    if filters['type'] in ('adult', 'child'):
+        children = children.filter(is_adult=filters['type'] == 'adult')
+    children = search.filter_children(children, filters['q'])
+
+    page = paginate_keyset(children, ordering, CHILDREN_PAGE_SIZE,
+                           after=request.GET.get('after'), before=request.GET.get('before'))
+
+    params = {k: v for k, v in filters.items() if v}
     return render(request, 'admin/children_list.html', {
-        'children': children,
-        'subs': subs,
+        'children': page,
+        'page': page,
+        'sort': sort,
+        'dir': 'desc' if descending else 'asc',
+        'filters': filters,
+        'query': urlencode({**params, 'sort': sort, 'dir': 'desc' if descending else 'asc'}),
+        'filter_query': urlencode(params),
         'add_visit_form': AddVisitForm(),
     })
 
+@login_required
+@user_passes_test(is_admin)
+def children_search(request):
+    """Быстрый поиск учеников по имени, заметкам и аккаунту: JSON по релевантности."""
+    try:
+        limit = min(int(request.GET.get('limit', CHILDREN_SEARCH_LIMIT)), CHILDREN_SEARCH_LIMIT)
+    except ValueError:
+        limit = CHILDREN_SEARCH_LIMIT
+    results = [
+        {'id': child_id, 'name': name, 'account': account,
+         'url': reverse('child_detail', args=[child_id])}
+        for child_id, name, account in search.search(request.GET.get('q', ''), limit=max(limit, 1))
+    ]
+    return JsonResponse({'results': results})
+
 @login_required
 @user_passes_test(is_admin)
 def child_create(request):
@@ -369,11 +457,106 @@ def child_create(request):
         form = StudentForm()
     return render(request, 'admin/child_create.html', {'form': form})
 
+@login_required
+@user_passes_test(is_admin)
+def students_import(request):
+    """Загрузка CSV с родителями и учениками; файл сначала проверяется целиком."""
+    errors = None
+    if request.method == 'POST':
+        form = StudentImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            dry_run = form.cleaned_data['dry_run']
+            try:
+                result = imports.import_rows(imports.read_rows(form.cleaned_data['file'].read()), dry_run=dry_run)
+            except UnicodeDecodeError:
+                messages.error(request, 'Файл должен быть в кодировке UTF-8')
+            except imports.ImportValidationError as exc:
+                errors = exc.errors
+                messages.error(request, f'{exc}. Ничего не импортировано.')
+            else:
+                if dry_run:
+                    messages.success(request, f'Файл проверен, ошибок нет. {result}')
+                else:
+                    messages.success(request, f'Импорт завершён. {result}')
+                    return redirect('children_list')
+    else:
+        form = StudentImportForm()
+    return render(request, 'admin/students_import.html', {
+        'form': form,
+        'errors': errors,
+        'columns': imports.COLUMNS,
+    })
+
 @login_required
 @user_passes_test(is_admin)
 def subscriptions_list(request):
-    subs = Subscription.objects.select_related('child', 'child__parent', 'sub_type').all()
-    return render(request, 'admin/subscriptions_list.html', {'subs': subs})
+    """Абонементы по именам учеников, keyset-страницами по SUBSCRIPTIONS_PAGE_SIZE."""
+    subs = Subscription.objects.select_related('child', 'sub_type')
+    page = paginate_keyset(subs, ('child__first_name', 'child__last_name', 'id'), SUBSCRIPTIONS_PAGE_SIZE,
+                           after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'admin/subscriptions_list.html', {'subs': page, 'page': page})
+
+@login_required
+@user_passes_test(is_admin)
+def export_data(request, name, fmt):
+    """Потоковая выгрузка в CSV/XLSX; для посещений — диапазон ?from=&to=."""
+    export = exports.EXPORTS.get(name)
+    if export is None or fmt not in exports.FORMATS:
+        raise Http404
+    date_from = parse_date(request.GET.get('from'))
+    date_to = parse_date(request.GET.get('to'), date_from)
+    if date_from is None:
+        date_to = None
+    elif date_to < date_from:
+        date_from, date_to = date_to, date_from
+    response = StreamingHttpResponse(exports.stream(export, fmt, date_from, date_to),
+                                     content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(export, fmt, date_from, date_to)}"'
+    return response
+
+@login_required
+@user_passes_test(is_admin)
+def analytics_dashboard(request):
+    """Заполненность слотов и посещаемость учеников за период — только из сводок core.analytics."""
+    today = timezone.localdate()
+    period = request.GET.get('period')
+    if period not in PERIODS:
+        period = 'season'
+    anchor = parse_date(request.GET.get('date'), today)
+    date_from, date_to = period_range(period, anchor)
+    months, children, page = analytics.children_by_month(
+        date_from, date_to, ANALYTICS_CHILDREN_PAGE_SIZE,
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'admin/analytics.html', {
+        'period': period,
+        'anchor': anchor,
+        'date_from': date_from,
+        'date_to': date_to,
+        'prev_date': date_from - timedelta(days=1),
+        'next_date': date_to + timedelta(days=1),
+        'heatmap': analytics.occupancy_heatmap(date_from, date_to),
+        'months': months,
+        'children': children,
+        'page': page,
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def finance_dashboard(request):
+    """Выручка за год по месяцам и типам абонементов — только из сводки RevenueRollup."""
+    today = timezone.localdate()
+    year = parse_year(request.GET, today)
+    rows, month_totals, total = revenue.year_report(year)
+    return render(request, 'admin/finance.html', {
+        'year': year,
+        'prev_year': year - 1,
+        'next_year': year + 1,
+        'months': [date(year, m, 1) for m in range(1, 13)],
+        'rows': rows,
+        'month_totals': month_totals,
+        'total': total,
+        'recent_payments': Payment.objects.select_related('sub_type', 'subscription__child')[:FINANCE_RECENT_PAYMENTS],
+    })
 
 @login_required
 @user_passes_test(is_admin)
@@ -417,54 +600,45 @@ def parent_create(request):
     else:
         form = ParentCreateForm()
 
-    # Получаем список всех родителей
-    try:
-        parent_group = Group.objects.get(name='Parent')
-        parents = User.objects.filter(groups=parent_group).order_by('username')
-    except Group.DoesNotExist:
-        parents = User.objects.none()
-
     return render(request, 'admin/parent_create.html', {
         'form': form,
-        'parents': parents,  # Передаем актуальный список родителей в контекст
+        **_parents_directory(request),
     })
-    # if request.method == 'POST':
-    #     form = ParentCreateForm(request.POST)
-    #     if form.is_valid():
-    #         first_name = form.cleaned_data['first_name']
-    #         last_name = form.cleaned_data['last_name']
-    #         username = form.cleaned_data['username']
-    #         email = form.cleaned_data['email']
-    #         password = form.cleaned_data['password']
-    #         if User.objects.filter(username=username).exists():
-    #             messages.error(request, 'Логин уже существует')
-    #         else:
-    #             user = User.objects.create_user(username=username, email=email, password=password)
-    #             user.first_name = first_name
-    #             user.last_name = last_name
-    #             group, _ = Group.objects.get_or_create(name='Parent')
-    #             user.groups.add(group)
-    #             user.is_staff = False
-    #             user.save()
-    #             messages.success(request, 'Родитель создан')
-    #             return redirect('parent_create')
-    # else:
-    #     form = ParentCreateForm()
-
-    # Список родителей (только из группы Parent) + дети
-    # try:
-    #     parent_group = Group.objects.get(name='Parent')
-    #     parents = (User.objects.filter(groups=parent_group)
-    #                .prefetch_related(Prefetch('children', queryset=Child.objects.order_by('first_name')))
-    #                .annotate(children_count=Count('children'))
-    #                .order_by('username'))
-    # except Group.DoesNotExist:
-    #     parents = User.objects.none()
-
-    # return render(request, 'admin/parent_create.html', {
-    #     'form': form,
-    #     'parents': parents,
-    # })
+
+@login_required
+@user_passes_test(is_admin)
+def parents_list(request):
+    """Справочник родителей: поиск по имени/логину/почте, дети и их число."""
+    return render(request, 'admin/parents_list.html', _parents_directory(request))
+
+def _parents_directory(request):
+    """Страница родителей: число детей — annotate, сами дети — один Prefetch.
+
+    Итого два запроса на страницу (родители и их дети) при любом размере.
+    """
+    query = request.GET.get('q', '').strip()
+    parents = (User.objects
+               .filter(groups__name='Parent')
+               .annotate(children_count=Count('children'))
+               .prefetch_related(Prefetch(
+                   'children',
+                   queryset=Child.objects.order_by('first_name', 'last_name', 'id')
+                                         .only('id', 'first_name', 'last_name', 'gender', 'parent_id'),
+                   to_attr='children_list',
+               )))
+    if query:
+        parents = parents.filter(
+            Q(username__icontains=query) | Q(email__icontains=query)
+            | Q(first_name__icontains=query) | Q(last_name__icontains=query)
+        )
+    page = paginate_keyset(parents, ('username', 'id'), PARENTS_PAGE_SIZE,
+                           after=request.GET.get('after'), before=request.GET.get('before'))
+    return {
+        'parents': page,
+        'page': page,
+        'parents_query': query,
+        'parents_filter': urlencode({'q': query}) if query else '',
+    }
 
 @login_required
 @user_passes_test(is_admin)
@@ -498,93 +672,116 @@ def mark_payment(request):
 # --- родитель ---
 
 @login_required
+@conditional_page(versions.schedule_month_version)
 def schedule_month(request):
     """Календарь на месяц со всеми занятиями для родителей и взрослых учеников."""
-    if is_admin(request.user):
+    if request.roles.is_admin:
         return redirect('sessions_month')
 
     today = timezone.localdate()
-    try:
-        year = int(request.GET.get('year', today.year))
-        month = int(request.GET.get('month', today.month))
-    except (TypeError, ValueError):
-        year, month = today.year, today.month
-
-    while month < 1:
-        year -= 1
-        month += 12
-    while month > 12:
-        year += 1
-        month -= 12
-
-    first_day = date(year, month, 1)
-    _, days_in_month = monthrange(year, month)
-    days = [first_day + timedelta(days=i) for i in range(days_in_month)]
-
-    sessions = (TrainingSession.objects
-                .filter(start__year=year, start__month=month)
-                .prefetch_related('participants'))
-    slots_by_day = _group_timeslots(sessions)
-
-    if month == 1:
-        prev_year, prev_month = year - 1, 12
-    else:
-        prev_year, prev_month = year, month - 1
-    if month == 12:
-        next_year, next_month = year + 1, 1
-    else:
-        next_year, next_month = year, month + 1
-
-    weeks = []
-    week = [None] * first_day.weekday()
-    for day in days:
-        week.append(day)
-        if len(week) == 7:
-            weeks.append(week)
-            week = []
-    if week:
-        week += [None] * (7 - len(week))
-        weeks.append(week)
+    year, month = parse_month(request.GET, today)
+    cal = build_calendar(*month_range(year, month))
 
     context = {
-        'days': days,
+        'days': cal.days,
         'month': month,
         'year': year,
-        'prev_year': prev_year,
-        'prev_month': prev_month,
-        'next_year': next_year,
-        'next_month': next_month,
-        'slots_by_day': slots_by_day,
-        'weeks': weeks,
+        **neighbour_months(year, month),
+        'slots_by_day': cal.slots_by_day,
+        'weeks': cal.weeks,
         'today': today,
     }
     return render(request, 'parent/schedule_month.html', context)
 
+def my_schedule_window(after, before):
+    """Начало окна «ближайшие занятия» и курсор истории; без окна (листается курсор) — (None, None)."""
+    sessions = TrainingSession.objects.all()
+    if any(cursor_values(sessions, ('start', 'id'), cursor) is not None for cursor in (after, before)):
+        return None, None
+    today = timezone.localdate()
+    window_start = timezone.make_aware(
+        datetime.combine(today - timedelta(weeks=MY_SCHEDULE_HISTORY_WEEKS), time.min))
+    # всё, что раньше окна, — история
+    return window_start, encode_cursor([window_start, 0])
+
 @login_required
+@conditional_page(versions.my_schedule_version)
 def my_schedule(request):
+    """Занятия своих детей (или взрослого ученика): ближайшие и последние недели.
+
+    По умолчанию показываются занятия начиная с MY_SCHEDULE_HISTORY_WEEKS недель
+    назад; более ранние листаются keyset-курсором. Участники подгружаются
+    одним Prefetch и только свои, поэтому число запросов не зависит ни от
+    размера страницы, ни от возраста аккаунта.
+    """
     # Админа отправим в дашборд
-    if is_admin(request.user):
+    if request.roles.is_admin:
         return redirect('admin_dashboard')
 
-    if is_parent(request.user):
+    if request.roles.is_parent:
         children_ids = list(request.user.children.values_list('id', flat=True))
-        sessions = (TrainingSession.objects
-                    .filter(participants__in=children_ids)
-                    .distinct().order_by('start'))
-        return render(request, 'parent/my_schedule.html', {
-            'sessions': sessions,
-            'show_children': True,
-        })
-    # студент-взрослый
-    student = getattr(request.user, 'student_profile', None)
-    if not student:
-        return HttpResponseForbidden('Нет доступа.')
-    sessions = TrainingSession.objects.filter(participants=student).distinct().order_by('start')
+        show_children = True
+    else:
+        # студент-взрослый
+        student = getattr(request.user, 'student_profile', None)
+        if not student:
+            return HttpResponseForbidden('Нет доступа.')
+        children_ids = [student.id]
+        show_children = False
+
+    attended = TrainingSession.participants.through.objects.filter(
+        trainingsession=OuterRef('pk'), child_id__in=children_ids,
+    )
+    sessions = (TrainingSession.objects
+                .filter(Exists(attended))
+                .prefetch_related(Prefetch(
+                    'participants',
+                    queryset=Child.objects.filter(id__in=children_ids).only('id', 'first_name', 'parent_id'),
+                    to_attr='own_children',
+                )))
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    window_start, window_cursor = my_schedule_window(after, before)
+    if window_start is not None:
+        sessions = sessions.filter(start__gte=window_start)
+    page = paginate_keyset(sessions, ('start', 'id'), MY_SCHEDULE_PAGE_SIZE, after=after, before=before)
+    if window_cursor is not None:
+        page.prev_cursor = window_cursor
+
     return render(request, 'parent/my_schedule.html', {
-        'sessions': sessions,
-        'show_children': False,
+        'sessions': page,
+        'page': page,
+        'history_weeks': MY_SCHEDULE_HISTORY_WEEKS,
+        'in_window': window_start is not None,
+        'show_children': show_children,
+        'ical_url': request.build_absolute_uri(
+            reverse('ical_feed', args=[request.user.pk, ical.feed_token(request.user)])),
     })
 
+def ical_feed(request, user_id, token):
+    """Лента .ics для календарных приложений; доступ по токену из ссылки, без входа."""
+    user = get_object_or_404(User, pk=user_id, is_active=True)
+    roles = get_roles(user)
+    if not ical.check_feed_token(user, token) or not (roles.is_parent or roles.is_student):
+        raise Http404
+    children = versions.own_children(user, roles)
+    today = timezone.localdate()
+    digest = hashlib.md5(f'{versions.schedule_version(children)}|{today}'.encode()).hexdigest()
+    etag = quote_etag(digest)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = ical.cache_key(user.pk, digest)
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=ICAL_CONTENT_TYPE)
+        else:
+            chunks = ical.iter_feed(list(children.values_list('id', flat=True)), ical.window_start(today))
+            response = StreamingHttpResponse(ical.cached_stream(chunks, key), content_type=ICAL_CONTENT_TYPE)
+        response['Content-Disposition'] = 'inline; filename="littlejohn.ics"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=ICAL_MAX_AGE)
+    return response
+
 @login_required
 @user_passes_test(is_student)
 def my_subscription(request):
@@ -606,6 +803,7 @@ def my_subscription(request):
 
 @login_required
 @user_passes_test(is_parent)
+@conditional_page(versions.my_children_version)
 def my_children(request):
     children = request.user.children.select_related().all()
     subs = {s.child_id: s for s in Subscription.objects.filter(child__in=children).select_related('sub_type')}
@@ -620,10 +818,12 @@ def child_detail(request, pk):
     )
     sub = getattr(child, 'subscription', None)
     sessions = (child.sessions.all().order_by('-start'))  # последние сверху
+    ledger = sub.ledger.select_related('session')[:LEDGER_HISTORY_SIZE] if sub else []
     return render(request, 'admin/child_detail.html', {
         'child': child,
         'sub': sub,
         'sessions': sessions,
+        'ledger': ledger,
     })
 
 @login_required
@@ -633,10 +833,8 @@ def child_sessions_delete(request, pk):
     if request.method == 'POST':
         ids = request.POST.getlist('session_ids')
         if ids:
-            sessions = TrainingSession.objects.filter(id__in=ids, participants=child)
-            for session in sessions:
-                session.participants.remove(child)
-            messages.success(request, f'Удалено занятий: {sessions.count()}')
+            removed = series.remove_child_from_sessions(child, ids)
+            messages.success(request, f'Удалено занятий: {removed}')
         else:
             messages.error(request, 'Не выбрано ни одного занятия.')
     return redirect('child_detail', pk=pk)
@@ -668,19 +866,16 @@ def issue_subscription(request, pk):
             price = form.cleaned_data['price'] or sub_type.price
             mark_paid = form.cleaned_data['mark_paid']
 
-            # создаём или обновляем
-            sub, _created = Subscription.objects.update_or_create(
-                child=child,
-                defaults={
-                    'sub_type': sub_type,
-                    'lessons_remaining': sub_type.lessons_count if mark_paid else 0,
-                    'price': price,
-                    'paid': bool(mark_paid),
-                }
-            )
-            if mark_paid and sub.lessons_remaining == 0:
-                sub.lessons_remaining = sub.sub_type.lessons_count
-                sub.save()
+            # создаём или обновляем; изменение остатка попадёт в журнал
+            sub = Subscription.objects.filter(child=child).first() or Subscription(child=child)
+            sub.sub_type = sub_type
+            sub.lessons_remaining = sub_type.lessons_count if mark_paid else 0
+            sub.price = price
+            sub.paid = bool(mark_paid)
+            with transaction.atomic():
+                sub.save(ledger_kind=LedgerEntry.TOPUP if mark_paid else None)
+                if mark_paid:
+                    Payment.objects.record(sub, price, sub_type=sub_type)
 
             messages.success(request, 'Абонемент выдан/обновлён')
             return redirect('children_list')
@@ -708,7 +903,10 @@ def subscription_edit(request, pk):
             else:
                 if sub.lessons_remaining > sub.sub_type.lessons_count:
                     sub.lessons_remaining = sub.sub_type.lessons_count
-            sub.save()
+            with transaction.atomic():
+                sub.save(ledger_kind=LedgerEntry.TOPUP if form.cleaned_data['mark_paid'] else None)
+                if form.cleaned_data['mark_paid']:
+                    Payment.objects.record(sub, sub.price)
             messages.success(request, 'Абонемент обновлён')
             return redirect('children_list')
     else:
@@ -741,39 +939,3 @@ def parent_delete(request, user_id):
     parent.delete()
     messages.success(request, f'Родитель «{username}» и его дети удалены.')
     return redirect('parent_create')
-
-def _group_timeslots(sessions_qs):
-    """
-    На вход: queryset TrainingSession с prefetch_related('participants') и order_by('start').
-    На выход: dict {date: [ {start, end, participants(list), session_ids(list)}... ]}
-    Группирует карточки по (start, end), объединяя участников.
-    """
-    slots_by_day = defaultdict(lambda: OrderedDict())
-    for s in sessions_qs:
-        start = timezone.localtime(s.start)
-        end = timezone.localtime(s.end)
-        day = start.date()
-        key = (start, end)
-        if key not in slots_by_day[day]:
-            slots_by_day[day][key] = {
-                'start': start,
-                'end': end,
-                'participants': {},
-                'session_ids': [s.id],
-            }
-        else:
-            slots_by_day[day][key]['session_ids'].append(s.id)
-
-        # набираем участников без дублей
-        for p in s.participants.all():
-            slots_by_day[day][key]['participants'][p.id] = p
-
-    # превращаем dict участников в список
-    out = {}
-    for day, od in slots_by_day.items():
-        items = []
-        for slot in od.values():
-            slot['participants'] = list(slot['participants'].values())
-            items.append(slot)
-        out[day] = items
-    return out